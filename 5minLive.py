@@ -13,6 +13,9 @@ from datetime import datetime, timedelta
 from kiteconnect import KiteConnect
 import numpy as np
 
+from history_cache import HistoryCache
+import benchmark_series
+
 import os
 from dotenv import load_dotenv
 
@@ -32,6 +35,7 @@ STOP_EVENT = None      # To be set by start_polling
 
 NIFTY_TOKEN = 256265  # NIFTY 50 index token
 NIFTY_SYMBOL = "NIFTY 50"
+NIFTY_SERIES = benchmark_series.get_series("NIFTY")  # shared, updated incrementally
 
 # Rate Limit Config
 REQUEST_DELAY = 0.5    # Seconds between API calls (Conservatively safe)
@@ -84,6 +88,11 @@ def calculate_quantity(entry, stop):
 phase3_live = importlib.import_module("phase-3-live")
 on_new_5m_candle = phase3_live.on_new_5m_candle
 
+# Warm-start: snapshot phase-3 state after every polling cycle so a restart
+# only needs to fetch the gap since the last snapshot instead of 7 days.
+SNAPSHOT_FILE = phase3_live.SNAPSHOT_FILE
+SNAPSHOT_EVERY_N_CYCLES = 1
+
 # ==============================
 # KITE API CLIENT
 # ==============================
@@ -109,15 +118,22 @@ def init_kite():
 # DATA FETCHING
 # ==============================
 
+# Closed sessions are immutable → serve them from disk, only hit Kite for today
+HISTORY_CACHE = HistoryCache()
+
+def _kite_historical(token, from_date, to_date, interval):
+    """Raw Kite call (raises on error so failures are never cached)."""
+    return kite.historical_data(
+        instrument_token=token,
+        from_date=from_date,
+        to_date=to_date,
+        interval=interval
+    )
+
 def fetch_history(token, from_date, to_date):
-    """Fetches historical 5-minute candles."""
+    """Fetches historical 5-minute candles (read-through disk cache)."""
     try:
-        data = kite.historical_data(
-            instrument_token=token,
-            from_date=from_date,
-            to_date=to_date,
-            interval="5minute"
-        )
+        data = HISTORY_CACHE.fetch(_kite_historical, token, from_date, to_date, interval="5minute")
         return data  # List of dicts
     except Exception as e:
         print(f"⚠️ API Error fetching history for {token}: {e}")
@@ -171,16 +187,27 @@ def perform_backfill(candidates):
         print("ℹ️ Pre-market: No backfill needed.")
         return
 
-    # 1. Backfill NIFTY (Create Time -> Close Map)
+    # 0. Warm start: restore snapshot, then only fetch the gap per symbol
+    last_seen = phase3_live.load_snapshot(SNAPSHOT_FILE)
+    from_dates = {
+        c["symbol"]: max(last_seen[c["symbol"]], market_open) if c["symbol"] in last_seen else market_open
+        for c in candidates
+    }
+    if last_seen:
+        gap_start = min(from_dates.values()) if from_dates else now
+        print(f"   ↳ Warm start from snapshot (gap since {gap_start.strftime('%Y-%m-%d %H:%M')})")
+
+    # 1. Backfill NIFTY into the shared benchmark series
     print("   ↳ Backfilling NIFTY 50...")
-    nifty_data = fetch_history(NIFTY_TOKEN, market_open, now)
+    nifty_from = min(from_dates.values()) if from_dates else market_open
+    nifty_data = fetch_history(NIFTY_TOKEN, nifty_from, now)
     
-    nifty_map = {} # timestamp -> close
-    for candle in nifty_data:
-        dt = pd_timestamp_to_dt(candle["date"])
-        nifty_map[dt] = candle["close"]
-        
-    if not nifty_map:
+    if nifty_data:
+        NIFTY_SERIES.extend(
+            [pd_timestamp_to_dt(candle["date"]) for candle in nifty_data],
+            [candle["close"] for candle in nifty_data]
+        )
+    else:
         print("⚠️ Warning: Could not fetch NIFTY backfill data.")
     
     # 2. Backfill Candidates
@@ -189,17 +216,21 @@ def perform_backfill(candidates):
         token = c["instrument_token"]
         print(f"   ↳ Backfilling {symbol}...")
         
-        hist_data = fetch_history(token, market_open, now)
+        hist_data = fetch_history(token, from_dates[symbol], now)
+        restored_until = last_seen.get(symbol)
+        
+        # As-of aligned NIFTY close for every candle in one vectorized lookup
+        # (last index bar at or before the candle, within tolerance)
+        candle_times = [pd_timestamp_to_dt(candle["date"]) for candle in hist_data]
+        nifty_closes = NIFTY_SERIES.asof(candle_times) if candle_times else []
         
         count = 0
-        for candle in hist_data:
-            dt = pd_timestamp_to_dt(candle["date"])
+        for candle, dt, nifty_close in zip(hist_data, candle_times, nifty_closes):
+            # Already in the restored bars ring
+            if restored_until is not None and dt <= restored_until:
+                continue
             
-            # Find matching nifty close (or closest previous?)
-            # NIFTY 5m candles match timestamp exactly usually.
-            nifty_close = nifty_map.get(dt)
-            
-            if nifty_close is not None:
+            if not np.isnan(nifty_close):
                 # Format for Phase 3
                 c_data = {
                     "Datetime": dt,
@@ -214,7 +245,7 @@ def perform_backfill(candidates):
                 signals = on_new_5m_candle(
                     symbol=symbol,
                     candle=c_data,
-                    nifty_close=nifty_close,
+                    nifty_close=float(nifty_close),
                     is_backfill=True
                 )
                 
@@ -239,6 +270,8 @@ def perform_backfill(candidates):
                 
         print(f"     ✅ Replayed {count} candles for {symbol}")
 
+    phase3_live.save_snapshot(SNAPSHOT_FILE)
+    HISTORY_CACHE.print_report()
     print("✅ Backfill Complete. Indicators Warmed Up.")
 
 # ==============================
@@ -287,6 +320,7 @@ def start_polling(candidate_list, signal_queue, stop_event):
 
     print("🚀 Polling Engine Started. Waiting for next candle close...")
     
+    cycles = 0
     while not STOP_EVENT.is_set():
         wait_seconds, target_time = get_seconds_to_next_tick()
         
@@ -311,7 +345,7 @@ def start_polling(candidate_list, signal_queue, stop_event):
             print("⚠️ Skipping cycle: NIFTY data unavailable")
             continue
             
-        nifty_close = nifty_candle["Close"]
+        NIFTY_SERIES.update(nifty_candle["Datetime"], nifty_candle["Close"])
         
         # 2. Iterate Candidates
         for token, symbol in TOKEN_MAP.items():
@@ -319,6 +353,11 @@ def start_polling(candidate_list, signal_queue, stop_event):
             
             candle = fetch_latest_candle(token, symbol)
             if candle:
+                # Align on the candle's own timestamp; fall back to latest
+                nifty_close = NIFTY_SERIES.asof_one(candle["Datetime"])
+                if nifty_close is None:
+                    nifty_close = NIFTY_SERIES.latest_close()
+                
                 # Phase 3 handles de-duplication
                 signals = on_new_5m_candle(
                     symbol=symbol,
@@ -342,6 +381,11 @@ def start_polling(candidate_list, signal_queue, stop_event):
             
             time.sleep(REQUEST_DELAY) # Rate limit
             
+        cycles += 1
+        if cycles % SNAPSHOT_EVERY_N_CYCLES == 0:
+            phase3_live.save_snapshot(SNAPSHOT_FILE)
+            
         print("✅ Cycle Complete.")
         
+    phase3_live.save_snapshot(SNAPSHOT_FILE)
     print("🛑 Polling Engine Stopped.")
@@ -4,24 +4,40 @@ TRADING DASHBOARD API SERVER
 Flask REST API that bridges Python trading backends with web frontend.
 Provides endpoints for:
 - Live portfolio data (positions, P&L, orders)
-- Backtesting results (from Excel files)
+- Backtesting results (from Excel files, parsed once per file version
+  and served from memory — see result_cache)
+- Server-side paging for trade logs / phase results: ?limit=&offset=
+  (or &cursor=), &columns=a,b, &sort=[-]col, &symbol=, &mode=,
+  &exit_reason=, &date_from=, &date_to= (YYYY-MM-DD)
 - System status and logs
-- Real-time WebSocket updates
+- Real-time WebSocket updates: one shared portfolio poller, diffs
+  pushed to the 'portfolio' room (see portfolio_feed)
 """
 
 from flask import Flask, jsonify, request, send_from_directory, send_file
 from flask_cors import CORS
-from flask_socketio import SocketIO, emit
+from flask_socketio import SocketIO, emit, join_room, leave_room
 import pandas as pd
 import os
 import glob
 import time
 from datetime import datetime, time as dtime
 import json
+import base64
 import subprocess
 import config_manager
+import risk_engine
+import result_cache
+import portfolio_feed
+from quote_cache import QuoteCache, kite_ltp_fetcher
 import requests
 
+try:
+    from kiteconnect import KiteConnect
+    HAVE_KITE = True
+except ImportError:
+    HAVE_KITE = False
+
 app = Flask(__name__, static_folder='frontend/dist', static_url_path='')
 CORS(app)
 socketio = SocketIO(app, cors_allowed_origins="*")
@@ -99,6 +115,9 @@ PHASE3_FILE = "phase-3results/Phase3_results.xlsx"
 PHASE4_DIR = "phase-4results"
 LIVE_ANALYSIS_DIR = "live_analysis"
 
+# Parsed result workbooks keyed by (path, mtime, size), shared by all endpoints
+RESULTS = result_cache.ResultCache()
+
 # ===============================
 # HELPER FUNCTIONS
 # ===============================
@@ -113,6 +132,15 @@ def get_latest_backtest_file():
     files.sort(key=os.path.getmtime, reverse=True)
     return files[0]
 
+def _safe_phase4_path(filename):
+    """Path of a result file inside PHASE4_DIR; QueryError for names that leave it"""
+    filepath = os.path.join(PHASE4_DIR, filename)
+    inside = os.path.dirname(os.path.realpath(filepath)) == os.path.realpath(PHASE4_DIR)
+    if '..' in filename or os.sep in filename or not inside:
+        raise result_cache.QueryError('Invalid filename')
+    # Same spelling as get_latest_backtest_file() → same RESULTS cache key
+    return filepath
+
 def read_excel_safely(filepath, sheet_name=None):
     """Safely read Excel file and return as dict"""
     try:
@@ -128,6 +156,75 @@ def read_excel_safely(filepath, sheet_name=None):
         print(f"Error reading Excel file {filepath}: {e}")
         return None
 
+def _timestamp(wb):
+    return datetime.fromtimestamp(wb.mtime).strftime('%Y-%m-%d %H:%M:%S')
+
+def _stringify(df, keys, fmt):
+    """Copy of df with Timestamps → fmt, other non-null values → str, in the given columns"""
+    df = df.copy()
+    for key in keys:
+        if key in df.columns:
+            values = [v.strftime(fmt) if isinstance(v, pd.Timestamp) else (str(v) if pd.notna(v) else v)
+                      for v in df[key].tolist()]
+            df[key] = pd.Series(values, index=df.index, dtype=object)
+    return df
+
+def _table(wb, key, build_df):
+    """ColumnarTable of a prepared sheet, once per workbook version"""
+    return wb.view(key, lambda: result_cache.ColumnarTable(build_df()))
+
+def _all_rows(wb, key, table):
+    """Every row of a table as records (the unpaged response)"""
+    return wb.view(key, lambda: table.page(table.select()))
+
+def trade_log_table(wb):
+    return _table(wb, 'trades_table', lambda: _stringify(
+        wb.sheet('Trade Log'), ['Date', 'EntryTime', 'ExitTime'], '%Y-%m-%d %H:%M:%S'))
+
+def latest_trades_table(wb):
+    def build():
+        trades_df = wb.sheet('Trade Log').copy()
+        # Sanitize timestamps for JSON
+        for col in ['Date', 'EntryTime', 'ExitTime']:
+            if col in trades_df.columns:
+                trades_df[col] = trades_df[col].astype(str).replace('NaT', '')
+        return trades_df.fillna('')
+    return _table(wb, 'latest_trades_table', build)
+
+def latest_backtest_view(wb):
+    """Response body of /api/backtest/latest (built once per workbook version)"""
+    print(f"Reading backtest file: {wb.path}")
+    response = {
+        'filename': wb.filename,
+        'timestamp': _timestamp(wb)
+    }
+
+    # Read Performance
+    if wb.has_sheet('Performance'):
+        perf_df = wb.sheet('Performance')
+        metrics = {}
+        for metric, value in zip(perf_df.get('Metric', pd.Series('', index=perf_df.index)),
+                                 perf_df.get('Value', pd.Series('', index=perf_df.index))):
+            # Ensure key is string to avoid comparison errors during JSON sorting
+            if pd.isna(metric): continue
+            # Handle NaN values
+            metrics[str(metric)] = "" if pd.isna(value) else value
+
+        response['metrics'] = metrics
+        # Keep original structure for some components
+        response['Performance'] = perf_df.fillna('').to_dict(orient='records')
+
+    # Read Daily Summary
+    if wb.has_sheet('Daily Summary'):
+        response['daily_summary'] = wb.sheet('Daily Summary').fillna('').to_dict(orient='records')
+
+    # Read Trade Log
+    if wb.has_sheet('Trade Log'):
+        response['trades'] = _all_rows(wb, 'latest_trades', latest_trades_table(wb))
+        response['Trade Log'] = response['trades'] # Alias
+
+    return response
+
 def get_paper_trading_portfolio():
     """Get current portfolio from Paper Trading API"""
     try:
@@ -138,6 +235,27 @@ def get_paper_trading_portfolio():
         print(f"Error fetching portfolio: {e}")
         return None
 
+def get_quote_cache():
+    """Shared Kite LTP cache for the dashboard (API_KEY / ACCESS_TOKEN env), or None"""
+    api_key, access_token = os.getenv("API_KEY"), os.getenv("ACCESS_TOKEN")
+    if not HAVE_KITE or not api_key or not access_token:
+        return None
+    kite = KiteConnect(api_key=api_key)
+    kite.set_access_token(access_token)
+    return QuoteCache(kite_ltp_fetcher(kite))
+
+PORTFOLIO_ROOM = 'portfolio'
+
+# Live prices for open positions (one LTP poller, started with the feed)
+QUOTES = get_quote_cache()
+
+# One upstream poller for every client; REST reads share its snapshot
+PORTFOLIO = portfolio_feed.PortfolioFeed(
+    get_paper_trading_portfolio,
+    emit=lambda event, data: socketio.emit(event, data, to=PORTFOLIO_ROOM),
+    quotes=QUOTES,
+)
+
 def get_latest_file_by_pattern(directory, pattern):
     """Generic function to get the most recent file matching a pattern"""
     full_pattern = os.path.join(directory, pattern)
@@ -169,6 +287,68 @@ def get_latest_phase_file(phase_num):
     # For timestamped files, get the latest
     return get_latest_file_by_pattern(directory, pattern)
 
+# ===============================
+# PAGINATION (served from result_cache.ColumnarTable)
+# ===============================
+
+PAGE_SIZE = 500
+MAX_PAGE_SIZE = 5000
+PAGE_PARAMS = ('limit', 'offset', 'cursor', 'columns', 'sort',
+               'symbol', 'mode', 'exit_reason', 'date_from', 'date_to')
+
+def wants_page():
+    """Any paging / projection / filter parameter → paged response (else the full table as before)"""
+    return any(p in request.args for p in PAGE_PARAMS)
+
+def _list_arg(name):
+    return [v.strip() for v in request.args.get(name, '').split(',') if v.strip()]
+
+def _int_arg(name, default):
+    try:
+        return int(request.args.get(name, default))
+    except ValueError:
+        raise result_cache.QueryError(f"❌ '{name}' must be an integer")
+
+def _encode_cursor(wb, offset):
+    return base64.urlsafe_b64encode(f"{wb.stamp[0]}:{offset}".encode()).decode()
+
+def _decode_cursor(wb, cursor):
+    try:
+        version, offset = base64.urlsafe_b64decode(cursor.encode()).decode().split(':')
+        version, offset = int(version), int(offset)
+    except Exception:
+        raise result_cache.QueryError("❌ Invalid cursor")
+    if version != wb.stamp[0]:
+        raise result_cache.QueryError("❌ Stale cursor: the file changed, restart from offset 0")
+    return offset
+
+def table_page(wb, table):
+    """(rows, page info) of a ColumnarTable for this request's parameters"""
+    limit = _int_arg('limit', PAGE_SIZE)
+    if not 0 < limit <= MAX_PAGE_SIZE:
+        raise result_cache.QueryError(f"❌ 'limit' must be between 1 and {MAX_PAGE_SIZE}")
+    cursor = request.args.get('cursor')
+    offset = _decode_cursor(wb, cursor) if cursor else max(_int_arg('offset', 0), 0)
+
+    columns = _list_arg('columns') or None
+    unknown = [c for c in columns or [] if not table.has_column(c)]
+    if unknown:
+        raise result_cache.QueryError(f"❌ Unknown columns: {unknown}")
+
+    filters = {f: _list_arg(f) for f in ('symbol', 'mode', 'exit_reason')}
+    filters.update({f: request.args.get(f) for f in ('date_from', 'date_to')})
+    index = table.select(filters, request.args.get('sort') or None)
+
+    rows = table.page(index, offset, limit, columns)
+    end = offset + len(rows)
+    return rows, {
+        'total': int(len(index)),
+        'offset': offset,
+        'limit': limit,
+        'columns': columns or table.columns,
+        'next_cursor': _encode_cursor(wb, end) if end < len(index) else None
+    }
+
 # ===============================
 # DOWNLOAD ENDPOINTS
 # ===============================
@@ -197,11 +377,12 @@ def download_phase_file(phase_num):
 def download_backtest_file(filename):
     """Download a specific historical backtest file by name"""
     # Security check: prevent directory traversal
-    if '..' in filename or sep in filename:
-        return jsonify({'error': 'Invalid filename'}), 400
+    try:
+        filepath = _safe_phase4_path(filename)
+    except result_cache.QueryError as e:
+        return jsonify({'error': str(e)}), 400
         
-    filepath = os.path.join(PHASE4_DIR, filename)
-    if not os.path.exists(filepath):
+    if not os.path.isfile(filepath):
         return jsonify({'error': 'File not found'}), 404
         
     try:
@@ -221,9 +402,9 @@ def download_backtest_file(filename):
 @app.route('/api/portfolio', methods=['GET'])
 def get_portfolio():
     """Get current portfolio status"""
-    portfolio = get_paper_trading_portfolio()
+    snap = PORTFOLIO.get()
     
-    if not portfolio:
+    if not snap:
         return jsonify({
             'error': 'Unable to fetch portfolio data',
             'total_value': 0,
@@ -232,36 +413,17 @@ def get_portfolio():
             'open_positions': []
         }), 500
     
-    return jsonify(portfolio)
+    return jsonify(snap['portfolio'])
 
 @app.route('/api/positions', methods=['GET'])
 def get_positions():
-    """Get active positions with details"""
-    portfolio = get_paper_trading_portfolio()
+    """Get active positions with details (P&L enriched once per poll)"""
+    snap = PORTFOLIO.get()
     
-    if not portfolio:
+    if not snap:
         return jsonify([]), 500
     
-    positions = portfolio.get('open_positions', [])
-    
-    # Enrich with calculated fields
-    enriched = []
-    for pos in positions:
-        entry = pos.get('entry_price', 0)
-        ltp = pos.get('ltp', entry)
-        qty = pos.get('qty', 0)
-        
-        pnl = (ltp - entry) * qty
-        pnl_pct = ((ltp - entry) / entry * 100) if entry > 0 else 0
-        
-        enriched.append({
-            **pos,
-            'current_pnl': round(pnl, 2),
-            'pnl_pct': round(pnl_pct, 2),
-            'current_price': ltp
-        })
-    
-    return jsonify(enriched)
+    return jsonify(snap['positions'])
 
 @app.route('/api/orders', methods=['GET'])
 def get_orders():
@@ -307,53 +469,14 @@ def get_latest_backtest():
         return jsonify({'error': 'No backtest results found'}), 404
     
     try:
-        print(f"Reading backtest file: {latest_file}")
-        xls = pd.ExcelFile(latest_file)
-        
-        response = {
-            'filename': os.path.basename(latest_file),
-            'timestamp': datetime.fromtimestamp(os.path.getmtime(latest_file)).strftime('%Y-%m-%d %H:%M:%S')
-        }
-        
-        # Read Performance
-        if 'Performance' in xls.sheet_names:
-            perf_df = pd.read_excel(xls, 'Performance')
-            metrics = {}
-            for _, row in perf_df.iterrows():
-                metric = row.get('Metric', '')
-                value = row.get('Value', '')
-                
-                # Ensure key is string to avoid comparison errors during JSON sorting
-                if pd.isna(metric): continue
-                metric_key = str(metric)
-                
-                # Handle NaN values
-                if pd.isna(value):
-                    value = ""
-                    
-                metrics[metric_key] = value
-                
-            response['metrics'] = metrics
-            # Keep original structure for some components
-            response['Performance'] = perf_df.fillna('').to_dict(orient='records')
-            
-        # Read Daily Summary
-        if 'Daily Summary' in xls.sheet_names:
-            daily_df = pd.read_excel(xls, 'Daily Summary')
-            response['daily_summary'] = daily_df.fillna('').to_dict(orient='records')
-            
-        # Read Trade Log
-        if 'Trade Log' in xls.sheet_names:
-            trades_df = pd.read_excel(xls, 'Trade Log')
-            # Sanitize timestamps for JSON
-            for col in ['Date', 'EntryTime', 'ExitTime']:
-                if col in trades_df.columns:
-                    trades_df[col] = trades_df[col].astype(str).replace('NaT', '')
-            
-            response['trades'] = trades_df.fillna('').to_dict(orient='records')
-            response['Trade Log'] = response['trades'] # Alias
-            
+        wb = RESULTS.get(latest_file)
+        response = wb.view('latest', lambda: latest_backtest_view(wb))
+        if wants_page() and 'trades' in response:
+            rows, page = table_page(wb, latest_trades_table(wb))
+            response = {**response, 'trades': rows, 'Trade Log': rows, 'trades_page': page}
         return jsonify(response)
+    except result_cache.QueryError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         print(f"Error reading backtest file: {e}")
         import traceback
@@ -369,15 +492,22 @@ def get_phase1_latest():
         return jsonify({'error': 'No Phase 1 results found'}), 404
     
     try:
-        df = pd.read_excel(filepath)
-        data = df.fillna('').to_dict(orient='records')
-        
-        return jsonify({
+        wb = RESULTS.get(filepath)
+        table = _table(wb, 'phase1_table', lambda: wb.sheet(0).fillna(''))
+        response = {
             'filename': os.path.basename(filepath),
-            'timestamp': datetime.fromtimestamp(os.path.getmtime(filepath)).strftime('%Y-%m-%d %H:%M:%S'),
-            'data': data,
-            'total_stocks': len(data)
-        })
+            'timestamp': _timestamp(wb)
+        }
+        if wants_page():
+            data, page = table_page(wb, table)
+            response.update({'data': data, 'total_stocks': page['total'], 'page': page})
+        else:
+            data = _all_rows(wb, 'phase1', table)
+            response.update({'data': data, 'total_stocks': len(data)})
+        
+        return jsonify(response)
+    except result_cache.QueryError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         print(f"Error reading Phase 1 file: {e}")
         import traceback
@@ -387,46 +517,47 @@ def get_phase1_latest():
 @app.route('/api/backtest/trades/<filename>', methods=['GET'])
 def get_backtest_trades(filename):
     """Get detailed trade log from a specific backtest file"""
-    filepath = os.path.join(PHASE4_DIR, filename)
+    try:
+        filepath = _safe_phase4_path(filename)
+    except result_cache.QueryError as e:
+        return jsonify({'error': str(e)}), 400
     
-    if not os.path.exists(filepath):
+    if not os.path.isfile(filepath):
         return jsonify({'error': 'File not found'}), 404
     
     try:
-        trade_log = pd.read_excel(filepath, sheet_name='Trade Log')
-        
-        # Convert to JSON-friendly format
-        trades = trade_log.to_dict(orient='records')
-        
-        # Convert timestamps to strings
-        for trade in trades:
-            for key in ['Date', 'EntryTime', 'ExitTime']:
-                if key in trade and pd.notna(trade[key]):
-                    if isinstance(trade[key], pd.Timestamp):
-                        trade[key] = trade[key].strftime('%Y-%m-%d %H:%M:%S')
-                    else:
-                        trade[key] = str(trade[key])
+        wb = RESULTS.get(filepath)
+        # JSON-friendly columns, timestamps as strings
+        table = trade_log_table(wb)
+        if wants_page():
+            trades, page = table_page(wb, table)
+            return jsonify({'filename': filename, **page, 'trades': trades})
         
-        return jsonify(trades)
+        return jsonify(_all_rows(wb, 'trades', table))
+    except result_cache.QueryError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/backtest/summary/<filename>', methods=['GET'])
 def get_backtest_summary(filename):
     """Get complete summary (all sheets) from a backtest file"""
-    filepath = os.path.join(PHASE4_DIR, filename)
+    try:
+        filepath = _safe_phase4_path(filename)
+    except result_cache.QueryError as e:
+        return jsonify({'error': str(e)}), 400
     
-    if not os.path.exists(filepath):
+    if not os.path.isfile(filepath):
         return jsonify({'error': 'File not found'}), 404
     
     try:
-        sheets = read_excel_safely(filepath)
+        wb = RESULTS.get(filepath)
         
         # Convert all DataFrames to JSON
-        result = {}
-        for sheet_name, df in sheets.items():
-            if isinstance(df, pd.DataFrame):
-                result[sheet_name] = df.to_dict(orient='records')
+        result = wb.view('summary', lambda: {
+            sheet_name: wb.sheet(sheet_name).to_dict(orient='records')
+            for sheet_name in wb.sheet_names()
+        })
         
         return jsonify(result)
     except Exception as e:
@@ -480,19 +611,17 @@ def get_live_signals():
         return jsonify([]), 404
     
     try:
-        df = pd.read_excel(PHASE3_FILE)
-        signals = df.to_dict(orient='records')
-        
+        wb = RESULTS.get(PHASE3_FILE)
         # Convert timestamps
-        for sig in signals:
-            for key in ['Date', 'Entry Time']:
-                if key in sig and pd.notna(sig[key]):
-                    if isinstance(sig[key], pd.Timestamp):
-                        sig[key] = sig[key].strftime('%Y-%m-%d %H:%M:%S')
-                    else:
-                        sig[key] = str(sig[key])
+        table = _table(wb, 'signals_table', lambda: _stringify(
+            wb.sheet(0), ['Date', 'Entry Time'], '%Y-%m-%d %H:%M:%S'))
+        if wants_page():
+            signals, page = table_page(wb, table)
+            return jsonify({**page, 'signals': signals})
         
-        return jsonify(signals)
+        return jsonify(_all_rows(wb, 'signals', table))
+    except result_cache.QueryError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -513,6 +642,17 @@ def get_candidates():
 # ANALYTICS ENDPOINTS
 # ===============================
 
+def _key_values(df, key_col):
+    """{key: Value} for rows where both are set (blank / NaN labels skipped)"""
+    out = {}
+    for key, value in zip(df.get(key_col, pd.Series('', index=df.index)),
+                          df.get('Value', pd.Series('', index=df.index))):
+        if pd.isna(key) or pd.isna(value):
+            continue
+        if key and value:
+            out[str(key)] = value
+    return out
+
 @app.route('/api/analytics/performance', methods=['GET'])
 def get_performance_metrics():
     """Get aggregated performance metrics across all backtests"""
@@ -522,27 +662,11 @@ def get_performance_metrics():
         return jsonify({'error': 'No backtest results found'}), 404
     
     try:
-        perf_df = pd.read_excel(latest_file, sheet_name='Performance')
-        config_df = pd.read_excel(latest_file, sheet_name='Algorithm Config')
-        
-        metrics = {}
-        for _, row in perf_df.iterrows():
-            metric = row.get('Metric', '')
-            value = row.get('Value', '')
-            if metric and value:
-                metrics[metric] = value
-        
-        config = {}
-        for _, row in config_df.iterrows():
-            param = row.get('Parameter', '')
-            value = row.get('Value', '')
-            if param and value:
-                config[param] = value
-        
-        return jsonify({
-            'metrics': metrics,
-            'config': config
-        })
+        wb = RESULTS.get(latest_file)
+        return jsonify(wb.view('analytics', lambda: {
+            'metrics': _key_values(wb.sheet('Performance'), 'Metric'),
+            'config': _key_values(wb.sheet('Algorithm Config'), 'Parameter')
+        }))
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -555,21 +679,71 @@ def get_daily_summary():
         return jsonify([]), 404
     
     try:
-        daily_df = pd.read_excel(latest_file, sheet_name='Daily Summary')
-        summary = daily_df.to_dict(orient='records')
-        
+        wb = RESULTS.get(latest_file)
         # Convert dates to strings
-        for day in summary:
-            if 'Date' in day and pd.notna(day['Date']):
-                if isinstance(day['Date'], pd.Timestamp):
-                    day['Date'] = day['Date'].strftime('%Y-%m-%d')
-                else:
-                    day['Date'] = str(day['Date'])
+        summary = wb.view('daily', lambda: _stringify(
+            wb.sheet('Daily Summary'), ['Date'], '%Y-%m-%d').to_dict(orient='records'))
         
         return jsonify(summary)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/analytics/risk', methods=['GET'])
+def get_risk_analysis():
+    """Get bootstrap / Monte Carlo risk analysis (drawdowns, risk of ruin, P&L CIs)"""
+    filename = request.args.get('file')
+    try:
+        filepath = _safe_phase4_path(filename) if filename else get_latest_backtest_file()
+    except result_cache.QueryError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    if not filepath or not os.path.isfile(filepath):
+        return jsonify({'error': 'No backtest results found'}), 404
+    
+    try:
+        wb = RESULTS.get(filepath)
+        n_paths = _int_arg('paths', risk_engine.N_PATHS)
+        if not 1 <= n_paths <= risk_engine.N_PATHS:
+            raise result_cache.QueryError(f"❌ 'paths' must be between 1 and {risk_engine.N_PATHS}")
+
+        def build():
+            stored = risk_engine.read_sheets(filepath)
+            if stored is None:
+                # Older workbook without risk sheets: simulate from its Trade Log
+                p4 = config_manager.get_phase_config('phase4')
+                stored = risk_engine.analyze(wb.sheet('Trade Log'),
+                                             p4.get('C_PER_DAY', 1000000),
+                                             p4.get('L_PCT', 0.02),
+                                             n_paths=n_paths)
+            result = risk_engine.records(*stored)
+            result['file'] = os.path.basename(filepath)
+            return result
+
+        # Stored sheets don't depend on the path count; of the simulations only
+        # the default one is cached, so clients can't grow the cache per value
+        if wb.has_sheet(risk_engine.RISK_SHEET) or n_paths == risk_engine.N_PATHS:
+            return jsonify(wb.view('risk', build))
+        return jsonify(build())
+    except result_cache.QueryError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/cache/stats', methods=['GET'])
+def get_cache_stats():
+    """Result cache hit / miss / parse-time stats"""
+    return jsonify(RESULTS.metrics())
+
+@app.route('/api/cache/invalidate', methods=['POST'])
+def invalidate_cache():
+    """Drop one cached result file ({"file": name}) or everything"""
+    filename = (request.get_json(silent=True) or {}).get('file')
+    try:
+        dropped = RESULTS.invalidate(_safe_phase4_path(str(filename)) if filename else None)
+    except result_cache.QueryError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'status': 'success', 'dropped': dropped})
+
 # ===============================
 # WEBSOCKET EVENTS (Real-time Updates)
 # ===============================
@@ -581,23 +755,35 @@ def handle_connect():
 
 @socketio.on('disconnect')
 def handle_disconnect():
+    PORTFOLIO.unsubscribe(request.sid)
     print('Client disconnected')
 
 @socketio.on('subscribe_portfolio')
 def handle_subscribe_portfolio():
-    """Start sending real-time portfolio updates"""
-    def send_updates():
-        while True:
-            portfolio = get_paper_trading_portfolio()
-            if portfolio:
-                socketio.emit('portfolio_update', portfolio)
-            time.sleep(1)  # Update every second
-    
-    # Start background thread (WARNING: This is simplified; 
-    # in production use proper background task management)
-    # Thread(target=send_updates, daemon=True).start()
+    """Full portfolio snapshot now, then only changes ('portfolio_diff') from the shared poller"""
+    join_room(PORTFOLIO_ROOM)
+    PORTFOLIO.subscribe(request.sid)
+    PORTFOLIO.start(socketio.start_background_task, socketio.sleep)
     
     emit('subscribed', {'channel': 'portfolio'})
+    snap = PORTFOLIO.get()
+    if snap:
+        emit(portfolio_feed.SNAPSHOT_EVENT, {
+            **snap['portfolio'],
+            'seq': snap['seq'],
+            'positions_enriched': snap['positions']
+        })
+
+@socketio.on('unsubscribe_portfolio')
+def handle_unsubscribe_portfolio():
+    leave_room(PORTFOLIO_ROOM)
+    PORTFOLIO.unsubscribe(request.sid)
+    emit('unsubscribed', {'channel': 'portfolio'})
+
+@app.route('/api/portfolio/feed/stats', methods=['GET'])
+def portfolio_feed_stats():
+    """Upstream polls / pushed diffs / subscribers of the shared portfolio poller"""
+    return jsonify(PORTFOLIO.metrics())
 
 # ===============================
 # STATIC FILE SERVING (for production)
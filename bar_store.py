@@ -0,0 +1,419 @@
+"""
+BACKTEST BAR STORE
+------------------
+• Loads + parses each (symbol, date) bar set exactly once per backtest
+• Day slicing by binary search on sorted timestamps (no per-row strftime)
+• Monolithic per-symbol files: parsed once, sliced per day; large ones get
+  a prebuilt on-disk date → byte-offset index so only the needed day is read
+• pack_trades: one packed bar array per symbol-day, shared by every trade
+  on it (feeds exit_engine.simulate_trades)
+• Daily OHLCV enrichment: one keyed (symbol, date) merge against the daily
+  candles table, with vectorized -EQ / -I suffix normalization
+"""
+
+import io
+import os
+import json
+import numpy as np
+import pandas as pd
+from datetime import time
+
+import exit_engine
+
+# ==============================
+# CONFIG
+# ==============================
+
+LARGE_FILE_MB = 50              # monolithic files above this use the byte-offset index
+INDEX_SUFFIX = ".dateidx.json"
+NS_PER_DAY = 86_400 * 10**9
+
+OHLCV_COLUMNS = ["Open", "High", "Low", "Close", "Volume"]
+SYMBOL_SUFFIX_RE = r"-(?:EQ|I)$"  # exchange series suffixes stripped for fallback matching
+
+
+# ==============================
+# TRADE KEYS
+# ==============================
+
+def parse_buy_time(buy_time):
+    """Phase-3 'Entry Time' cell → datetime.time (00:00 when unparseable)."""
+    # normalize buy_time to a time object if possible
+    if pd.isna(buy_time):
+        return time(0, 0)
+    if isinstance(buy_time, str):
+        try:
+            return pd.to_datetime(buy_time).time()
+        except Exception:
+            try:
+                parts = [int(x) for x in buy_time.split(":")]
+                return time(*parts[:3])
+            except Exception:
+                return time(0, 0)
+    if isinstance(buy_time, pd.Timestamp):
+        return buy_time.time()
+    return buy_time
+
+
+def date_key(date_val):
+    """Phase-3 'Date' cell → 'YYYY-MM-DD' (None when missing)."""
+    if pd.isna(date_val):
+        return None
+    try:
+        return pd.to_datetime(date_val).strftime("%Y-%m-%d")
+    except Exception:
+        return str(date_val)
+
+
+def trade_keys(df):
+    """
+    Per-trade (symbol, date_str) keys and parsed entry times.
+
+    Returns:
+        keys list, buy_times list (aligned with df rows)
+    """
+    if len(df) == 0:
+        return [], []
+    keys = [(sym, date_key(d)) for sym, d in zip(df["symbol"], df["date"])]
+    buy_times = [parse_buy_time(bt) for bt in df["buy_time"]]
+    return keys, buy_times
+
+
+# ==============================
+# PARSING HELPERS
+# ==============================
+
+def _lower_columns(mdf):
+    mdf.columns = [c.lower() for c in mdf.columns]
+    return mdf
+
+
+def _wall_day_ns(dt):
+    """Local wall-clock day number (ns // day) for a datetime Series."""
+    if dt.dt.tz is not None:
+        dt = dt.dt.tz_localize(None)
+    return dt.values.astype("datetime64[ns]").astype(np.int64) // NS_PER_DAY
+
+
+def slice_day(mdf, date_str):
+    """Rows of a datetime-sorted frame whose wall-clock date is date_str."""
+    dt = mdf["datetime"]
+    if not pd.api.types.is_datetime64_any_dtype(dt):
+        # mixed offsets → object dtype; fall back to the exact string filter
+        return mdf[pd.to_datetime(dt, utc=True).dt.strftime("%Y-%m-%d") == date_str]
+    valid = dt.notna().to_numpy()
+    mdf, dt = mdf[valid], dt[valid]
+    day = pd.Timestamp(date_str).value // NS_PER_DAY
+    days = _wall_day_ns(dt)
+    lo, hi = np.searchsorted(days, [day, day + 1])
+    return mdf.iloc[lo:hi]
+
+
+def parse_five_min_day(path, date_str):
+    """downloaded_data/<SYMBOL>/<date>.csv (time column) → sorted frame."""
+    mdf = _lower_columns(pd.read_csv(path))
+
+    # expect a 'time' column (e.g., 09:15:00). Create a datetime by combining file date and time
+    if "time" in mdf.columns:
+        try:
+            mdf["datetime"] = pd.to_datetime(date_str + " " + mdf["time"].astype(str))
+        except Exception:
+            # fallback: parse time only and attach arbitrary date
+            mdf["datetime"] = pd.to_datetime(mdf["time"].astype(str))
+    elif "datetime" in mdf.columns:
+        mdf["datetime"] = pd.to_datetime(mdf["datetime"])
+    else:
+        # cannot interpret timestamps; skip
+        mdf["datetime"] = pd.NaT
+
+    return mdf.sort_values("datetime")
+
+
+def parse_one_min(mdf, date_str):
+    """1-minute frame ('date' full datetime, or 'time' + trade date) → datetime column."""
+    mdf = _lower_columns(mdf)
+    # 1-min data has 'date' column with full datetime (e.g., '2025-11-03 09:15:00+05:30')
+    if "date" in mdf.columns:
+        try:
+            mdf["datetime"] = pd.to_datetime(mdf["date"])
+        except Exception:
+            mdf["datetime"] = pd.NaT
+    elif "time" in mdf.columns and date_str:
+        # If only 'time' exists (e.g. 09:15), combine with the trade date
+        try:
+            mdf["datetime"] = pd.to_datetime(f"{date_str} " + mdf["time"])
+        except Exception:
+            mdf["datetime"] = pd.NaT
+    else:
+        mdf["datetime"] = pd.NaT
+    return mdf
+
+
+# ==============================
+# DATE → OFFSET INDEX (LARGE FILES)
+# ==============================
+
+def build_date_index(path):
+    """
+    Scan a monolithic CSV once and record the byte range of each date
+    (first 10 chars of the 'date' column). Saved next to the file and
+    reused while the file's size/mtime are unchanged.
+
+    Returns:
+        dict with header, ranges {date: [start, end]}, contiguous flag
+    """
+    st = os.stat(path)
+    ranges = {}
+    contiguous = True
+    with open(path, "rb") as f:
+        header = f.readline()
+        cols = [c.strip().lower() for c in header.decode("utf-8-sig").split(",")]
+        if "date" not in cols:
+            return None
+        col = cols.index("date")
+        pos = f.tell()
+        current = None
+        for line in f:
+            fields = line.split(b",", col + 1)
+            day = fields[col][:10].decode("ascii", "ignore") if len(fields) > col else ""
+            if day != current:
+                if day in ranges:
+                    contiguous = False
+                else:
+                    ranges[day] = [pos, pos]
+                current = day
+            pos += len(line)
+            ranges[current][1] = pos
+
+    index = {
+        "size": st.st_size,
+        "mtime": st.st_mtime,
+        "header": header.decode("utf-8-sig"),
+        "ranges": ranges,
+        "contiguous": contiguous,
+    }
+    try:
+        with open(path + INDEX_SUFFIX, "w") as f:
+            json.dump(index, f)
+    except OSError:
+        pass
+    return index
+
+
+def load_date_index(path):
+    idx_path = path + INDEX_SUFFIX
+    st = os.stat(path)
+    if os.path.exists(idx_path):
+        try:
+            with open(idx_path) as f:
+                index = json.load(f)
+            if index["size"] == st.st_size and index["mtime"] == st.st_mtime:
+                return index
+        except (OSError, ValueError, KeyError):
+            pass
+    return build_date_index(path)
+
+
+def read_indexed_day(path, index, date_str):
+    """Read only date_str's rows of a monolithic CSV via its offset index."""
+    rng = index["ranges"].get(date_str)
+    if rng is None:
+        return pd.DataFrame(columns=[c.strip() for c in index["header"].strip().split(",")])
+    with open(path, "rb") as f:
+        f.seek(rng[0])
+        chunk = f.read(rng[1] - rng[0]).decode("utf-8")
+    return pd.read_csv(io.StringIO(index["header"] + chunk))
+
+
+# ==============================
+# STORE
+# ==============================
+
+class BarStore:
+    """
+    Per-backtest cache of parsed bars keyed by (symbol, date_str).
+
+    Args:
+        loader: callable(symbol, date_str) → sorted candle frame or None
+    """
+
+    def __init__(self, loader):
+        self.loader = loader
+        self._bars = {}
+        self.stats = {"loads": 0, "hits": 0, "missing": 0}
+
+    def get(self, symbol, date_str):
+        """exit_engine.frame_bars tuple for the symbol-day, or None if no data."""
+        key = (symbol, date_str)
+        if key in self._bars:
+            self.stats["hits"] += 1
+            return self._bars[key]
+        mdf = self.loader(symbol, date_str)
+        bars = None if mdf is None else exit_engine.frame_bars(mdf)
+        self.stats["loads" if bars is not None else "missing"] += 1
+        self._bars[key] = bars
+        return bars
+
+    def report(self):
+        return f"📦 Bar store: {self.stats['loads']} symbol-days loaded, {self.stats['hits']} reused, {self.stats['missing']} missing"
+
+
+def five_min_store(base_dir):
+    """Store over downloaded_data/<SYMBOL>/<YYYY-MM-DD>.csv."""
+    def load(symbol, date_str):
+        if not date_str:
+            return None
+        path = os.path.join(base_dir, symbol, f"{date_str}.csv")
+        if not os.path.exists(path):
+            return None
+        return parse_five_min_day(path, date_str)
+    return BarStore(load)
+
+
+def one_min_store(base_dir, large_file_mb=LARGE_FILE_MB):
+    """
+    Store over downloaded_data/1min/1min/<SYMBOL>/<DATE>.csv, falling back
+    to the old monolithic <SYMBOL>.csv layout (parsed once per symbol, or read
+    by date offset when large).
+    """
+    symbol_frames = {}     # symbol → parsed, sorted monolithic frame
+
+    def load_monolithic(path, symbol, date_str):
+        index = None
+        if date_str and os.path.getsize(path) >= large_file_mb * 1024 * 1024:
+            index = load_date_index(path)
+        if index is not None and index["contiguous"]:
+            return parse_one_min(read_indexed_day(path, index, date_str), date_str).sort_values("datetime")
+
+        if symbol not in symbol_frames:
+            parsed = parse_one_min(pd.read_csv(path), date_str)
+            if "date" in parsed.columns:
+                parsed = parsed.sort_values("datetime", kind="stable")
+            symbol_frames[symbol] = parsed
+        mdf = symbol_frames[symbol]
+        if "date" not in mdf.columns:
+            # time-only file: rows belong to the requested trade date
+            return parse_one_min(mdf.drop(columns=["datetime"]), date_str).sort_values("datetime")
+        return mdf
+
+    def load(symbol, date_str):
+        path = os.path.join(base_dir, symbol, f"{date_str}.csv") if date_str else None
+        if path and os.path.exists(path):
+            mdf = parse_one_min(pd.read_csv(path), date_str).sort_values("datetime")
+        else:
+            path = os.path.join(base_dir, f"{symbol}.csv")
+            if not os.path.exists(path):
+                return None
+            mdf = load_monolithic(path, symbol, date_str)
+
+        # Filter for the specific trade date only (binary search, no strftime per row)
+        if date_str:
+            mdf = slice_day(mdf, date_str)
+        return mdf
+
+    return BarStore(load)
+
+
+def pack_trades(store, keys):
+    """
+    Pack each distinct symbol-day once and point every trade at its slice.
+
+    Args:
+        store: BarStore
+        keys: list of (symbol, date_str) per trade
+
+    Returns:
+        packed bars, starts, ends (for trades with data), has_data mask,
+        per-trade times arrays (None without data)
+    """
+    unique = list(dict.fromkeys(keys))
+    bar_sets = {k: store.get(*k) for k in unique}
+    present = [k for k in unique if bar_sets[k] is not None]
+    # Trades sharing a loaded symbol-day reuse its bars without reaching store.get
+    store.stats["hits"] += sum(bar_sets[k] is not None for k in keys) - len(present)
+
+    packed, u_starts, u_ends = exit_engine.pack_bars([bar_sets[k] for k in present])
+    pos = {k: i for i, k in enumerate(present)}
+
+    has_data = np.array([k in pos for k in keys], dtype=bool)
+    starts = np.array([u_starts[pos[k]] for k in keys if k in pos], dtype=np.int64)
+    ends = np.array([u_ends[pos[k]] for k in keys if k in pos], dtype=np.int64)
+    times = [bar_sets[k][5] if k in pos else None for k in keys]
+    return packed, starts, ends, has_data, times
+
+
+# ==============================
+# DAILY OHLCV ENRICHMENT
+# ==============================
+
+def normalize_symbols(symbols):
+    """Upper-cased, stripped symbol strings (vectorized)."""
+    return pd.Series(symbols).astype(str).str.upper().str.strip()
+
+
+def base_symbols(symbols):
+    """normalize_symbols with -EQ / -I series suffixes removed."""
+    return normalize_symbols(symbols).str.replace(SYMBOL_SUFFIX_RE, "", regex=True)
+
+
+def load_daily_ohlcv(path):
+    """
+    daily_candles_nifty500.xlsx → table keyed by (Symbol, Date) with a
+    suffix-free Base symbol; first row wins for duplicate keys.
+
+    Returns:
+        DataFrame Symbol, Base, Date + available OHLCV columns
+    """
+    ohl = pd.read_excel(path)
+    ohl.columns = [str(c).strip() for c in ohl.columns]
+
+    # Normalize symbol column
+    if "Symbol" not in ohl.columns and "symbol" in ohl.columns:
+        ohl["Symbol"] = ohl["symbol"]
+    ohl["Symbol"] = normalize_symbols(ohl["Symbol"]).to_numpy()
+    ohl["Base"] = base_symbols(ohl["Symbol"]).to_numpy()
+
+    # Handle Datetime column (not Date)
+    for col in ("Datetime", "Date", "date"):
+        if col in ohl.columns:
+            ohl["Date"] = pd.to_datetime(ohl[col]).dt.strftime("%Y-%m-%d")
+            break
+
+    # Normalize OHLCV columns to capitalized
+    ohl = ohl.rename(columns={c.lower(): c for c in OHLCV_COLUMNS})
+    cols = [c for c in OHLCV_COLUMNS if c in ohl.columns]
+    return ohl[["Symbol", "Base", "Date"] + cols].drop_duplicates(["Symbol", "Date"])
+
+
+def enrich_ohlcv(trade_log_df, daily):
+    """
+    Fill the Trade Log's Open/High/Low/Close/Volume from the daily table:
+    exact (symbol, date) match first, then the suffix-free base symbol.
+    Unmatched trades keep their existing values; OHLCV columns end numeric.
+    """
+    cols = [c for c in OHLCV_COLUMNS if c in daily.columns and c in trade_log_df.columns]
+    keys = pd.DataFrame({
+        "Symbol": normalize_symbols(trade_log_df["Stock"]).to_numpy(),
+        "Base": base_symbols(trade_log_df["Stock"]).to_numpy(),
+        "Date": trade_log_df["Date"].astype(str).to_numpy(),
+    })
+    hit = daily[cols].assign(__hit=True)
+    exact = keys.merge(pd.concat([daily[["Symbol", "Date"]], hit], axis=1),
+                       on=["Symbol", "Date"], how="left")
+    by_base = daily.drop_duplicates(["Base", "Date"])
+    base = keys.merge(pd.concat([by_base[["Base", "Date"]], hit.loc[by_base.index]], axis=1),
+                      on=["Base", "Date"], how="left")
+
+    use_exact = exact["__hit"].notna().to_numpy()
+    use_base = ~use_exact & base["__hit"].notna().to_numpy()
+    for c in cols:
+        values = trade_log_df[c].to_numpy(dtype=object).copy()
+        values[use_exact] = exact[c].to_numpy(dtype=object)[use_exact]
+        values[use_base] = base[c].to_numpy(dtype=object)[use_base]
+        trade_log_df[c] = values
+
+    # Ensure OHLCV columns are numeric (not strings)
+    for col in OHLCV_COLUMNS:
+        if col in trade_log_df.columns:
+            trade_log_df[col] = pd.to_numeric(trade_log_df[col], errors="coerce")
+    return trade_log_df
@@ -0,0 +1,208 @@
+"""
+BENCHMARK / INDEX SERIES SERVICE
+--------------------------------
+• Holds benchmark bars (NIFTY / SPY / QQQ / ...) in sorted NumPy arrays
+• Vectorized as-of lookups (last close at or before each timestamp)
+• O(1) latest-value access for live mode
+• Incremental append as new live candles arrive
+• One shared registry + CSV loader used by phase-2, phase-3 and 5minLive
+"""
+
+import threading
+import numpy as np
+import pandas as pd
+
+# ==============================
+# CONFIG
+# ==============================
+
+DEFAULT_TOLERANCE = pd.Timedelta(minutes=15)  # max age of a benchmark bar for as-of alignment
+INITIAL_CAPACITY = 1024
+
+
+def to_ns(values):
+    """
+    Convert datetimes (scalar, list, Series, DatetimeIndex) to int64 ns.
+    tz-aware values are converted to UTC first, so a naive timestamp and its
+    tz-aware UTC twin map to the same key (matches pd.merge on utc=True data).
+    """
+    ts = pd.to_datetime(values)
+    if isinstance(ts, pd.Series):
+        if ts.dt.tz is not None:
+            ts = ts.dt.tz_convert("UTC").dt.tz_localize(None)
+        return ts.values.astype("datetime64[ns]").astype(np.int64)
+    if isinstance(ts, pd.Timestamp):
+        if ts.tzinfo is not None:
+            ts = ts.tz_convert("UTC").tz_localize(None)
+        return np.int64(ts.as_unit("ns").value)
+    ts = pd.DatetimeIndex(ts)
+    if ts.tz is not None:
+        ts = ts.tz_convert("UTC").tz_localize(None)
+    return ts.values.astype("datetime64[ns]").astype(np.int64)
+
+
+class BenchmarkSeries:
+    """Sorted (time, close) arrays with as-of lookups and incremental updates."""
+
+    def __init__(self, name, times=None, closes=None):
+        self.name = name
+        self._lock = threading.Lock()
+        self._times = np.empty(INITIAL_CAPACITY, dtype=np.int64)
+        self._closes = np.empty(INITIAL_CAPACITY, dtype=np.float64)
+        self._n = 0
+        if times is not None and len(times):
+            self.extend(times, closes)
+
+    # ------------------------------
+    # ACCESSORS
+    # ------------------------------
+
+    def __len__(self):
+        return self._n
+
+    @property
+    def times(self):
+        return self._times[:self._n]
+
+    @property
+    def closes(self):
+        return self._closes[:self._n]
+
+    def latest(self):
+        """Return (Timestamp, close) of the newest bar, or (None, None)."""
+        if self._n == 0:
+            return None, None
+        return pd.Timestamp(self._times[self._n - 1]), float(self._closes[self._n - 1])
+
+    def latest_close(self):
+        return None if self._n == 0 else float(self._closes[self._n - 1])
+
+    def first_close(self):
+        return None if self._n == 0 else float(self._closes[0])
+
+    # ------------------------------
+    # UPDATES
+    # ------------------------------
+
+    def _reserve(self, n):
+        if n <= len(self._times):
+            return
+        cap = max(n, 2 * len(self._times))
+        self._times = np.resize(self._times, cap)
+        self._closes = np.resize(self._closes, cap)
+
+    def extend(self, times, closes):
+        """Bulk-load bars (any order). Later duplicates overwrite earlier ones."""
+        t = to_ns(times)
+        c = np.asarray(closes, dtype=np.float64)
+        ok = ~np.isnan(c)
+        t, c = t[ok], c[ok]
+
+        with self._lock:
+            all_t = np.concatenate([self.times, t])
+            all_c = np.concatenate([self.closes, c])
+            order = np.argsort(all_t, kind="stable")
+            all_t, all_c = all_t[order], all_c[order]
+            # keep the LAST value for each duplicate timestamp
+            keep = np.append(all_t[1:] != all_t[:-1], True) if len(all_t) else np.zeros(0, dtype=bool)
+            all_t, all_c = all_t[keep], all_c[keep]
+
+            self._reserve(len(all_t))
+            self._n = len(all_t)
+            self._times[:self._n] = all_t
+            self._closes[:self._n] = all_c
+
+    def update(self, ts, close):
+        """Append one live bar (amortized O(1) for in-order bars)."""
+        if close is None or np.isnan(close):
+            return
+        t = to_ns(ts)
+        with self._lock:
+            n = self._n
+            if n and t == self._times[n - 1]:
+                self._closes[n - 1] = close
+                return
+            if n == 0 or t > self._times[n - 1]:
+                self._reserve(n + 1)
+                self._times[n] = t
+                self._closes[n] = close
+                self._n = n + 1
+                return
+        # out-of-order bar: rare, fall back to a merge
+        self.extend([pd.Timestamp(t)], [close])
+
+    # ------------------------------
+    # AS-OF LOOKUPS
+    # ------------------------------
+
+    def asof(self, times, tolerance=DEFAULT_TOLERANCE):
+        """
+        Vectorized as-of lookup.
+
+        Args:
+            times: datetimes to align (Series / array / list)
+            tolerance: max age of the matched bar (Timedelta) or None for unlimited
+
+        Returns:
+            np.ndarray of closes (NaN where no bar at or before the time, or too old)
+        """
+        q = to_ns(times)
+        q = np.atleast_1d(q)
+        out = np.full(len(q), np.nan)
+        if self._n == 0 or len(q) == 0:
+            return out
+
+        t = self.times
+        idx = np.searchsorted(t, q, side="right") - 1
+        valid = idx >= 0
+        if tolerance is not None:
+            tol = pd.Timedelta(tolerance).value
+            valid &= (q - t[np.maximum(idx, 0)]) <= tol
+        out[valid] = self.closes[idx[valid]]
+        return out
+
+    def asof_one(self, ts, tolerance=DEFAULT_TOLERANCE):
+        """Scalar as-of lookup → float or None."""
+        v = self.asof([ts], tolerance=tolerance)[0]
+        return None if np.isnan(v) else float(v)
+
+    def to_frame(self):
+        return pd.DataFrame({"Datetime": pd.to_datetime(self.times), "Close": self.closes})
+
+
+# ==============================
+# SHARED REGISTRY
+# ==============================
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+def get_series(name):
+    """Get (or lazily create) the shared series for a benchmark name."""
+    with _registry_lock:
+        if name not in _registry:
+            _registry[name] = BenchmarkSeries(name)
+        return _registry[name]
+
+
+def load_index_csv(path, name=None):
+    """
+    Load an index CSV (Datetime/date + Close/close columns) into the shared
+    series `name` (defaults to the file path).
+    """
+    df = pd.read_csv(path)
+
+    col_date = "Datetime" if "Datetime" in df.columns else ("date" if "date" in df.columns else None)
+    col_close = "Close" if "Close" in df.columns else ("close" if "close" in df.columns else None)
+    if not col_date or not col_close:
+        available_cols = ", ".join(df.columns)
+        raise KeyError(f"Missing required columns in {path}. Need Date/Datetime and Close. Found: {available_cols}")
+
+    times = pd.to_datetime(df[col_date], utc=True, errors="coerce")
+    closes = pd.to_numeric(df[col_close], errors="coerce")
+    ok = times.notna() & closes.notna()
+
+    series = get_series(name or path)
+    series.extend(times[ok], closes[ok].to_numpy())
+    return series
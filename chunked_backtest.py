@@ -0,0 +1,445 @@
+"""
+CHUNKED MULTI-YEAR BACKTEST
+---------------------------
+• Streams the screened date range month by month through the pipeline:
+    Phase-1/2 — screened (Symbol, Date) pairs of the chunk from phase-2results
+    Phase-3   — indicators for the chunk's days only → entries
+                (threshold sensitivity engine, current phase-3 thresholds)
+    Phase-4   — event-driven portfolio replay (portfolio_backtest)
+• Only the chunk's 5-minute files are read; per symbol, the state needed
+  across chunks is carried forward:
+    - warm-up bars of the last WARMUP_DAYS screened days
+      (RS_30m look-back, VolMult_od time-of-day volume profile)
+    - daily ATR: Wilder EWM value + last daily close
+  Phase-4 exits every position by FORCE_EXIT_TIME, so the book is flat at
+  every chunk boundary and no open trades cross a chunk
+• Incremental results: phase-4results/chunked_<ts>/<first>_<last>.{entries,
+  trades,daily}.csv per chunk + state.npz checkpoint (atomic) → resumable
+• Memory budget (MAX_RSS_MB), enforced:
+    - months are pre-split so the estimated footprint fits the budget
+    - RSS is checked after each stage; a chunk over budget is discarded
+      and re-run in halves
+    - a single day over budget aborts the run (MemoryError)
+
+VolMult_od's fallback for candles without history uses the symbol's mean
+volume up to the chunk end (the one-shot run uses its full history).
+
+Usage:
+    python chunked_backtest.py [start YYYY-MM] [end YYYY-MM]
+    python chunked_backtest.py --resume phase-4results/chunked_<ts>
+"""
+
+import os
+import gc
+import sys
+import time as _time
+import importlib
+import numpy as np
+import pandas as pd
+from datetime import datetime
+
+import param_sweep
+import portfolio_backtest
+import phase3_sensitivity
+
+phase3 = importlib.import_module("phase-3")
+
+try:
+    import psutil
+    HAVE_PSUTIL = True
+except ImportError:
+    HAVE_PSUTIL = False
+
+# ==============================
+# CONFIG
+# ==============================
+
+OUTPUT_DIR = "phase-4results"
+STATE_FILE = "state.npz"
+STATE_VERSION = 1
+
+MAX_RSS_MB = 2048               # process resident-set budget
+MEMORY_FACTOR = 10.0            # initial in-memory MB per MB of chunk CSV input (learned per run)
+WARMUP_DAYS = 5                 # screened days of bars carried per symbol (VolMult_od 5-day profile)
+
+PARAMS = dict(portfolio_backtest.PARAMS)
+THRESHOLDS = {"ATR_MULTIPLIER": [phase3_sensitivity.BASE_THRESHOLDS["ATR_MULTIPLIER"]]}
+
+WARMUP_COLUMNS = ["Open", "High", "Low", "Close", "Volume", "NIFTY_Close"]
+CHUNK_COLUMNS = ["Chunk", "Days", "Symbols", "Candles", "Entries", "Filled", "NetP&L", "PeakRSS_MB", "Seconds"]
+
+
+# ==============================
+# MEMORY BUDGET
+# ==============================
+
+class ChunkOverBudget(Exception):
+    """A chunk pushed RSS over the budget; its partial results are discarded."""
+
+
+def rss_mb():
+    """Current resident set size in MB (None when it cannot be measured)."""
+    if HAVE_PSUTIL:
+        return psutil.Process().memory_info().rss / 2**20
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class MemoryBudget:
+    def __init__(self, max_mb=MAX_RSS_MB):
+        self.max_mb = max_mb
+        self.peak_mb = 0.0
+        self.measurable = rss_mb() is not None
+        if not self.measurable:
+            print("⚠️ RSS not measurable on this platform (install psutil); budget checks disabled")
+
+    def check(self, stage):
+        """Record RSS at a stage boundary; raise ChunkOverBudget when still over after a collect."""
+        rss = rss_mb()
+        if rss is None:
+            return 0.0
+        if rss > self.max_mb:
+            gc.collect()
+            rss = rss_mb()
+        self.peak_mb = max(self.peak_mb, rss)
+        if rss > self.max_mb:
+            raise ChunkOverBudget(f"{stage}: {rss:.0f} MB > budget {self.max_mb} MB")
+        return rss
+
+
+# ==============================
+# CHUNK PLANNING
+# ==============================
+
+def input_sizes(phase2_df):
+    """On-disk MB per screened day of the 5-minute files a chunk reads (Phase-3 + Phase-4 bars)."""
+    sizes = {}
+    for symbol, day in zip(phase2_df["Symbol"], phase2_df["Date"]):
+        for base in (phase3.BASE_DIR, param_sweep.FIVE_MIN_DATA_DIR):
+            path = os.path.join(base, symbol, f"{day}.csv")
+            if os.path.exists(path):
+                sizes[day] = sizes.get(day, 0.0) + os.path.getsize(path) / 2**20
+    return sizes
+
+
+def plan_chunks(sizes, dates, budget_mb, factor):
+    """
+    Screened trading days → month chunks, each split further until its
+    estimated footprint (input MB × factor) fits budget_mb.
+    """
+    per_day = {d: sizes.get(d, 0.0) * factor for d in dates}
+    months = pd.Series(dates).groupby([pd.Timestamp(d).strftime("%Y-%m") for d in dates], sort=True)
+    chunks = []
+    for _, month in months:
+        current, size = [], 0.0
+        for d in month:
+            if current and size + per_day[d] > budget_mb:
+                chunks.append(current)
+                current, size = [], 0.0
+            current.append(d)
+            size += per_day[d]
+        chunks.append(current)
+    return chunks
+
+
+# ==============================
+# CARRIED STATE
+# ==============================
+
+def new_state():
+    return {"warmup": {}, "atr": {}, "done_through": None, "chunks": [], "factor": MEMORY_FACTOR}
+
+
+def save_state(state, path):
+    """Carried per-symbol state + progress → compressed .npz (temp file + rename)."""
+    symbols = sorted(state["warmup"])
+    offsets = [0]
+    for symbol in symbols:
+        offsets.append(offsets[-1] + len(state["warmup"][symbol]))
+    warm = [state["warmup"][s] for s in symbols]
+    atr_symbols = sorted(state["atr"])
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez_compressed(
+            f,
+            version=np.array([STATE_VERSION], dtype=np.int64),
+            symbols=np.array(symbols, dtype=str),
+            offsets=np.array(offsets, dtype=np.int64),
+            datetime=(np.concatenate([w["Datetime"].values.astype("datetime64[ns]").astype(np.int64) for w in warm])
+                      if warm else np.empty(0, dtype=np.int64)),
+            values=(np.vstack([w[WARMUP_COLUMNS].to_numpy(dtype=np.float64) for w in warm])
+                    if warm else np.empty((0, len(WARMUP_COLUMNS)))),
+            atr_symbols=np.array(atr_symbols, dtype=str),
+            atr=np.array([state["atr"][s] for s in atr_symbols], dtype=np.float64).reshape(-1, 2),
+            done_through=np.array([state["done_through"] or ""], dtype=str),
+            chunks=np.array(state["chunks"], dtype=str),
+            factor=np.array([state["factor"]], dtype=np.float64),
+        )
+    os.replace(tmp_path, path)
+
+
+def load_state(path):
+    with np.load(path, allow_pickle=False) as snap:
+        if int(snap["version"][0]) != STATE_VERSION:
+            raise ValueError(f"❌ State version mismatch: {path}")
+        state = new_state()
+        offsets, times, values = snap["offsets"], snap["datetime"], snap["values"]
+        for i, symbol in enumerate(snap["symbols"]):
+            lo, hi = offsets[i], offsets[i + 1]
+            state["warmup"][str(symbol)] = warmup_frame(str(symbol), times[lo:hi], values[lo:hi])
+        state["atr"] = {str(s): (float(a), float(c)) for s, (a, c) in zip(snap["atr_symbols"], snap["atr"])}
+        state["done_through"] = str(snap["done_through"][0]) or None
+        state["chunks"] = [str(c) for c in snap["chunks"]]
+        state["factor"] = float(snap["factor"][0])
+    return state
+
+
+def warmup_frame(symbol, times, values):
+    df = pd.DataFrame(values, columns=WARMUP_COLUMNS)
+    df.insert(0, "Datetime", pd.to_datetime(times, utc=True))
+    df["Date"] = df["Datetime"].dt.date
+    df["Symbol"] = symbol
+    return df
+
+
+# ==============================
+# PHASE-3 (PER CHUNK)
+# ==============================
+
+def carried_daily_atr(df, carry):
+    """phase-3 compute_daily_atr continued from the carried (ATR EWM, last close)."""
+    daily = df.groupby("Date").agg(
+        High=("High", "max"),
+        Low=("Low", "min"),
+        Close=("Close", "last")
+    )
+    prev_close = daily["Close"].shift(1)
+    if carry is not None:
+        prev_close.iloc[0] = carry[1]
+    tr = pd.concat([
+        daily["High"] - daily["Low"],
+        (daily["High"] - prev_close).abs(),
+        (daily["Low"] - prev_close).abs()
+    ], axis=1).max(axis=1)
+
+    if carry is None:
+        atr14 = tr.ewm(alpha=1/14, min_periods=1, adjust=False).mean()
+    else:
+        # seed the recursion with the carried value: s₁ = (1 − α)·s₀ + α·tr₁
+        atr14 = pd.concat([pd.Series([carry[0]]), tr]).ewm(alpha=1/14, min_periods=1, adjust=False).mean().iloc[1:]
+        atr14.index = daily.index
+    daily["ATR_pct"] = (atr14 / daily["Close"]) * 100
+    return daily[["ATR_pct"]], (float(atr14.iloc[-1]), float(daily["Close"].iloc[-1]))
+
+
+def chunk_indicators(symbol, p2, nsei, warm, atr_carry):
+    """
+    phase-3 compute_indicators for one symbol over the chunk's screened
+    days, continued from the carried state.
+
+    Returns:
+        (indicator frame, new warm-up bars, new ATR carry) or None
+    """
+    days = p2.loc[p2["Symbol"] == symbol, "Date"]
+    stock = phase3.load_stock_5m(symbol, dates=days)
+    if stock is None:
+        return None
+
+    df = stock.copy()
+    df["NIFTY_Close"] = nsei.asof(df["Datetime"])
+    df = pd.merge(df, p2[p2["Symbol"] == symbol], on=["Symbol", "Date"], how="inner")
+    if df.empty:
+        return None
+
+    n_warm = 0 if warm is None else len(warm)
+    if n_warm:
+        df = pd.concat([warm, df], ignore_index=True)
+    raw = df[["Datetime", "Date", "Symbol"] + WARMUP_COLUMNS]
+
+    df["VWAP"] = phase3.compute_vwap(df)
+    df = phase3.compute_rs_30m(df)
+    df = phase3.compute_volmult_od(df)
+    df = phase3.compute_atr_5m(df, length=phase3.ATR_LENGTH_5M)
+    df["Time"] = df["Datetime"].dt.time
+    df = df.iloc[n_warm:].reset_index(drop=True)
+
+    atr_daily, atr_carry = carried_daily_atr(df, atr_carry)
+    df = df.merge(atr_daily, on="Date", how="left")
+    df["Buffer"] = df["Close"] * np.maximum(
+        0.0005,
+        0.10 * (df["ATR_pct"] / 100)
+    )
+
+    keep = pd.Series(raw["Date"].unique()).iloc[-WARMUP_DAYS:]
+    new_warm = raw[raw["Date"].isin(keep)].reset_index(drop=True)
+    return df, new_warm, atr_carry
+
+
+# ==============================
+# CHUNK
+# ==============================
+
+def run_chunk(dates, phase2_df, nsei, state, budget):
+    """
+    Phases 1–4 for one chunk of trading days. Carried state is not touched;
+    the updates are returned for the caller to commit.
+
+    Returns:
+        (entries_df, trade_log_df, daily_df, updates, candles)
+    """
+    p2 = phase2_df[phase2_df["Date"].isin(dates)]
+    frames, updates = [], {}
+    for symbol in p2["Symbol"].unique():
+        out = chunk_indicators(symbol, p2, nsei, state["warmup"].get(symbol), state["atr"].get(symbol))
+        if out is not None:
+            frames.append(out[0])
+            updates[symbol] = out[1:]
+    budget.check("phase-3 indicators")
+
+    candles = sum(len(f) for f in frames)
+    if not frames:
+        entries = pd.DataFrame()
+    else:
+        prep = phase3_sensitivity.prepare(pd.concat(frames, ignore_index=True))
+        del frames
+        _, entries = phase3_sensitivity.run(THRESHOLDS, data=prep)
+        del prep
+        entries = entries.drop(columns=["combo"])
+    budget.check("phase-3 entries")
+
+    if entries.empty:
+        empty = lambda cols: pd.DataFrame(columns=cols)
+        return entries, empty(portfolio_backtest.TRADE_COLUMNS), empty(portfolio_backtest.DAILY_COLUMNS), updates, candles
+
+    data = param_sweep.load_sweep_data(entries=entries)
+    budget.check("phase-4 bars")
+    trade_log_df, daily_df = portfolio_backtest.run_portfolio(data, PARAMS)
+    del data
+    budget.check("phase-4 replay")
+    return entries, trade_log_df, daily_df, updates, candles
+
+
+def write_chunk(out_dir, label, entries, trade_log_df, daily_df):
+    entries.to_csv(os.path.join(out_dir, f"{label}.entries.csv"), index=False)
+    trade_log_df.to_csv(os.path.join(out_dir, f"{label}.trades.csv"), index=False)
+    daily_df.to_csv(os.path.join(out_dir, f"{label}.daily.csv"), index=False)
+
+
+# ==============================
+# RUN
+# ==============================
+
+def run(start=None, end=None, out_dir=None, max_rss_mb=MAX_RSS_MB):
+    """
+    Chunked backtest over the screened days in [start, end] (YYYY-MM,
+    inclusive). Resumes from out_dir/state.npz when present.
+
+    Returns:
+        (out_dir, chunks DataFrame)
+    """
+    out_dir = out_dir or os.path.join(OUTPUT_DIR, f"chunked_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+    os.makedirs(out_dir, exist_ok=True)
+    state_path = os.path.join(out_dir, STATE_FILE)
+    state = load_state(state_path) if os.path.exists(state_path) else new_state()
+    if state["chunks"]:
+        print(f"♻️ Resuming after {state['done_through']} ({len(state['chunks'])} chunks done)")
+
+    budget = MemoryBudget(max_rss_mb)
+    phase2_df = phase3.load_phase2()
+    nsei = phase3.load_nsei_5m()
+
+    month = pd.Series([pd.Timestamp(d).strftime("%Y-%m") for d in phase2_df["Date"]], index=phase2_df.index)
+    in_range = (month >= (start or "")) & (month <= (end or "9999-99"))
+    dates = sorted(d for d in phase2_df.loc[in_range, "Date"].unique()
+                   if state["done_through"] is None or str(d) > state["done_through"])
+
+    sizes = input_sizes(phase2_df[phase2_df["Date"].isin(dates)])
+    baseline = rss_mb() or 0.0
+    queue = plan_chunks(sizes, dates, max(max_rss_mb - baseline, 1.0), state["factor"])
+    print(f"🗓️ {len(dates)} screened days → {len(queue)} chunks (budget {max_rss_mb} MB, baseline {baseline:.0f} MB)")
+
+    rows = []
+    while queue:
+        chunk = queue.pop(0)
+        label = f"{chunk[0]}_{chunk[-1]}"
+        t0 = _time.time()
+        before = rss_mb() or 0.0
+        budget.peak_mb = before
+        try:
+            entries, trade_log_df, daily_df, updates, candles = run_chunk(chunk, phase2_df, nsei, state, budget)
+        except ChunkOverBudget as e:
+            gc.collect()
+            if len(chunk) == 1:
+                raise MemoryError(f"❌ Single day {chunk[0]} exceeds MAX_RSS_MB={max_rss_mb} ({e})")
+            half = len(chunk) // 2
+            queue[:0] = [chunk[:half], chunk[half:]]
+            print(f"✂️ {label} over budget ({e}) → re-running as {half} + {len(chunk) - half} days")
+            continue
+
+        # Results first, then the checkpoint that makes them part of the run
+        write_chunk(out_dir, label, entries, trade_log_df, daily_df)
+        for symbol, (warm, atr_carry) in updates.items():
+            state["warmup"][symbol] = warm
+            state["atr"][symbol] = atr_carry
+        state["done_through"] = str(chunk[-1])
+        state["chunks"].append(label)
+        used = sum(sizes.get(d, 0.0) for d in chunk)
+        if used > 0 and budget.peak_mb > before:
+            state["factor"] = max(state["factor"], (budget.peak_mb - before) / used)
+        save_state(state, state_path)
+
+        filled = trade_log_df[trade_log_df["Quantity"] > 0]
+        rows.append({
+            "Chunk": label, "Days": len(chunk), "Symbols": len(updates), "Candles": candles,
+            "Entries": len(entries), "Filled": len(filled),
+            "NetP&L": round(float(filled["FinalProfit"].sum()), 2),
+            "PeakRSS_MB": round(budget.peak_mb, 1), "Seconds": round(_time.time() - t0, 2),
+        })
+        print(f"✅ {label}: {len(entries)} entries, {len(filled)} filled, ₹{rows[-1]['NetP&L']:,.2f} "
+              f"(peak {budget.peak_mb:.0f} MB, {rows[-1]['Seconds']:.1f}s)")
+        del entries, trade_log_df, daily_df, updates
+        gc.collect()
+
+    chunks_df = pd.DataFrame(rows, columns=CHUNK_COLUMNS)
+    chunks_path = os.path.join(out_dir, "chunks.csv")
+    chunks_df.to_csv(chunks_path, mode="a", header=not os.path.exists(chunks_path), index=False)
+    return out_dir, chunks_df
+
+
+def combine_daily(out_dir):
+    """Daily summaries of every committed chunk → one frame (small: one row per day)."""
+    state = load_state(os.path.join(out_dir, STATE_FILE))
+    frames = [pd.read_csv(os.path.join(out_dir, f"{label}.daily.csv")) for label in state["chunks"]]
+    frames = [f for f in frames if len(f)]
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=portfolio_backtest.DAILY_COLUMNS)
+
+
+def main():
+    args = sys.argv[1:]
+    out_dir = None
+    if "--resume" in args:
+        i = args.index("--resume")
+        out_dir = args[i + 1]
+        args = args[:i] + args[i + 2:]
+    start = args[0] if len(args) > 0 else None
+    end = args[1] if len(args) > 1 else None
+
+    t0 = _time.time()
+    out_dir, chunks_df = run(start, end, out_dir)
+
+    daily_df = combine_daily(out_dir)
+    daily_df.to_csv(os.path.join(out_dir, "daily_summary.csv"), index=False)
+    pnl = daily_df["DailyP&L"].to_numpy(dtype=float)
+    print(f"\n📊 {len(daily_df)} trading days, total P&L ₹{pnl.sum():,.2f}, "
+          f"max drawdown ₹{param_sweep.max_drawdown(pnl):,.2f}")
+    if len(chunks_df):
+        print(f"🧠 Peak RSS {chunks_df['PeakRSS_MB'].max():.0f} MB over {len(chunks_df)} chunks")
+    print(f"⏱️ {_time.time() - t0:.1f}s → {out_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+ENGINE METRICS
+--------------
+• Fixed-bucket latency histogram (cheap enough to observe every tick)
+• Percentile estimates + one-line summary for console logs
+"""
+
+import bisect
+import threading
+
+# Bucket upper bounds in milliseconds (last bucket is open-ended)
+DEFAULT_BUCKETS_MS = [1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000]
+
+
+class LatencyHistogram:
+    """Thread-safe latency histogram with fixed millisecond buckets."""
+
+    def __init__(self, name, buckets_ms=None):
+        self.name = name
+        self.buckets_ms = list(buckets_ms or DEFAULT_BUCKETS_MS)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.counts = [0] * (len(self.buckets_ms) + 1)
+            self.count = 0
+            self.total_ms = 0.0
+            self.max_ms = 0.0
+
+    def observe(self, seconds):
+        """Record one sample (in seconds)."""
+        ms = seconds * 1000.0
+        with self._lock:
+            self.counts[bisect.bisect_left(self.buckets_ms, ms)] += 1
+            self.count += 1
+            self.total_ms += ms
+            if ms > self.max_ms:
+                self.max_ms = ms
+
+    def percentile(self, p):
+        """Upper bucket bound (ms) containing the p-th percentile."""
+        with self._lock:
+            if self.count == 0:
+                return 0.0
+            rank = p / 100.0 * self.count
+            seen = 0
+            for i, c in enumerate(self.counts):
+                seen += c
+                if seen >= rank:
+                    return float(self.buckets_ms[i]) if i < len(self.buckets_ms) else self.max_ms
+            return self.max_ms
+
+    def summary(self):
+        """Return dict with count, mean, p50/p95/p99, max and raw buckets."""
+        mean = self.total_ms / self.count if self.count else 0.0
+        labels = [f"<={b}ms" for b in self.buckets_ms] + [f">{self.buckets_ms[-1]}ms"]
+        return {
+            "name": self.name,
+            "count": self.count,
+            "mean_ms": round(mean, 2),
+            "p50_ms": self.percentile(50),
+            "p95_ms": self.percentile(95),
+            "p99_ms": self.percentile(99),
+            "max_ms": round(self.max_ms, 2),
+            "buckets": dict(zip(labels, list(self.counts))),
+        }
+
+    def format(self):
+        s = self.summary()
+        return (
+            f"📊 {s['name']}: n={s['count']} mean={s['mean_ms']}ms "
+            f"p50≤{s['p50_ms']}ms p95≤{s['p95_ms']}ms p99≤{s['p99_ms']}ms max={s['max_ms']}ms"
+        )
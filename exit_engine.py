@@ -0,0 +1,717 @@
+"""
+PHASE-4 EXIT ENGINE
+-------------------
+• Single home of the 3-tier trailing stop (trailing_stop; element-wise
+  trailing_stops) used by the backtests, the live engine, the open-trade
+  tracker and the visualizer
+  (1R → breakeven + costs, 1.5R → lock 0.5R, 2R+ → trail 1R from high)
+• resolve_exit: one trade, vectorized over NumPy bar arrays (no iterrows)
+• simulate_trades: many trades at once over packed bar arrays — entry fill,
+  trailing tiers, target, force exit, same-bar open-distance tiebreak.
+  Compiled with Numba when installed, pure-NumPy fallback otherwise.
+  Each trade's fill bar is located with one searchsorted over the packed
+  times (first_bar_after) and the exit scan starts from that offset
+• simulate_trades_multires: simulate_trades on 5-minute bars, replaying only
+  the ambiguous exit bars (stop + target, or a stop the bar itself raised)
+  on lazily loaded 1-minute bars
+• Returns the same sell_price / sell_time / exit_reason as the old loops
+"""
+
+import numpy as np
+import pandas as pd
+from collections import namedtuple
+from datetime import time
+
+try:
+    from numba import njit
+    HAVE_NUMBA = True
+except ImportError:
+    HAVE_NUMBA = False
+
+# ==============================
+# CONFIG
+# ==============================
+
+COST_BUFFER_PCT = 0.001      # breakeven tier = entry + 0.1%
+
+# Trailing tiers in R multiples (batch kernel): breakeven trigger,
+# lock trigger, profit locked, trail trigger, trail distance
+TRAIL_TIERS = (1.0, 1.5, 0.5, 2.0, 1.0)
+
+ExitResult = namedtuple(
+    "ExitResult",
+    ["index", "price", "reason", "highest", "stop", "armed"],
+)
+
+
+# Reason codes used by the batch kernel (index → name)
+NO_EXIT, NO_EXIT_LASTCANDLE, STOP, STOP_PROFIT, TARGET, STOP_INTRABAR, TARGET_INTRABAR, TIME_EXIT = range(8)
+REASON_NAMES = [
+    "NO_EXIT", "NO_EXIT_LASTCANDLE", "TRAILING_STOP", "TRAILING_STOP_PROFIT",
+    "TARGET", "TRAILING_STOP_INTRABAR", "TARGET_INTRABAR", "TIME_EXIT_1510",
+]
+REASON_CODES = {name: code for code, name in enumerate(REASON_NAMES)}
+
+
+def trailing_stop(entry_price, initial_stop, current_high, current_stop):
+    """
+    Calculate trailing stop-loss based on 3-tier R-multiple strategy:
+    - 1R: Move to breakeven + costs
+    - 1.5R: Lock 0.5R profit
+    - 2R+: Trail by 1R distance from high
+    """
+    R = entry_price - initial_stop
+    cost_buffer = entry_price * COST_BUFFER_PCT
+
+    new_stop = current_stop
+
+    if current_high >= entry_price + R:
+        new_stop = max(new_stop, entry_price + cost_buffer)
+
+    if current_high >= entry_price + (1.5 * R):
+        new_stop = max(new_stop, entry_price + (0.5 * R))
+
+    if current_high >= entry_price + (2.0 * R):
+        new_stop = max(new_stop, current_high - R)
+
+    return new_stop
+
+
+def trailing_stops(entry_prices, initial_stops, current_highs, current_stops):
+    """trailing_stop element-wise over arrays of trades (same tiers)."""
+    entry = np.asarray(entry_prices, dtype=np.float64)
+    high = np.asarray(current_highs, dtype=np.float64)
+    R = entry - np.asarray(initial_stops, dtype=np.float64)
+
+    new_stop = np.array(current_stops, dtype=np.float64)
+    new_stop = np.where(high >= entry + R, np.maximum(new_stop, entry + entry * COST_BUFFER_PCT), new_stop)
+    new_stop = np.where(high >= entry + 1.5 * R, np.maximum(new_stop, entry + 0.5 * R), new_stop)
+    new_stop = np.where(high >= entry + 2.0 * R, np.maximum(new_stop, high - R), new_stop)
+    return new_stop
+
+
+def time_to_seconds(t):
+    """datetime.time → seconds since midnight."""
+    return t.hour * 3600 + t.minute * 60 + t.second
+
+
+def _tod_lookup(tods, fmt):
+    """Apply fmt once per distinct second-of-day and broadcast back."""
+    tods = np.asarray(tods, dtype=np.int64)
+    uniq, inv = np.unique(tods, return_inverse=True)
+    lookup = np.empty(len(uniq), dtype=object)
+    lookup[:] = [fmt(s) for s in uniq.tolist()]
+    return lookup[inv.reshape(-1)]
+
+
+def seconds_to_times(tods):
+    """Seconds since midnight → datetime.time object array (negative → None)."""
+    return _tod_lookup(tods, lambda s: time(s // 3600, s // 60 % 60, s % 60) if s >= 0 else None)
+
+
+def seconds_to_strings(tods):
+    """Seconds since midnight → 'HH:MM:SS' object array (negative → '')."""
+    return _tod_lookup(tods, lambda s: f"{s // 3600:02d}:{s // 60 % 60:02d}:{s % 60:02d}" if s >= 0 else "")
+
+
+def first_bar_after(tods, starts, ends, after_tods):
+    """
+    Index of the first bar with tod > after_tods per [start, end) slice
+    (end when none), for every trade at once.
+
+    Each slice is time-sorted, so the packed tods split into ascending runs;
+    searchsorted on run * span + tod finds all offsets in one call.
+    """
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.asarray(ends, dtype=np.int64)
+    out = ends.copy()
+    nonempty = ends > starts
+    if len(tods) == 0 or not nonempty.any():
+        return out
+    tods = np.asarray(tods, dtype=np.int64)
+    lo = tods.min()
+    span = tods.max() - lo + 2
+    run = np.concatenate([[0], np.cumsum(tods[1:] < tods[:-1])])
+    keys = run * span + (tods - lo)
+
+    s = starts[nonempty]
+    after = np.clip(np.asarray(after_tods, dtype=np.int64)[nonempty] - lo, -1, span - 2)
+    pos = np.searchsorted(keys, run[s] * span + after, side="right")
+    out[nonempty] = np.clip(pos, s, ends[nonempty])
+    return out
+
+
+def frame_bars(mdf):
+    """
+    All bars of a candle frame (lowercase open/high/low/close + parsed
+    'datetime'), sorted, rows without a timestamp dropped.
+
+    Returns:
+        (opens, highs, lows, closes, tods, times) — times are datetime.time
+    """
+    return post_entry_bars(mdf, None)
+
+
+def post_entry_bars(mdf, after_time):
+    """
+    Bars strictly after `after_time` from a sorted candle frame with
+    lowercase open/high/low/close columns and a parsed 'datetime' column.
+
+    Returns:
+        (opens, highs, lows, closes, tods, times) — times are datetime.time
+    """
+    mdf = mdf[mdf["datetime"].notna()]
+    dt = mdf["datetime"]
+    tods = (dt.dt.hour * 3600 + dt.dt.minute * 60 + dt.dt.second).to_numpy(dtype=np.int64)
+    keep = tods > (-1 if after_time is None else time_to_seconds(after_time))
+
+    def col(name):
+        if name not in mdf.columns:
+            return np.full(int(keep.sum()), np.nan)
+        return pd.to_numeric(mdf[name], errors="coerce").to_numpy(dtype=np.float64)[keep]
+
+    times = dt.dt.time.to_numpy()[keep]
+    return col("open"), col("high"), col("low"), col("close"), tods[keep], times
+
+
+def tier_stops(entry_price, initial_stop, highs, start_high=None):
+    """
+    Trailing stop after each bar, vectorized.
+
+    Every tier is non-decreasing in the running-max high, so the stop after
+    bar i is just the tiers evaluated on max(start_high, highs[:i+1]) —
+    identical to calling trailing_stop on each new high.
+    start_high defaults to the entry price.
+
+    Returns:
+        (running_high, stops) arrays aligned with highs
+    """
+    R = entry_price - initial_stop
+    cost_buffer = entry_price * COST_BUFFER_PCT
+
+    start_high = entry_price if start_high is None else start_high
+    if np.isnan(start_high):
+        # NaN start (e.g. NaN fill open) never compares greater → stop never moves
+        running_high = np.full(len(highs), np.nan)
+    else:
+        running_high = np.fmax.accumulate(np.fmax(highs, start_high))
+    # The stop is only recalculated once a bar makes a new high
+    moved = running_high > start_high
+
+    stops = np.full(len(highs), float(initial_stop))
+    stops = np.where(moved & (running_high >= entry_price + R), np.maximum(stops, entry_price + cost_buffer), stops)
+    stops = np.where(moved & (running_high >= entry_price + 1.5 * R), np.maximum(stops, entry_price + 0.5 * R), stops)
+    stops = np.where(moved & (running_high >= entry_price + 2.0 * R), np.maximum(stops, running_high - R), stops)
+    return running_high, stops
+
+
+def resolve_exit(opens, highs, lows, closes, tods, buy_price, stop, target,
+                 force_exit_tod, stop_reason="TRAILING_STOP", start_high=None):
+    """
+    Resolve the exit of one long trade over its post-entry bars.
+
+    Args:
+        opens, highs, lows, closes: float arrays of bars strictly after entry
+        tods: int array, bar time-of-day in seconds
+        buy_price, stop, target: trade levels (stop = initial stop)
+        force_exit_tod: force-exit time-of-day in seconds
+        stop_reason: reason for a stop at/below entry ("TRAILING_STOP" in
+                     the 5m backtest, "STOP_LOSS" in the 1m backtest)
+        start_high: high to trail from (defaults to buy_price)
+
+    Returns:
+        ExitResult(index, price, reason, highest, stop, armed); index is the
+        exit bar (-1 when there are no bars / no usable close)
+    """
+    start_high = buy_price if start_high is None else start_high
+    n = len(highs)
+    if n == 0:
+        return ExitResult(-1, buy_price, "NO_EXIT", start_high, stop, False)
+
+    running_high, stops = tier_stops(buy_price, stop, highs, start_high)
+
+    hit_stop = lows <= stops
+    hit_target = highs >= target
+    force = tods >= force_exit_tod
+
+    events = np.flatnonzero(hit_stop | hit_target | force)
+    if len(events) == 0:
+        k = n - 1
+        if np.isnan(closes[k]):
+            return ExitResult(-1, buy_price, "NO_EXIT", running_high[k], stops[k],
+                              _armed(buy_price, stop, start_high, running_high[k]))
+        return ExitResult(k, closes[k], "NO_EXIT_LASTCANDLE", running_high[k], stops[k],
+                          _armed(buy_price, stop, start_high, running_high[k]))
+
+    k = events[0]
+    s = stops[k]
+    if hit_stop[k] and hit_target[k]:
+        op = opens[k]
+        dist_stop = abs(op - s) if not np.isnan(op) else np.inf
+        dist_target = abs(op - target) if not np.isnan(op) else np.inf
+        if dist_stop <= dist_target:
+            price, reason = s, "TRAILING_STOP_INTRABAR"
+        else:
+            price, reason = target, "TARGET_INTRABAR"
+    elif hit_stop[k]:
+        price = s
+        reason = "TRAILING_STOP_PROFIT" if s > buy_price else stop_reason
+    elif hit_target[k]:
+        price, reason = target, "TARGET"
+    else:
+        price, reason = closes[k], "TIME_EXIT_1510"
+
+    return ExitResult(k, price, reason, running_high[k], s, _armed(buy_price, stop, start_high, running_high[k]))
+
+
+def _armed(buy_price, initial_stop, start_high, highest):
+    """1R trigger reached (only a new high above start_high can arm it)."""
+    return bool(highest > start_high and highest >= buy_price + (buy_price - initial_stop))
+
+
+# ==============================
+# BATCH KERNEL (MANY TRADES)
+# ==============================
+
+def pack_bars(bar_sets):
+    """
+    Concatenate per-trade bar tuples (opens, highs, lows, closes, tods, ...)
+    into flat arrays for simulate_trades.
+
+    Returns:
+        (opens, highs, lows, closes, tods), starts, ends
+    """
+    lengths = np.array([len(b[0]) for b in bar_sets], dtype=np.int64)
+    ends = np.cumsum(lengths)
+    starts = ends - lengths
+    if len(bar_sets) == 0 or ends[-1] == 0:
+        empty_f, empty_i = np.zeros(0), np.zeros(0, dtype=np.int64)
+        return (empty_f, empty_f, empty_f, empty_f, empty_i), starts, ends
+    packed = tuple(
+        np.concatenate([np.asarray(b[i], dtype=dtype) for b in bar_sets])
+        for i, dtype in enumerate([np.float64] * 4 + [np.int64])
+    )
+    return packed, starts, ends
+
+
+def _simulate_loop(opens, highs, lows, closes, tods, starts, ends, entry_tods, entry_prices,
+                   stops, targets, start_highs, start_stops, fill_next_open, force_exit_tod, cost_buffer_pct,
+                   be_r, lock_r, lock_profit_r, trail_r, trail_dist_r,
+                   out_fill_idx, out_fill_price, out_exit_idx, out_exit_price, out_reason,
+                   out_highest, out_stop, out_armed):
+    """Scalar kernel (Numba-compilable). Bars of each trade must be time-sorted."""
+    for j in range(len(starts)):
+        i = starts[j]
+        i1 = ends[j]
+        while i < i1 and tods[i] <= entry_tods[j]:
+            i += 1
+
+        buy = entry_prices[j]
+        fill = -1
+        if fill_next_open and i < i1:
+            fill = i
+            buy = opens[i]
+            fill_tod = tods[i]
+            while i < i1 and tods[i] <= fill_tod:
+                i += 1
+        out_fill_idx[j] = fill
+        out_fill_price[j] = buy
+
+        initial = stops[j]
+        target = targets[j]
+        R = buy - initial
+        cost_buffer = buy * cost_buffer_pct
+        start = start_highs[j]
+        if start != start:          # NaN → trail from the fill price
+            start = buy
+        high = start
+        cur = initial
+        if start_stops[j] > cur:    # resumed trade: stop already trailed (NaN compares False)
+            cur = start_stops[j]
+
+        exit_idx = -1
+        price = buy
+        reason = 0
+        last = -1
+
+        while i < i1:
+            h = highs[i]
+            lo = lows[i]
+            last = i
+
+            if h > high:
+                high = h
+                if high >= buy + be_r * R:
+                    cur = max(cur, buy + cost_buffer)
+                if high >= buy + lock_r * R:
+                    cur = max(cur, buy + lock_profit_r * R)
+                if high >= buy + trail_r * R:
+                    cur = max(cur, high - trail_dist_r * R)
+
+            hit_stop = lo <= cur
+            hit_target = h >= target
+
+            if hit_stop and hit_target:
+                op = opens[i]
+                dist_stop = abs(op - cur) if op == op else np.inf
+                dist_target = abs(op - target) if op == op else np.inf
+                if dist_stop <= dist_target:
+                    price = cur
+                    reason = 5
+                else:
+                    price = target
+                    reason = 6
+                exit_idx = i
+                break
+            if hit_stop:
+                price = cur
+                reason = 3 if cur > buy else 2
+                exit_idx = i
+                break
+            if hit_target:
+                price = target
+                reason = 4
+                exit_idx = i
+                break
+            if tods[i] >= force_exit_tod:
+                price = closes[i]
+                reason = 7
+                exit_idx = i
+                break
+            i += 1
+
+        if exit_idx == -1 and last >= 0 and closes[last] == closes[last]:
+            exit_idx = last
+            price = closes[last]
+            reason = 1
+
+        out_exit_idx[j] = exit_idx
+        out_exit_price[j] = price
+        out_reason[j] = reason
+        out_highest[j] = high
+        out_stop[j] = cur
+        out_armed[j] = high > start and high >= buy + be_r * R
+
+
+if HAVE_NUMBA:
+    _simulate_loop = njit(cache=True, nogil=True)(_simulate_loop)
+
+
+def _segment_first(mask, seg_starts, nonempty, total, last=False):
+    """First (or last) True index per segment, -1 if none."""
+    out = np.full(len(seg_starts), -1, dtype=np.int64)
+    if total == 0:
+        return out
+    pos = np.arange(total, dtype=np.int64)
+    if last:
+        red = np.maximum.reduceat(np.where(mask, pos, -1), seg_starts[nonempty])
+        out[nonempty] = red
+    else:
+        red = np.minimum.reduceat(np.where(mask, pos, total), seg_starts[nonempty])
+        out[nonempty] = np.where(red < total, red, -1)
+    return out
+
+
+def _simulate_numpy(opens, highs, lows, closes, tods, starts, ends, entry_tods, entry_prices,
+                    stops, targets, start_highs, start_stops, fill_next_open, force_exit_tod, cost_buffer_pct,
+                    be_r, lock_r, lock_profit_r, trail_r, trail_dist_r,
+                    out_fill_idx, out_fill_price, out_exit_idx, out_exit_price, out_reason,
+                    out_highest, out_stop, out_armed):
+    """
+    Fallback without Numba: every trade at once with array ops.
+    Segment-wise running max via groupby-cummax, first hits via reduceat.
+    """
+    n = len(starts)
+    lengths = ends - starts
+    nonempty = lengths > 0
+    # Bars may be shared/overlapping between trades → gather each trade's copy
+    idx = np.concatenate([np.arange(a, b) for a, b in zip(starts, ends)]) if n else np.zeros(0, dtype=np.int64)
+    total = len(idx)
+    seg = np.repeat(np.arange(n), lengths)
+    seg_starts = np.concatenate([[0], np.cumsum(lengths)[:-1]]).astype(np.int64) if n else np.zeros(0, dtype=np.int64)
+
+    o, h, l, c, t = opens[idx], highs[idx], lows[idx], closes[idx], tods[idx]
+    active = t > entry_tods[seg]
+
+    buy = entry_prices.astype(np.float64).copy()
+    fill = np.full(n, -1, dtype=np.int64)
+    if fill_next_open:
+        first = _segment_first(active, seg_starts, nonempty, total)
+        has = first >= 0
+        fill[has] = idx[first[has]]
+        buy[has] = o[first[has]]
+        fill_tod = np.full(n, np.iinfo(np.int64).min)
+        fill_tod[has] = t[first[has]]
+        active &= t > np.where(has, fill_tod, entry_tods)[seg]
+    out_fill_idx[:] = fill
+    out_fill_price[:] = buy
+
+    start = np.where(np.isnan(start_highs), buy, start_highs)
+    R = buy - stops
+    b_seg, s_seg, R_seg = buy[seg], start[seg], R[seg]
+
+    # Running high since entry, never below the start value (inactive / NaN bars contribute it)
+    vals = np.where(active & ~np.isnan(h), np.maximum(h, s_seg), s_seg)
+    run = pd.Series(vals).groupby(seg).cummax().to_numpy() if total else vals
+    run = np.where(np.isnan(s_seg), np.nan, run)
+    moved = run > s_seg
+
+    seed = np.fmax(stops, start_stops)
+    cur = seed[seg]
+    cur = np.where(moved & (run >= b_seg + be_r * R_seg), np.maximum(cur, b_seg + b_seg * cost_buffer_pct), cur)
+    cur = np.where(moved & (run >= b_seg + lock_r * R_seg), np.maximum(cur, b_seg + lock_profit_r * R_seg), cur)
+    cur = np.where(moved & (run >= b_seg + trail_r * R_seg), np.maximum(cur, run - trail_dist_r * R_seg), cur)
+
+    hit_stop = active & (l <= cur)
+    hit_target = active & (h >= targets[seg])
+    force = active & (t >= force_exit_tod)
+    k = _segment_first(hit_stop | hit_target | force, seg_starts, nonempty, total)
+    last = _segment_first(active, seg_starts, nonempty, total, last=True)
+
+    reason = np.zeros(n, dtype=np.int64)
+    price = buy.copy()
+    exit_pos = np.full(n, -1, dtype=np.int64)
+
+    ev = k >= 0
+    ke = k[ev]
+    s_k, tg = cur[ke], targets[ev]
+    both = hit_stop[ke] & hit_target[ke]
+    op = o[ke]
+    d_stop = np.where(np.isnan(op), np.inf, np.abs(op - s_k))
+    d_tgt = np.where(np.isnan(op), np.inf, np.abs(op - tg))
+    r = np.select(
+        [both & (d_stop <= d_tgt), both, hit_stop[ke] & (s_k > buy[ev]), hit_stop[ke], hit_target[ke]],
+        [STOP_INTRABAR, TARGET_INTRABAR, STOP_PROFIT, STOP, TARGET],
+        TIME_EXIT,
+    )
+    reason[ev] = r
+    price[ev] = np.select(
+        [np.isin(r, [STOP_INTRABAR, STOP_PROFIT, STOP]), np.isin(r, [TARGET_INTRABAR, TARGET])],
+        [s_k, tg],
+        c[ke],
+    )
+    exit_pos[ev] = ke
+
+    tail = ~ev & (last >= 0)
+    lt = last[tail]
+    ok = ~np.isnan(c[lt])
+    tail_ok = np.flatnonzero(tail)[ok]
+    reason[tail_ok] = NO_EXIT_LASTCANDLE
+    price[tail_ok] = c[lt[ok]]
+    exit_pos[tail_ok] = lt[ok]
+
+    # State at the exit bar (or last active bar / entry when there is none)
+    state_pos = np.where(exit_pos >= 0, exit_pos, last)
+    has_state = state_pos >= 0
+    highest = start.copy()
+    stop_now = seed.copy()
+    highest[has_state] = run[state_pos[has_state]]
+    stop_now[has_state] = cur[state_pos[has_state]]
+
+    out_exit_idx[:] = np.where(exit_pos >= 0, idx[np.maximum(exit_pos, 0)] if total else -1, -1)
+    out_exit_price[:] = price
+    out_reason[:] = reason
+    out_highest[:] = highest
+    out_stop[:] = stop_now
+    out_armed[:] = (highest > start) & (highest >= buy + be_r * R)
+
+
+def simulate_trades(bars, starts, ends, entry_tods, entry_prices, stops, targets, force_exit_tod,
+                    fill_next_open=False, start_highs=None, stop_reason="TRAILING_STOP",
+                    tiers=TRAIL_TIERS, cost_buffer_pct=COST_BUFFER_PCT, start_stops=None):
+    """
+    Simulate many long trades over packed bar arrays.
+
+    Args:
+        bars: (opens, highs, lows, closes, tods) flat arrays (see pack_bars)
+        starts, ends: per-trade [start, end) slice into the bar arrays
+        entry_tods: signal time-of-day (s); only bars strictly after it count
+        entry_prices: entry price (used as-is unless fill_next_open)
+        stops, targets: initial stop / target per trade
+        force_exit_tod: force-exit time-of-day (s)
+        fill_next_open: fill at the OPEN of the first bar after the signal
+                        (Model A1) and check exits strictly after that bar
+        start_highs: high to trail from per trade (NaN / None → fill price)
+        stop_reason: name for a stop hit at/below entry
+        tiers: trailing tiers in R (see TRAIL_TIERS), for parameter sweeps
+        cost_buffer_pct: breakeven tier offset above entry
+        start_stops: stop already trailed to per trade, for resuming a trade
+                     mid-path (NaN / None → initial stop)
+
+    Returns:
+        dict of arrays: fill_idx, fill_price, exit_idx, exit_price, reason
+        (names), highest, stop, armed — indexes are into the packed bars
+    """
+    opens, highs, lows, closes, tods = bars
+    n = len(starts)
+    as_f = lambda x: np.ascontiguousarray(x, dtype=np.float64)
+    # Skip each trade's pre-signal bars up front: both kernels start at the fill bar
+    starts = first_bar_after(tods, starts, ends, entry_tods)
+    start_highs = np.full(n, np.nan) if start_highs is None else as_f(start_highs)
+    start_stops = np.full(n, np.nan) if start_stops is None else as_f(start_stops)
+
+    out = {
+        "fill_idx": np.full(n, -1, dtype=np.int64),
+        "fill_price": np.zeros(n),
+        "exit_idx": np.full(n, -1, dtype=np.int64),
+        "exit_price": np.zeros(n),
+        "reason": np.zeros(n, dtype=np.int64),
+        "highest": np.zeros(n),
+        "stop": np.zeros(n),
+        "armed": np.zeros(n, dtype=np.bool_),
+    }
+    kernel = _simulate_loop if HAVE_NUMBA else _simulate_numpy
+    kernel(
+        as_f(opens), as_f(highs), as_f(lows), as_f(closes), np.ascontiguousarray(tods, dtype=np.int64),
+        np.asarray(starts, dtype=np.int64), np.asarray(ends, dtype=np.int64),
+        np.asarray(entry_tods, dtype=np.int64), as_f(entry_prices), as_f(stops), as_f(targets),
+        start_highs, start_stops, bool(fill_next_open), int(force_exit_tod), float(cost_buffer_pct),
+        *(float(x) for x in tiers),
+        out["fill_idx"], out["fill_price"], out["exit_idx"], out["exit_price"], out["reason"],
+        out["highest"], out["stop"], out["armed"],
+    )
+
+    names = np.array(REASON_NAMES, dtype=object)
+    names[STOP] = stop_reason
+    out["reason"] = names[out["reason"]]
+    return out
+
+
+# ==============================
+# MULTI-RESOLUTION (DRILL-DOWN)
+# ==============================
+
+NEVER_TOD = 10**9               # force-exit time that no bar reaches
+
+
+def _fine_window(fine, lo_tod, hi_tod):
+    """Fine bars with lo_tod ≤ tod < hi_tod (fine tods sorted)."""
+    a, b = np.searchsorted(fine[4], [lo_tod, hi_tod])
+    return tuple(np.asarray(x)[a:b] for x in fine[:5])
+
+
+def simulate_trades_multires(bars, starts, ends, entry_tods, entry_prices, stops, targets, force_exit_tod,
+                             fine_bars, bar_seconds=300, fill_next_open=False, start_highs=None,
+                             stop_reason="TRAILING_STOP", tiers=TRAIL_TIERS, cost_buffer_pct=COST_BUFFER_PCT):
+    """
+    simulate_trades on coarse bars, re-resolving only the ambiguous exit bars
+    on finer bars.
+
+    A coarse exit bar is ambiguous when stop and target are both inside it,
+    or when it hits a stop that the same bar's high just raised (the low may
+    have come first). Those bars are replayed on fine_bars(j) — loaded
+    lazily — from the trade's state before the bar. If the fine bars show no
+    exit, the trade continues on the coarse bars after it (and may drill
+    again). Trades without fine data keep the coarse result.
+
+    Args:
+        fine_bars: callable(j) → (opens, highs, lows, closes, tods, ...) for
+                   trade j's day at the finer resolution, or None
+        bar_seconds: coarse bar length (s)
+        (others as simulate_trades)
+
+    Returns:
+        simulate_trades dict (exit_idx is the coarse bar holding the exit)
+        plus exit_tod (exact exit time-of-day, -1 if none) and drilled
+        (bool, exit resolved on fine bars)
+    """
+    kw = dict(stop_reason=stop_reason, tiers=tiers, cost_buffer_pct=cost_buffer_pct)
+    opens, highs, lows, closes, tods = bars
+    tods = np.asarray(tods, dtype=np.int64)
+    closes = np.asarray(closes, dtype=np.float64)
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.asarray(ends, dtype=np.int64)
+    stops = np.asarray(stops, dtype=np.float64)
+    targets = np.asarray(targets, dtype=np.float64)
+    n = len(starts)
+    start_highs = np.full(n, np.nan) if start_highs is None else np.asarray(start_highs, dtype=np.float64)
+
+    out = simulate_trades(bars, starts, ends, entry_tods, entry_prices, stops, targets, force_exit_tod,
+                          fill_next_open=fill_next_open, start_highs=start_highs, **kw)
+    out["exit_tod"] = np.where(out["exit_idx"] >= 0, tods[np.maximum(out["exit_idx"], 0)], -1)
+    out["drilled"] = np.zeros(n, dtype=np.bool_)
+    buy = out["fill_price"]
+    orig_start = np.where(np.isnan(start_highs), buy, start_highs)
+    stop_names = [stop_reason, "TRAILING_STOP_PROFIT"]
+    both_names = ["TRAILING_STOP_INTRABAR", "TARGET_INTRABAR"]
+
+    # Current coarse pass: trades, their pass arguments and result
+    idx = np.arange(n)
+    p_tods = np.asarray(entry_tods, dtype=np.int64)
+    p_prices = np.asarray(entry_prices, dtype=np.float64)
+    p_fill, p_highs, p_stops = fill_next_open, start_highs, np.full(n, np.nan)
+    res = out
+
+    while len(idx):
+        k = res["exit_idx"]
+        both = np.isin(res["reason"], both_names)
+        stopped = np.isin(res["reason"], stop_names)
+        c = np.flatnonzero((k >= 0) & (both | stopped))
+        if len(c) == 0:
+            break
+
+        # State before the exit bar: the same pass replayed up to it
+        before = simulate_trades(bars, starts[idx[c]], k[c], p_tods[c], p_prices[c], stops[idx[c]], targets[idx[c]],
+                                 force_exit_tod, fill_next_open=p_fill, start_highs=p_highs[c],
+                                 start_stops=p_stops[c], **kw)
+        amb = both[c] | (stopped[c] & (res["stop"][c] > before["stop"]))
+        c, h_before, s_before = c[amb], before["highest"][amb], before["stop"][amb]
+
+        # Lazily load fine bars for the ambiguous bars only
+        sel, windows = [], []
+        for i, t in enumerate(c):
+            fine = fine_bars(idx[t])
+            if fine is None:
+                continue
+            bar_tod = tods[k[t]]
+            w = _fine_window(fine, bar_tod, bar_tod + bar_seconds)
+            if len(w[0]):
+                sel.append(i)
+                windows.append(w)
+        if not sel:
+            break
+        sel = np.array(sel)
+        c, h_before, s_before = c[sel], h_before[sel], s_before[sel]
+        g, kc = idx[c], k[c]
+
+        fpacked, fstarts, fends = pack_bars(windows)
+        fine_sim = simulate_trades(fpacked, fstarts, fends, tods[kc] - 1, buy[g], stops[g], targets[g], NEVER_TOD,
+                                   start_highs=h_before, start_stops=s_before, **kw)
+        exited = ~np.isin(fine_sim["reason"], ["NO_EXIT", "NO_EXIT_LASTCANDLE"])
+        out["drilled"][g] = True
+
+        # Exit inside the bar, at fine resolution
+        e = np.flatnonzero(exited)
+        for key in ("exit_price", "reason", "highest", "stop"):
+            out[key][g[e]] = fine_sim[key][e]
+        out["exit_idx"][g[e]] = kc[e]
+        out["exit_tod"][g[e]] = fpacked[4][fine_sim["exit_idx"][e]]
+
+        # No exit inside the bar: force exit at its close, or continue after it
+        rest = np.flatnonzero(~exited)
+        forced = rest[tods[kc[rest]] >= force_exit_tod]
+        out["exit_idx"][g[forced]] = kc[forced]
+        out["exit_price"][g[forced]] = closes[kc[forced]]
+        out["reason"][g[forced]] = REASON_NAMES[TIME_EXIT]
+        out["exit_tod"][g[forced]] = tods[kc[forced]]
+        out["highest"][g[forced]] = fine_sim["highest"][forced]
+        out["stop"][g[forced]] = fine_sim["stop"][forced]
+
+        cont = rest[tods[kc[rest]] < force_exit_tod]
+        idx, kc = g[cont], kc[cont]
+        p_tods, p_prices, p_fill = tods[kc], buy[idx], False
+        p_highs, p_stops = fine_sim["highest"][cont], fine_sim["stop"][cont]
+        res = simulate_trades(bars, starts[idx], ends[idx], p_tods, p_prices, stops[idx], targets[idx],
+                              force_exit_tod, start_highs=p_highs, start_stops=p_stops, **kw)
+        # Ambiguous bar was the last one: it closes the trade, as on coarse bars
+        last = (res["exit_idx"] < 0) & (kc == ends[idx] - 1) & ~np.isnan(closes[kc])
+        res["exit_idx"][last] = kc[last]
+        res["exit_price"][last] = closes[kc[last]]
+        res["reason"][last] = REASON_NAMES[NO_EXIT_LASTCANDLE]
+        for key in ("exit_idx", "exit_price", "reason", "highest", "stop"):
+            out[key][idx] = res[key]
+        out["exit_tod"][idx] = np.where(res["exit_idx"] >= 0, tods[np.maximum(res["exit_idx"], 0)], -1)
+
+    R = buy - stops
+    out["armed"] = (out["highest"] > orig_start) & (out["highest"] >= buy + tiers[0] * R)
+    return out
@@ -0,0 +1,313 @@
+"""
+HISTORICAL CANDLE CACHE
+-----------------------
+• Read-through cache for broker historical_data requests
+• Keyed by (instrument_token, interval, day) — one file per closed session
+• Closed sessions are immutable → served from disk
+• Today's open session always goes to the API
+• Size-based LRU eviction + hit/miss stats
+• Can be pre-warmed from the EOD data store (downloaded_data/5min)
+"""
+
+import os
+import threading
+import numpy as np
+import pandas as pd
+from datetime import datetime, date, timedelta
+
+# ==============================
+# CONFIG
+# ==============================
+
+CACHE_DIR = "cache/history"
+MAX_CACHE_MB = 512
+EOD_DATA_DIR = "downloaded_data/5min"
+TOKEN_FILE = "data/nifty_500_with_tokens.csv"
+
+OHLCV = ["open", "high", "low", "close", "volume"]
+
+
+def _to_naive(ts):
+    """Kite returns tz-aware datetimes (or strings); cache keys are naive."""
+    if isinstance(ts, str):
+        ts = pd.to_datetime(ts)
+    if isinstance(ts, pd.Timestamp):
+        ts = ts.to_pydatetime()
+    return ts.replace(tzinfo=None)
+
+
+class HistoryCache:
+    """On-disk read-through cache of intraday candles, one file per day."""
+
+    def __init__(self, root=CACHE_DIR, max_bytes=MAX_CACHE_MB * 1024 * 1024):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._index = None   # path → (size, last_access)
+        self.stats = {
+            "hits": 0,          # closed days served from disk
+            "misses": 0,        # closed days that had to be fetched
+            "api_calls": 0,
+            "live_calls": 0,    # calls for today's open session
+            "writes": 0,
+            "evictions": 0,
+        }
+
+    # ------------------------------
+    # PATHS & INDEX
+    # ------------------------------
+
+    def _day_path(self, token, interval, day):
+        return os.path.join(self.root, interval, str(token), f"{day.isoformat()}.npz")
+
+    def _load_index(self):
+        if self._index is not None:
+            return
+        self._index = {}
+        if not os.path.isdir(self.root):
+            return
+        for dirpath, _, files in os.walk(self.root):
+            for name in files:
+                if name.endswith(".npz"):
+                    path = os.path.join(dirpath, name)
+                    st = os.stat(path)
+                    self._index[path] = (st.st_size, st.st_mtime)
+
+    def total_bytes(self):
+        with self._lock:
+            self._load_index()
+            return sum(size for size, _ in self._index.values())
+
+    # ------------------------------
+    # DAY FILE IO
+    # ------------------------------
+
+    def _read_day(self, path):
+        with np.load(path, allow_pickle=False) as f:
+            times = f["datetime"]
+            values = f["values"]
+        now = datetime.now().timestamp()
+        os.utime(path, (now, now))
+        self._index[path] = (self._index[path][0], now)
+
+        stamps = pd.to_datetime(times).to_pydatetime()
+        return [
+            {"date": stamps[i], "open": v[0], "high": v[1], "low": v[2], "close": v[3], "volume": v[4]}
+            for i, v in enumerate(values.tolist())
+        ]
+
+    def _write_day(self, path, candles):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        times = np.array(
+            [np.datetime64(_to_naive(c["date"]), "ns") for c in candles], dtype="datetime64[ns]"
+        ).astype(np.int64)
+        values = np.array([[c[k] for k in OHLCV] for c in candles], dtype=np.float64).reshape(-1, len(OHLCV))
+
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, datetime=times, values=values)
+        os.replace(tmp_path, path)
+
+        self._index[path] = (os.path.getsize(path), datetime.now().timestamp())
+        self.stats["writes"] += 1
+
+    def _evict(self):
+        total = sum(size for size, _ in self._index.values())
+        if total <= self.max_bytes:
+            return
+        # Least recently used first
+        for path, (size, _) in sorted(self._index.items(), key=lambda kv: kv[1][1]):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            self._index.pop(path, None)
+            total -= size
+            self.stats["evictions"] += 1
+
+    # ------------------------------
+    # READ-THROUGH FETCH
+    # ------------------------------
+
+    def fetch(self, fetcher, token, from_date, to_date, interval="5minute"):
+        """
+        Return candles in [from_date, to_date], serving closed days from disk.
+
+        Args:
+            fetcher: callable(token, from_date, to_date, interval) → list of
+                     Kite-style candle dicts. Must RAISE on API errors so that
+                     failures are never cached as empty sessions.
+            token: instrument_token
+            from_date, to_date: datetimes bounding the request
+            interval: Kite interval string
+
+        Returns:
+            List of candle dicts (date, open, high, low, close, volume), sorted
+        """
+        from_date = _to_naive(from_date)
+        to_date = _to_naive(to_date)
+        today = date.today()
+
+        days = []
+        d = from_date.date()
+        while d <= to_date.date():
+            days.append(d)
+            d += timedelta(days=1)
+
+        closed = [d for d in days if d < today]
+        by_date = {}
+
+        with self._lock:
+            self._load_index()
+
+            cached = {d for d in closed if self._day_path(token, interval, d) in self._index}
+            missing = [d for d in closed if d not in cached]
+            self.stats["hits"] += len(cached)
+            self.stats["misses"] += len(missing)
+
+            # Read now: another caller may evict these while we fetch
+            for d in cached:
+                by_date[d] = self._read_day(self._day_path(token, interval, d))
+
+        # One API call per contiguous run of missing closed days
+        runs = []
+        for d in missing:
+            if runs and (d - runs[-1][-1]).days == 1:
+                runs[-1].append(d)
+            else:
+                runs.append([d])
+
+        # The Kite call runs without the lock: a slow request must not stall
+        # other symbols' lookups, report() or prewarm_from_eod()
+        for run in runs:
+            start = datetime.combine(run[0], datetime.min.time())
+            end = datetime.combine(run[-1], datetime.max.time().replace(microsecond=0))
+            data = fetcher(token, start, end, interval)
+
+            by_day = {d: [] for d in run}
+            for c in data:
+                c = {**c, "date": _to_naive(c["date"])}
+                by_day.setdefault(c["date"].date(), []).append(c)
+
+            with self._lock:
+                self.stats["api_calls"] += 1
+                for d in run:
+                    path = self._day_path(token, interval, d)
+                    self._write_day(path, by_day[d])
+                    by_date[d] = self._read_day(path)
+                self._evict()
+
+        candles = [c for d in sorted(by_date) for c in by_date[d]]
+
+        # Today's session is still forming → always live
+        if today in days:
+            live_from = max(from_date, datetime.combine(today, datetime.min.time()))
+            data = fetcher(token, live_from, to_date, interval)
+            self.stats["api_calls"] += 1
+            self.stats["live_calls"] += 1
+            candles.extend({**c, "date": _to_naive(c["date"])} for c in data)
+
+        return [c for c in candles if from_date <= c["date"] <= to_date]
+
+    # ------------------------------
+    # PRE-WARM FROM EOD DATA STORE
+    # ------------------------------
+
+    def prewarm_from_eod(self, token_map, base_dir=EOD_DATA_DIR, interval="5minute"):
+        """
+        Seed the cache from downloaded_data/5min/<SYMBOL>/<YYYY-MM-DD>.csv.
+
+        Args:
+            token_map: dict symbol → instrument_token
+
+        Returns:
+            Number of day files written
+        """
+        written = 0
+        today = date.today()
+
+        with self._lock:
+            self._load_index()
+
+            for symbol, token in token_map.items():
+                folder = os.path.join(base_dir, symbol)
+                if not os.path.isdir(folder):
+                    continue
+
+                for file in sorted(os.listdir(folder)):
+                    if not file.endswith(".csv"):
+                        continue
+                    try:
+                        day = datetime.strptime(file.replace(".csv", ""), "%Y-%m-%d").date()
+                    except ValueError:
+                        continue
+                    if day >= today:
+                        continue
+
+                    path = self._day_path(token, interval, day)
+                    if path in self._index:
+                        continue
+
+                    df = pd.read_csv(os.path.join(folder, file))
+                    df.columns = [c.lower() for c in df.columns]
+                    if "time" not in df.columns:
+                        continue
+
+                    df["date"] = pd.to_datetime(f"{day} " + df["time"].astype(str), errors="coerce")
+                    for c in OHLCV:
+                        df[c] = pd.to_numeric(df.get(c), errors="coerce")
+                    df = df.dropna(subset=["date", "close"]).sort_values("date")
+
+                    self._write_day(path, df[["date"] + OHLCV].to_dict(orient="records"))
+                    written += 1
+
+            self._evict()
+
+        print(f"✅ Pre-warmed history cache with {written} day files")
+        return written
+
+    # ------------------------------
+    # REPORTING
+    # ------------------------------
+
+    def report(self):
+        """Return a stats dict including hit rate and on-disk footprint."""
+        with self._lock:
+            self._load_index()
+            size = sum(s for s, _ in self._index.values())
+            files = len(self._index)
+
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "hit_rate_pct": round(self.stats["hits"] / lookups * 100, 1) if lookups else 0.0,
+            "files": files,
+            "size_mb": round(size / (1024 * 1024), 2),
+            "max_mb": round(self.max_bytes / (1024 * 1024), 2),
+        }
+
+    def print_report(self):
+        r = self.report()
+        print(
+            f"📦 History cache: {r['files']} files, {r['size_mb']} / {r['max_mb']} MB | "
+            f"hits={r['hits']} misses={r['misses']} ({r['hit_rate_pct']}% hit) | "
+            f"api_calls={r['api_calls']} live={r['live_calls']} evictions={r['evictions']}"
+        )
+
+
+def main():
+    """Pre-warm the cache from the EOD store and print a stats report."""
+    cache = HistoryCache()
+    if os.path.exists(TOKEN_FILE):
+        token_df = pd.read_csv(TOKEN_FILE)
+        token_map = dict(zip(token_df["Symbol"], token_df["instrument_token"].astype(int)))
+        cache.prewarm_from_eod(token_map)
+    else:
+        print(f"⚠️ Token file not found: {TOKEN_FILE} (skipping pre-warm)")
+    cache.print_report()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,366 @@
+"""
+OPEN-TRADE TRACKER (PHASE-4B)
+-----------------------------
+• Continues the trades a backtest run leaves open (entered, no exit yet)
+  against live quotes — in process, replacing the old
+  phase-4b-tracking-state.csv + `python phase-4b-live.py` subprocess
+• Takes the open-trade frame straight from phas-4-1min (fill price,
+  highest price, current stop, trailing-armed state) — no CSV round trip
+• Typed binary state file (.npz, temp file + rename) written on every
+  checkpoint → a later process resumes exactly where tracking stopped
+• Each quote batch is applied to all of its trades at once: highest price,
+  3-tier trailing stop (exit_engine.trailing_stops), stop / target fills
+  priced like the paper broker (gap through a level fills at the quote)
+• Quote source: any quote_cache.QuoteCache (Kite LTP poller or push feed);
+  at FORCE_EXIT_TIME the rest is closed at the last quote (TIME_EXIT_1510)
+• Returns control when nothing is open, at force exit, at a deadline or on
+  Ctrl-C; the tracked trades come back as a DataFrame
+
+Usage:
+    python open_trade_tracker.py phase-4results/phase-4b-tracking-state.npz
+"""
+
+import os
+import sys
+import time as _time
+import threading
+import numpy as np
+import pandas as pd
+from datetime import datetime, time
+
+import exit_engine
+from quote_cache import QuoteCache, kite_ltp_fetcher
+
+try:
+    from kiteconnect import KiteConnect
+    HAVE_KITE = True
+except ImportError:
+    HAVE_KITE = False
+
+# ==============================
+# CONFIG
+# ==============================
+
+STATE_FILE = "phase-4results/phase-4b-tracking-state.npz"
+STATE_VERSION = 1
+
+QUOTE_EXCHANGE = "NSE"          # quote token = "<EXCHANGE>:<symbol>" (Kite LTP key)
+QUOTE_POLL_SECONDS = 1.0
+QUOTE_MAX_AGE = 5.0             # older quotes are not used for the force exit
+FORCE_EXIT_TIME = time(15, 10)
+TICK_SECONDS = 1.0              # force-exit / checkpoint cycle
+CHECKPOINT_SECONDS = 30.0
+
+STOP_REASON = "STOP_LOSS"       # stop hit at / below entry (phas-4-1min naming)
+PROFIT_STOP_REASON = exit_engine.REASON_NAMES[exit_engine.STOP_PROFIT]
+TARGET_REASON = exit_engine.REASON_NAMES[exit_engine.TARGET]
+TIME_EXIT_REASON = exit_engine.REASON_NAMES[exit_engine.TIME_EXIT]
+
+# Typed state columns (name → dtype); strings are fixed-width unicode in the .npz
+STATE_COLUMNS = {
+    "symbol": str, "date": str, "token": str,
+    "quantity": np.int64, "entry": np.float64, "initial_stop": np.float64, "target": np.float64,
+    "highest": np.float64, "stop": np.float64, "armed": np.bool_,
+    "last_time": str, "last_price": np.float64,
+    "closed": np.bool_, "exit_price": np.float64, "exit_time": str, "exit_reason": str,
+}
+
+
+# ==============================
+# TRACKER
+# ==============================
+
+class OpenTradeTracker:
+    """Open trades as typed column arrays, trailed and exited on quote batches."""
+
+    def __init__(self, state):
+        self.state = {name: np.array(state[name], dtype=dtype) for name, dtype in STATE_COLUMNS.items()}
+        # Fixed-width strings would truncate longer exit times / reasons
+        for name in ("last_time", "exit_time", "exit_reason"):
+            self.state[name] = self.state[name].astype(object)
+        self._lock = threading.Lock()
+        self._all_closed = threading.Event()
+        self._by_token = {}
+        for i, token in enumerate(self.state["token"]):
+            self._by_token.setdefault(str(token), []).append(i)
+        self._by_token = {t: np.array(ix, dtype=np.int64) for t, ix in self._by_token.items()}
+        self.stats = {"quote_batches": 0, "exits": 0}
+        if self.open_count() == 0:
+            self._all_closed.set()
+
+    # ------------------------------
+    # CONSTRUCTION / PERSISTENCE
+    # ------------------------------
+
+    @classmethod
+    def from_frame(cls, df, exchange=QUOTE_EXCHANGE):
+        """
+        Open trades from phas-4-1min (symbol, date, quantity, exec_entry_price,
+        stop_price, target_price and the *_state columns).
+        """
+        n = len(df)
+        entry = pd.to_numeric(df["exec_entry_price"], errors="coerce").to_numpy(dtype=np.float64)
+        stop = pd.to_numeric(df["stop_price"], errors="coerce").to_numpy(dtype=np.float64)
+
+        def state_col(name, fallback):
+            if name not in df.columns:
+                return fallback
+            return pd.to_numeric(df[name], errors="coerce").fillna(pd.Series(fallback, index=df.index)).to_numpy()
+
+        symbols = df["symbol"].astype(str).str.strip().to_numpy()
+        return cls({
+            "symbol": symbols,
+            "date": df["date"].astype(str).to_numpy() if n else np.zeros(0, dtype=str),
+            "token": np.array([f"{exchange}:{s}" for s in symbols], dtype=str),
+            "quantity": pd.to_numeric(df["quantity"], errors="coerce").fillna(0).to_numpy(dtype=np.int64),
+            "entry": entry,
+            "initial_stop": stop,
+            "target": pd.to_numeric(df["target_price"], errors="coerce").to_numpy(dtype=np.float64),
+            "highest": state_col("highest_price_state", entry),
+            "stop": state_col("current_stop_state", stop),
+            "armed": (df["trailing_armed_state"].fillna(False).astype(bool).to_numpy()
+                      if "trailing_armed_state" in df.columns else np.zeros(n, dtype=bool)),
+            "last_time": (df["last_candle_time_state"].fillna("").astype(str).to_numpy()
+                          if "last_candle_time_state" in df.columns else np.full(n, "")),
+            "last_price": np.full(n, np.nan),
+            "closed": np.zeros(n, dtype=bool),
+            "exit_price": np.full(n, np.nan),
+            "exit_time": np.full(n, ""),
+            "exit_reason": np.full(n, ""),
+        })
+
+    def save(self, path=STATE_FILE):
+        """Typed columns → compressed .npz (temp file + rename)."""
+        with self._lock:
+            cols = {name: np.asarray(self.state[name], dtype=dtype) for name, dtype in STATE_COLUMNS.items()}
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez_compressed(f, version=np.array([STATE_VERSION], dtype=np.int64), **cols)
+        os.replace(tmp_path, path)
+        return path
+
+    @classmethod
+    def load(cls, path=STATE_FILE):
+        with np.load(path, allow_pickle=False) as snap:
+            if int(snap["version"][0]) != STATE_VERSION:
+                raise ValueError(f"❌ Tracker state version mismatch: {path}")
+            return cls({name: snap[name] for name in STATE_COLUMNS})
+
+    # ------------------------------
+    # QUOTES → TRAIL / EXIT
+    # ------------------------------
+
+    def tokens(self):
+        """Quote tokens of the trades still open."""
+        with self._lock:
+            return sorted({str(t) for t in self.state["token"][~self.state["closed"]]})
+
+    def open_count(self):
+        return int((~self.state["closed"]).sum())
+
+    def on_quotes(self, updates, now=None):
+        """
+        Apply a quote batch ({token: Quote} from QuoteCache, or {token: price}).
+        Returns the number of trades it closed.
+        """
+        now = now or datetime.now()
+        idx, prices = [], []
+        for token, q in updates.items():
+            ix = self._by_token.get(str(token))
+            price = getattr(q, "price", q)
+            if ix is None or price is None:
+                continue
+            idx.append(ix)
+            prices.append(np.full(len(ix), float(price)))
+        if not idx:
+            return 0
+        idx, prices = np.concatenate(idx), np.concatenate(prices)
+
+        with self._lock:
+            s = self.state
+            live = ~s["closed"][idx]
+            i, p = idx[live], prices[live]
+            if len(i) == 0:
+                return 0
+            self.stats["quote_batches"] += 1
+            stamp = now.strftime("%H:%M:%S")
+            s["last_price"][i] = p
+            s["last_time"][i] = stamp
+
+            entry = s["entry"][i]
+            s["highest"][i] = np.fmax(s["highest"][i], p)
+            s["stop"][i] = exit_engine.trailing_stops(entry, s["initial_stop"][i], s["highest"][i], s["stop"][i])
+            s["armed"][i] |= s["highest"][i] >= entry + (entry - s["initial_stop"][i])
+
+            # Stop first (as the paper broker matches): a gap through a level fills at the quote
+            stop = s["stop"][i]
+            hit_stop = p <= stop
+            hit_target = ~hit_stop & (p >= s["target"][i])
+            self._close(i[hit_stop], np.minimum(stop, p)[hit_stop],
+                        np.where(stop[hit_stop] > entry[hit_stop], PROFIT_STOP_REASON, STOP_REASON), stamp)
+            self._close(i[hit_target], np.maximum(s["target"][i], p)[hit_target], TARGET_REASON, stamp)
+            return int(hit_stop.sum() + hit_target.sum())
+
+    def force_exit(self, quotes=None, now=None):
+        """Close everything still open at the freshest price known."""
+        now = now or datetime.now()
+        with self._lock:
+            i = np.flatnonzero(~self.state["closed"])
+            prices = self.state["last_price"][i].copy()
+            if quotes is not None:
+                for n, token in enumerate(self.state["token"][i]):
+                    fresh = quotes.price(str(token), max_age=QUOTE_MAX_AGE)
+                    if fresh is not None:
+                        prices[n] = fresh
+            # Never quoted → flat at the fill price
+            prices = np.where(np.isnan(prices), self.state["entry"][i], prices)
+            self._close(i, prices, TIME_EXIT_REASON, now.strftime("%H:%M:%S"))
+            return len(i)
+
+    def _close(self, i, prices, reasons, stamp):
+        if len(i) == 0:
+            return
+        s = self.state
+        s["closed"][i] = True
+        s["exit_price"][i] = prices
+        s["exit_time"][i] = stamp
+        s["exit_reason"][i] = reasons
+        self.stats["exits"] += len(i)
+        for symbol, price, reason in zip(s["symbol"][i], s["exit_price"][i], s["exit_reason"][i]):
+            print(f"🏁 EXITED | {symbol} | {reason} @ {price:.2f}")
+        if s["closed"].all():
+            self._all_closed.set()
+
+    # ------------------------------
+    # RESULTS
+    # ------------------------------
+
+    def to_frame(self):
+        """Tracked trades in the phas-4-1min column layout (+ is_open)."""
+        with self._lock:
+            s = {name: np.array(col, copy=True) for name, col in self.state.items()}
+        closed = s["closed"]
+        sell_price = np.where(closed, s["exit_price"], s["last_price"])
+        return pd.DataFrame({
+            "symbol": s["symbol"],
+            "date": s["date"],
+            "quantity": s["quantity"],
+            "exec_entry_price": s["entry"],
+            "stop_price": s["initial_stop"],
+            "target_price": s["target"],
+            "highest_price_state": s["highest"],
+            "current_stop_state": s["stop"],
+            "trailing_armed_state": s["armed"],
+            "last_candle_time_state": s["last_time"],
+            "sell_price": sell_price,
+            "sell_time": np.where(closed, s["exit_time"], s["last_time"]),
+            "exit_reason": np.where(closed, s["exit_reason"], "NO_EXIT"),
+            "pnl": (sell_price - s["entry"]) * s["quantity"],
+            "is_open": ~closed,
+        })
+
+    # ------------------------------
+    # RUN LOOP
+    # ------------------------------
+
+    def run(self, quotes, force_exit_time=FORCE_EXIT_TIME, state_path=STATE_FILE,
+            deadline=None, checkpoint_seconds=CHECKPOINT_SECONDS):
+        """
+        Track against a running QuoteCache until every trade is closed, the
+        force-exit time, `deadline` (datetime) or Ctrl-C. The state file is
+        checkpointed periodically and on return.
+
+        Returns:
+            to_frame() of the tracked trades
+        """
+        tokens = self.tokens()
+        for token in tokens:
+            quotes.watch(token)
+        quotes.subscribe(self.on_quotes)
+        # Prices already in the cache count as the first batch
+        self.on_quotes({t: q for t, q in quotes.snapshot().items() if t in self._by_token})
+
+        print(f"📡 Tracking {self.open_count()} open trade(s) until {force_exit_time.strftime('%H:%M')}")
+        last_checkpoint = _time.monotonic()
+        try:
+            while not self._all_closed.wait(TICK_SECONDS):
+                now = datetime.now()
+                if now.time() >= force_exit_time:
+                    print(f"⏰ FORCE EXIT | {self.open_count()} trade(s)")
+                    self.force_exit(quotes, now)
+                    break
+                if deadline is not None and now >= deadline:
+                    print("⏹️ Tracking deadline reached — state saved for resume")
+                    break
+                if state_path and _time.monotonic() - last_checkpoint >= checkpoint_seconds:
+                    self.save(state_path)
+                    last_checkpoint = _time.monotonic()
+        except KeyboardInterrupt:
+            print("⏹️ Tracking stopped by user — state saved for resume")
+        finally:
+            quotes.unsubscribe(self.on_quotes)
+            for token in tokens:
+                quotes.unwatch(token)
+            if state_path:
+                self.save(state_path)
+
+        print(f"✅ Tracking done: {self.stats['exits']} exit(s), {self.open_count()} still open")
+        return self.to_frame()
+
+
+# ==============================
+# QUOTE SOURCE
+# ==============================
+
+def kite_quotes(poll_seconds=QUOTE_POLL_SECONDS):
+    """QuoteCache on Kite LTP (API_KEY / ACCESS_TOKEN env), or None when unavailable."""
+    api_key, access_token = os.getenv("API_KEY"), os.getenv("ACCESS_TOKEN")
+    if not HAVE_KITE or not api_key or not access_token:
+        return None
+    kite = KiteConnect(api_key=api_key)
+    kite.set_access_token(access_token)
+    return QuoteCache(kite_ltp_fetcher(kite), poll_seconds=poll_seconds, stale_after=QUOTE_MAX_AGE)
+
+
+def track(tracker, quotes=None, state_path=STATE_FILE, **kwargs):
+    """
+    Run a tracker on `quotes` (default: a Kite LTP cache). Without a quote
+    source the state is only saved, so tracking can resume later.
+
+    Returns:
+        to_frame() of the tracked trades
+    """
+    own = quotes is None
+    quotes = quotes or kite_quotes()
+    if quotes is None:
+        if state_path:
+            tracker.save(state_path)
+        print(f"⚠️ No quote source (kiteconnect / API_KEY / ACCESS_TOKEN) — state saved: {state_path}")
+        return tracker.to_frame()
+
+    if own:
+        quotes.start()
+    try:
+        return tracker.run(quotes, state_path=state_path, **kwargs)
+    finally:
+        if own:
+            quotes.stop()
+
+
+# ==============================
+# MAIN
+# ==============================
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else STATE_FILE
+    if not os.path.exists(path):
+        raise ValueError(f"❌ Tracker state not found: {path}")
+    tracker = OpenTradeTracker.load(path)
+    print(f"📂 Resumed {tracker.open_count()} open trade(s) from {path}")
+    result = track(tracker, state_path=path)
+    print(result[["symbol", "exit_reason", "sell_price", "pnl"]].to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
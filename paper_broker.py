@@ -0,0 +1,562 @@
+"""
+PAPER BROKER (IN-PROCESS + HTTP STAND-IN)
+-----------------------------------------
+• Implements the PAPER_API contract used by phase-4-1minLive and api_server:
+    POST /order          {symbol, token, qty, price:"current"|float, sl, tp} → {order_id}
+    PUT  /order/modify   {order_id, sl, tp (0 = unchanged), status?:"TIME_EXIT"}
+    GET  /portfolio      → {open_positions, cash, total_value, positions, ...}
+• Extra endpoints for simulation: POST /quote (feed prices), GET /fills
+• Open positions indexed by order_id and by symbol
+• SL / TP matching per symbol with heaps (lazy deletion) → a quote only
+  touches the orders it actually triggers
+• Fill log of every entry and exit
+• Price source for the stand-in: QuotePump feeds on_quotes from a shared
+  QuoteCache watching only the symbols with open orders (Kite LTP, or a
+  replay of downloaded 5-min bars when no outside service is available);
+  a "current" order for an unquoted symbol fetches its first price
+• Built-in load test: python paper_broker.py loadtest
+
+Usage:
+    python paper_broker.py                  # replay downloaded_data/5min bars
+    python paper_broker.py kite             # Kite LTP (API_KEY / ACCESS_TOKEN env)
+    python paper_broker.py none             # prices only via POST /quote
+    python paper_broker.py loadtest
+"""
+
+import os
+import csv
+import sys
+import time
+import heapq
+import random
+import threading
+import itertools
+from datetime import datetime
+
+from flask import Flask, jsonify, request
+
+from quote_cache import QuoteCache, kite_ltp_fetcher
+
+try:
+    from kiteconnect import KiteConnect
+    HAVE_KITE = True
+except ImportError:
+    HAVE_KITE = False
+
+# ==============================
+# CONFIG
+# ==============================
+
+HOST = "0.0.0.0"
+PORT = 5000
+STARTING_CASH = 1_000_000.0
+
+QUOTE_POLL_SECONDS = 1.0
+QUOTE_EXCHANGE = "NSE"          # Kite LTP key = "<EXCHANGE>:<symbol>"
+REPLAY_DATA_DIR = "downloaded_data/5min"
+WALK_START_PRICE = 1000.0       # replay symbols without downloaded bars random-walk from here
+WALK_SIGMA = 0.001
+
+EXIT_STATUSES = {"TIME_EXIT", "EXIT", "CLOSE"}
+
+
+class BrokerError(Exception):
+    """Rejected request (unknown order, no quote, insufficient cash...)."""
+
+
+class Position:
+    __slots__ = (
+        "order_id", "symbol", "token", "qty", "entry_price", "entry_time",
+        "sl", "tp", "version",
+    )
+
+    def __init__(self, order_id, symbol, token, qty, entry_price, sl, tp):
+        self.order_id = order_id
+        self.symbol = symbol
+        self.token = token
+        self.qty = qty
+        self.entry_price = entry_price
+        self.entry_time = datetime.now()
+        self.sl = sl
+        self.tp = tp
+        self.version = 0    # bumped on every SL/TP change → stale heap entries are skipped
+
+    def to_dict(self, ltp):
+        return {
+            "order_id": self.order_id,
+            "symbol": self.symbol,
+            "token": self.token,
+            "qty": self.qty,
+            "entry_price": self.entry_price,
+            "entry_time": self.entry_time.strftime("%Y-%m-%d %H:%M:%S"),
+            "sl": self.sl,
+            "tp": self.tp,
+            "ltp": ltp,
+        }
+
+
+class PaperBroker:
+    """Thread-safe in-process paper broker."""
+
+    def __init__(self, starting_cash=STARTING_CASH, log_fills=False):
+        self._lock = threading.RLock()
+        self._ids = itertools.count(1)
+        self.starting_cash = float(starting_cash)
+        self.cash = float(starting_cash)
+        self.realized_pnl = 0.0
+        self.log_fills = log_fills
+        self.quote_source = None    # (symbol, token) → price, for "current" orders without a quote
+
+        self.positions = {}     # order_id → Position
+        self.by_symbol = {}     # symbol → set(order_id)
+        self.token_symbol = {}  # str(token) → symbol
+        self.ltp = {}           # symbol → last price
+
+        # Per-symbol trigger heaps: entries are (key, seq, order_id, version)
+        #   SL heap is a max-heap on sl (key = -sl): highest stop triggers first
+        #   TP heap is a min-heap on tp (key = tp):  lowest target triggers first
+        self._sl_heap = {}
+        self._tp_heap = {}
+        self._seq = itertools.count()
+
+        self.fills = []
+        self.stats = {"orders": 0, "modifies": 0, "quotes": 0, "exits": 0, "rejects": 0}
+
+    # ------------------------------
+    # HEAP HELPERS
+    # ------------------------------
+
+    def _push_triggers(self, pos):
+        if pos.sl:
+            heapq.heappush(self._sl_heap.setdefault(pos.symbol, []),
+                           (-pos.sl, next(self._seq), pos.order_id, pos.version))
+        if pos.tp:
+            heapq.heappush(self._tp_heap.setdefault(pos.symbol, []),
+                           (pos.tp, next(self._seq), pos.order_id, pos.version))
+
+    def _live_entry(self, entry):
+        pos = self.positions.get(entry[2])
+        return pos if pos is not None and pos.version == entry[3] else None
+
+    # ------------------------------
+    # ORDERS
+    # ------------------------------
+
+    def place_order(self, symbol, qty, sl=0, tp=0, price="current", token=None):
+        """Open a long position. Returns order_id."""
+        if (price == "current" or price is None) and symbol not in self.ltp and self.quote_source is not None:
+            # First order for this symbol: fetch a price outside the lock
+            first = self.quote_source(symbol, token)
+            if first is not None:
+                self.on_quote(symbol, first)
+
+        with self._lock:
+            qty = int(qty)
+            if qty <= 0:
+                self.stats["rejects"] += 1
+                raise BrokerError(f"Invalid qty {qty}")
+
+            if price == "current" or price is None:
+                if symbol not in self.ltp:
+                    self.stats["rejects"] += 1
+                    raise BrokerError(f"No quote for {symbol}")
+                fill_price = self.ltp[symbol]
+            else:
+                fill_price = float(price)
+                self.ltp.setdefault(symbol, fill_price)
+
+            cost = fill_price * qty
+            if cost > self.cash:
+                self.stats["rejects"] += 1
+                raise BrokerError(f"Insufficient cash for {symbol}: need {cost:.2f}, have {self.cash:.2f}")
+
+            order_id = f"PB{next(self._ids):08d}"
+            pos = Position(order_id, symbol, token, qty, fill_price, float(sl or 0), float(tp or 0))
+            self.positions[order_id] = pos
+            self.by_symbol.setdefault(symbol, set()).add(order_id)
+            if token is not None:
+                self.token_symbol[str(token)] = symbol
+            self.cash -= cost
+            self._push_triggers(pos)
+
+            self.stats["orders"] += 1
+            self._record_fill(pos, "BUY", fill_price, "ENTRY")
+
+            # A stop/target already through the market fills immediately
+            self._match(symbol)
+            return order_id
+
+    def modify_order(self, order_id, sl=0, tp=0, status=None):
+        """Change SL/TP (0 = unchanged), or exit now when status is TIME_EXIT."""
+        with self._lock:
+            pos = self.positions.get(order_id)
+            if pos is None:
+                self.stats["rejects"] += 1
+                raise BrokerError(f"Unknown or closed order {order_id}")
+
+            self.stats["modifies"] += 1
+
+            if status and status.upper() in EXIT_STATUSES:
+                exit_price = float(sl) if sl else self.ltp.get(pos.symbol, pos.entry_price)
+                self._close(pos, exit_price, status.upper())
+                return {"order_id": order_id, "status": "CLOSED"}
+
+            changed = False
+            if sl and float(sl) != pos.sl:
+                pos.sl = float(sl)
+                changed = True
+            if tp and float(tp) != pos.tp:
+                pos.tp = float(tp)
+                changed = True
+
+            if changed:
+                pos.version += 1
+                self._push_triggers(pos)
+                self._match(pos.symbol)
+
+            return {"order_id": order_id, "status": "OPEN" if order_id in self.positions else "CLOSED"}
+
+    # ------------------------------
+    # QUOTES & MATCHING
+    # ------------------------------
+
+    def on_quote(self, symbol_or_token, price):
+        """Apply one quote. Returns number of positions closed by it."""
+        with self._lock:
+            symbol = self.token_symbol.get(str(symbol_or_token), symbol_or_token)
+            self.ltp[symbol] = float(price)
+            self.stats["quotes"] += 1
+            return self._match(symbol)
+
+    def on_quotes(self, quotes):
+        """Apply a batch {symbol_or_token: price}. Returns positions closed."""
+        with self._lock:
+            return sum(self.on_quote(k, v) for k, v in quotes.items())
+
+    def _match(self, symbol):
+        price = self.ltp.get(symbol)
+        if price is None:
+            return 0
+        closed = 0
+
+        sl_heap = self._sl_heap.get(symbol)
+        while sl_heap and -sl_heap[0][0] >= price:
+            entry = heapq.heappop(sl_heap)
+            pos = self._live_entry(entry)
+            if pos is not None:
+                # Gap through the stop fills at the quote, otherwise at the stop
+                self._close(pos, min(pos.sl, price), "SL")
+                closed += 1
+
+        tp_heap = self._tp_heap.get(symbol)
+        while tp_heap and tp_heap[0][0] <= price:
+            entry = heapq.heappop(tp_heap)
+            pos = self._live_entry(entry)
+            if pos is not None:
+                self._close(pos, max(pos.tp, price), "TP")
+                closed += 1
+
+        return closed
+
+    def _close(self, pos, exit_price, reason):
+        self.positions.pop(pos.order_id, None)
+        ids = self.by_symbol.get(pos.symbol)
+        if ids is not None:
+            ids.discard(pos.order_id)
+            if not ids:
+                del self.by_symbol[pos.symbol]
+                # Nothing left for this symbol → drop its (all stale) heaps
+                self._sl_heap.pop(pos.symbol, None)
+                self._tp_heap.pop(pos.symbol, None)
+
+        self.cash += exit_price * pos.qty
+        self.realized_pnl += (exit_price - pos.entry_price) * pos.qty
+        self.stats["exits"] += 1
+        self._record_fill(pos, "SELL", exit_price, reason)
+
+    def _record_fill(self, pos, side, price, reason):
+        fill = {
+            "seq": len(self.fills),
+            "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")[:-3],
+            "order_id": pos.order_id,
+            "symbol": pos.symbol,
+            "side": side,
+            "qty": pos.qty,
+            "price": round(price, 2),
+            "reason": reason,
+        }
+        if side == "SELL":
+            fill["pnl"] = round((price - pos.entry_price) * pos.qty, 2)
+        self.fills.append(fill)
+        if self.log_fills:
+            print(f"{'🟢' if side == 'BUY' else '🔴'} {side} {pos.symbol} x{pos.qty} @ {price:.2f} ({reason})")
+
+    # ------------------------------
+    # VIEWS
+    # ------------------------------
+
+    def portfolio(self):
+        with self._lock:
+            open_positions = [p.to_dict(self.ltp.get(p.symbol, p.entry_price)) for p in self.positions.values()]
+            market_value = sum(p["ltp"] * p["qty"] for p in open_positions)
+            unrealized = sum((p["ltp"] - p["entry_price"]) * p["qty"] for p in open_positions)
+            return {
+                "open_positions": open_positions,
+                "positions": len(open_positions),
+                "cash": round(self.cash, 2),
+                "total_value": round(self.cash + market_value, 2),
+                "realized_pnl": round(self.realized_pnl, 2),
+                "unrealized_pnl": round(unrealized, 2),
+            }
+
+    def fills_since(self, seq=0):
+        with self._lock:
+            return self.fills[seq:]
+
+    def positions_for(self, symbol):
+        with self._lock:
+            return [self.positions[o] for o in self.by_symbol.get(symbol, ())]
+
+# ==============================
+# PRICE SOURCES
+# ==============================
+
+def kite_symbol_key(symbol, token=None):
+    return f"{QUOTE_EXCHANGE}:{symbol}"
+
+
+def replay_fetcher(base_dir=REPLAY_DATA_DIR, seed=7):
+    """
+    fetcher(symbols) → {symbol: price} replaying each symbol's latest
+    downloaded 5-min day (<base_dir>/<SYMBOL>/<YYYY-MM-DD>.csv), one bar
+    close per poll, looping. Symbols without data random-walk instead.
+    """
+    rng = random.Random(seed)
+    closes, cursor, walk = {}, {}, {}
+
+    def load(symbol):
+        folder = os.path.join(base_dir, symbol)
+        files = sorted(f for f in os.listdir(folder) if f.endswith(".csv")) if os.path.isdir(folder) else []
+        if not files:
+            return []
+        with open(os.path.join(folder, files[-1]), newline="") as f:
+            out = []
+            for row in csv.DictReader(f):
+                row = {k.lower(): v for k, v in row.items() if k}
+                try:
+                    out.append(float(row["close"]))
+                except (KeyError, TypeError, ValueError):
+                    continue
+            return out
+
+    def fetch(symbols):
+        out = {}
+        for s in symbols:
+            if s not in closes:
+                closes[s] = load(s)
+            if closes[s]:
+                i = cursor.get(s, 0)
+                out[s] = closes[s][i % len(closes[s])]
+                cursor[s] = i + 1
+            else:
+                walk[s] = walk.get(s, WALK_START_PRICE) * (1 + rng.gauss(0, WALK_SIGMA))
+                out[s] = round(walk[s], 2)
+        return out
+    return fetch
+
+
+def kite_quote_cache(poll_seconds=QUOTE_POLL_SECONDS):
+    """QuoteCache on Kite LTP (API_KEY / ACCESS_TOKEN env), or None when unavailable."""
+    api_key, access_token = os.getenv("API_KEY"), os.getenv("ACCESS_TOKEN")
+    if not HAVE_KITE or not api_key or not access_token:
+        return None
+    kite = KiteConnect(api_key=api_key)
+    kite.set_access_token(access_token)
+    return QuoteCache(kite_ltp_fetcher(kite), poll_seconds=poll_seconds)
+
+
+class QuotePump:
+    """
+    Feeds a broker from a QuoteCache: watches the quote key of every symbol
+    with open orders, applies each update through on_quotes and unwatches
+    symbols once their last position is closed.
+    """
+
+    def __init__(self, broker, cache, key_of=None):
+        self.broker = broker
+        self.cache = cache
+        self.key_of = key_of or (lambda symbol, token=None: symbol)
+        self._symbol_of = {}        # quote key → symbol
+        self._opened = set()        # keys that have had a position (a primed order may still be pending)
+        self._lock = threading.Lock()
+        broker.quote_source = self.prime
+        cache.subscribe(self._on_update)
+
+    def prime(self, symbol, token=None):
+        """Watch symbol and return its price, fetching it now if the cache has none."""
+        key = self.key_of(symbol, token)
+        with self._lock:
+            if key not in self._symbol_of:
+                self._symbol_of[key] = symbol
+                self.cache.watch(key)
+        if self.cache.price(key) is None and self.cache.fetcher is not None:
+            self.cache.update_many(self.cache.fetcher([key]))
+        return self.cache.price(key)
+
+    def _on_update(self, updates):
+        with self._lock:
+            prices = {self._symbol_of[k]: q.price for k, q in updates.items() if k in self._symbol_of}
+        if prices:
+            self.broker.on_quotes(prices)
+
+        # Nothing open any more → stop polling the symbol
+        with self._lock:
+            for key, symbol in list(self._symbol_of.items()):
+                if symbol in self.broker.by_symbol:
+                    self._opened.add(key)
+                elif key in self._opened:
+                    del self._symbol_of[key]
+                    self._opened.discard(key)
+                    self.cache.unwatch(key)
+
+    def start(self):
+        self.cache.start()
+
+    def stop(self):
+        self.cache.stop()
+
+
+# ==============================
+# HTTP STAND-IN
+# ==============================
+
+def create_app(broker=None):
+    """Flask app exposing `broker` on the PAPER_API contract."""
+    broker = broker or PaperBroker(log_fills=True)
+    app = Flask(__name__)
+    app.config["BROKER"] = broker
+
+    def _error(e, code=400):
+        return jsonify({"error": str(e)}), code
+
+    @app.route("/order", methods=["POST"])
+    def place():
+        body = request.get_json(force=True) or {}
+        try:
+            order_id = broker.place_order(
+                body["symbol"], body["qty"],
+                sl=body.get("sl", 0), tp=body.get("tp", 0),
+                price=body.get("price", "current"), token=body.get("token"),
+            )
+        except (BrokerError, KeyError, ValueError) as e:
+            return _error(e)
+        return jsonify({"order_id": order_id})
+
+    @app.route("/order/modify", methods=["PUT"])
+    def modify():
+        body = request.get_json(force=True) or {}
+        try:
+            return jsonify(broker.modify_order(
+                body["order_id"], sl=body.get("sl", 0), tp=body.get("tp", 0), status=body.get("status")
+            ))
+        except BrokerError as e:
+            return _error(e, 404)
+        except (KeyError, ValueError) as e:
+            return _error(e)
+
+    @app.route("/portfolio", methods=["GET"])
+    def portfolio():
+        return jsonify(broker.portfolio())
+
+    @app.route("/quote", methods=["POST"])
+    def quote():
+        """Body: {symbol, price} or {quotes: {symbol_or_token: price, ...}}"""
+        body = request.get_json(force=True) or {}
+        try:
+            if "quotes" in body:
+                closed = broker.on_quotes(body["quotes"])
+            else:
+                closed = broker.on_quote(body["symbol"], body["price"])
+        except (KeyError, ValueError) as e:
+            return _error(e)
+        return jsonify({"closed": closed})
+
+    @app.route("/fills", methods=["GET"])
+    def fills():
+        return jsonify(broker.fills_since(request.args.get("since", 0, type=int)))
+
+    return app
+
+# ==============================
+# LOAD TEST
+# ==============================
+
+def load_test(n_symbols=500, n_orders=5000, n_quotes=200_000, seed=7):
+    """
+    Drive the in-process broker with random orders and a random-walk quote
+    feed; prints throughput for each side.
+    """
+    rng = random.Random(seed)
+    broker = PaperBroker(starting_cash=1e12)
+    symbols = [f"SYM{i:04d}" for i in range(n_symbols)]
+    prices = {s: rng.uniform(100, 2000) for s in symbols}
+    broker.on_quotes(prices)
+
+    t0 = time.perf_counter()
+    order_ids = []
+    for _ in range(n_orders):
+        s = rng.choice(symbols)
+        p = prices[s]
+        order_ids.append(broker.place_order(s, rng.randint(1, 50), sl=round(p * 0.99, 2), tp=round(p * 1.02, 2)))
+    t_orders = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    for i in range(n_quotes):
+        s = symbols[i % n_symbols]
+        prices[s] *= 1 + rng.gauss(0, 0.001)
+        broker.on_quote(s, prices[s])
+        # Trail a live order every few quotes, like the execution engine does
+        if i % 10 == 0:
+            oid = order_ids[rng.randrange(len(order_ids))]
+            pos = broker.positions.get(oid)
+            if pos is not None:
+                broker.modify_order(oid, sl=round(max(pos.sl, broker.ltp[pos.symbol] * 0.99), 2))
+    t_quotes = time.perf_counter() - t0
+
+    pf = broker.portfolio()
+    print(f"📦 Orders:  {n_orders:,} in {t_orders:.3f}s → {n_orders / t_orders:,.0f}/s")
+    print(f"📈 Quotes:  {n_quotes:,} in {t_quotes:.3f}s → {n_quotes / t_quotes:,.0f}/s "
+          f"(+{broker.stats['modifies']:,} modifies)")
+    print(f"🏁 Exits:   {broker.stats['exits']:,} | Open: {pf['positions']:,} | Fills: {len(broker.fills):,}")
+    print(f"💰 Realized P&L: {pf['realized_pnl']:,.2f}")
+    return broker
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "loadtest":
+        load_test()
+        return
+
+    source = sys.argv[1] if len(sys.argv) > 1 else "replay"
+    broker = PaperBroker(log_fills=True)
+    if source == "kite":
+        cache = kite_quote_cache()
+        if cache is None:
+            raise ValueError("❌ Kite quotes need kiteconnect and API_KEY / ACCESS_TOKEN in the environment")
+        pump = QuotePump(broker, cache, key_of=kite_symbol_key)
+    elif source == "replay":
+        pump = QuotePump(broker, QuoteCache(replay_fetcher(), poll_seconds=QUOTE_POLL_SECONDS))
+    elif source == "none":
+        pump = None
+    else:
+        raise ValueError(f"❌ Unknown quote source: {source} (kite | replay | none | loadtest)")
+
+    if pump is not None:
+        pump.start()
+    print(f"📈 Quote source: {source}")
+    print(f"🚀 Paper Broker listening on http://localhost:{PORT}")
+    create_app(broker).run(host=HOST, port=PORT, threaded=True)
+
+
+if __name__ == "__main__":
+    main()
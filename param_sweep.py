@@ -0,0 +1,414 @@
+"""
+PHASE-4 PARAMETER SWEEP
+-----------------------
+• Loads Phase-3 entries and 5-minute bars ONCE, then evaluates a grid of
+  phase-4 settings (SLIPPAGE_PCT, L_PCT, C_PCT, COST_BUFFER, trailing
+  tiers, FORCE_EXIT_TIME, ...) across a process pool
+• Exit simulation runs once per distinct (tiers, force-exit) combination;
+  every capital / cost setting on top of it is pure array math
+• One results row per parameter set: net P&L, win rate, max drawdown,
+  trades → phase-4results/param_sweep.csv
+• Resume: rows already in the results file are skipped on restart
+• Early pruning: days are simulated in chunks; a setting whose drawdown
+  passes MAX_DRAWDOWN stops there (status PRUNED)
+
+Usage:
+    python param_sweep.py [grid.json]
+    grid.json = {"L_PCT": [0.01, 0.02], "FORCE_EXIT_TIME": ["14:45", "15:10"], ...}
+"""
+
+import os
+import sys
+import json
+import time as _time
+import hashlib
+import itertools
+import warnings
+import numpy as np
+import pandas as pd
+from datetime import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import exit_engine
+import bar_store
+import config_manager
+
+warnings.filterwarnings('ignore', message='Could not infer format')
+
+# ==============================
+# CONFIG
+# ==============================
+
+PHASE3_FILE = "phase-3results/Phase3_results.xlsx"
+FIVE_MIN_DATA_DIR = "downloaded_data"
+OUTPUT_DIR = "phase-4results"
+RESULTS_FILE = os.path.join(OUTPUT_DIR, "param_sweep.csv")
+
+WORKERS = max(1, (os.cpu_count() or 2) - 1)
+DAY_CHUNKS = 4              # pruning checkpoints per simulation
+MAX_DRAWDOWN = None         # ₹; prune a setting once its drawdown exceeds this (None = off)
+
+P4_CFG = config_manager.get_phase_config("phase4")
+
+# Baseline = phase-4.py constants, overridden by config.json "phase4"
+BASE_PARAMS = {
+    "C_PER_DAY": P4_CFG.get("C_PER_DAY", 1000000),
+    "L_PCT": P4_CFG.get("L_PCT", 0.02),
+    "C_PCT": P4_CFG.get("C_PCT", 0.50),
+    "TRANSACTION_COST_PCT": P4_CFG.get("TRANSACTION_COST_PCT", 0.0005),
+    "SLIPPAGE_PCT": P4_CFG.get("SLIPPAGE_PCT", 0.001),
+    "COST_BUFFER": 0.0025,
+    "FORCE_EXIT_TIME": (config_manager.get_time_from_config(P4_CFG, "FORCE_EXIT_TIME") or time(15, 10)).strftime("%H:%M"),
+    "BREAKEVEN_BUFFER_PCT": exit_engine.COST_BUFFER_PCT,
+    "TIER_BREAKEVEN_R": exit_engine.TRAIL_TIERS[0],
+    "TIER_LOCK_R": exit_engine.TRAIL_TIERS[1],
+    "TIER_LOCK_PROFIT_R": exit_engine.TRAIL_TIERS[2],
+    "TIER_TRAIL_R": exit_engine.TRAIL_TIERS[3],
+    "TIER_TRAIL_DIST_R": exit_engine.TRAIL_TIERS[4],
+}
+
+# Keys that change exits (→ new simulation); the rest only re-price trades
+SIM_KEYS = ["FORCE_EXIT_TIME", "BREAKEVEN_BUFFER_PCT", "TIER_BREAKEVEN_R", "TIER_LOCK_R",
+            "TIER_LOCK_PROFIT_R", "TIER_TRAIL_R", "TIER_TRAIL_DIST_R"]
+
+DEFAULT_GRID = {
+    "SLIPPAGE_PCT": [0.0, 0.0005, 0.001],
+    "L_PCT": [0.01, 0.02, 0.03],
+    "C_PCT": [0.30, 0.50],
+    "COST_BUFFER": [0.0015, 0.0025, 0.004],
+    "TIER_TRAIL_R": [1.5, 2.0, 2.5],
+    "FORCE_EXIT_TIME": ["14:45", "15:10"],
+}
+
+RESULT_COLUMNS = ["config_id", "status", "days", "trades", "net_pnl", "gross_pnl", "costs",
+                  "win_rate", "max_drawdown"]
+
+
+# ==============================
+# GRID
+# ==============================
+
+def config_id(params):
+    """Stable id of a parameter set (resume key)."""
+    blob = json.dumps(params, sort_keys=True, default=str)
+    return hashlib.sha1(blob.encode()).hexdigest()[:12]
+
+
+def expand_grid(grid, base=BASE_PARAMS):
+    """Cartesian product of grid values over the baseline → list of param dicts."""
+    unknown = set(grid) - set(base)
+    if unknown:
+        raise ValueError(f"❌ Unknown sweep parameters: {sorted(unknown)}")
+    keys = list(grid)
+    configs = []
+    for values in itertools.product(*(grid[k] for k in keys)):
+        params = dict(base)
+        params.update(zip(keys, values))
+        configs.append(params)
+    return configs
+
+
+def group_by_simulation(configs):
+    """{sim key tuple: [params, ...]} so each exit simulation runs once."""
+    groups = {}
+    for params in configs:
+        groups.setdefault(tuple(params[k] for k in SIM_KEYS), []).append(params)
+    return groups
+
+
+# ==============================
+# DATA (LOADED ONCE)
+# ==============================
+
+def load_sweep_data(phase3_file=PHASE3_FILE, data_dir=FIVE_MIN_DATA_DIR, entries=None):
+    """
+    Phase-3 entries + packed 5-minute bars for every trade (before any
+    filtering, which depends on the swept COST_BUFFER).
+
+    Args:
+        entries: Phase-3 result frame to use instead of phase3_file
+                 (e.g. phase3_sensitivity.load_entries(combo))
+
+    Returns:
+        dict of aligned per-trade arrays plus packed bars
+    """
+    df = pd.read_excel(phase3_file) if entries is None else entries.copy()
+    df = df.rename(columns={
+        "Stock": "symbol",
+        "Entry Price (₹)": "entry_price",
+        "Stop-Loss (₹)": "stop_loss",
+        "Target (₹)": "target",
+        "Date": "date",
+        "Entry Time": "buy_time",
+    })
+    if "VelocityScore" in df.columns:
+        velocity = pd.to_numeric(df["VelocityScore"], errors="coerce").fillna(75.0)
+    else:
+        velocity = pd.Series(75.0, index=df.index)
+
+    keys, buy_times = bar_store.trade_keys(df)
+    store = bar_store.five_min_store(data_dir)
+    packed, starts, ends, has_data, _ = bar_store.pack_trades(store, keys)
+    print(store.report())
+
+    # Trade slices (-1 for trades without data)
+    full_starts = np.full(len(df), -1, dtype=np.int64)
+    full_ends = np.full(len(df), -1, dtype=np.int64)
+    full_starts[has_data] = starts
+    full_ends[has_data] = ends
+
+    entry = pd.to_numeric(df["entry_price"], errors="coerce").to_numpy(dtype=float)
+    target_raw = pd.to_numeric(df["target"], errors="coerce").to_numpy(dtype=float)
+    stop = pd.to_numeric(df["stop_loss"], errors="coerce").to_numpy(dtype=float)
+
+    # Phase-4B groups by date; trades without a date never get allocated
+    day_codes, days = pd.factorize(df["date"], sort=True)
+
+    return {
+        "packed": packed,
+        "symbol": df["symbol"].astype(str).to_numpy(),
+        "starts": full_starts,
+        "ends": full_ends,
+        "has_data": has_data,
+        "entry_tods": np.array([exit_engine.time_to_seconds(t) for t in buy_times], dtype=np.int64),
+        "entry": entry,
+        "stop": stop,
+        "target": target_raw,
+        "potential": (target_raw - entry) / entry,
+        "s_i": np.clip(velocity.to_numpy(dtype=float) - 50, 0, None),
+        "day": day_codes,
+        "n_days": len(days),
+        "days": np.asarray(days),
+    }
+
+
+PER_TRADE_KEYS = ["symbol", "starts", "ends", "has_data", "entry_tods", "entry", "stop", "target", "potential", "s_i", "day"]
+
+
+def subset(data, idx):
+    """Sweep data restricted to trades `idx` (packed bars and day codes shared)."""
+    out = dict(data)
+    for k in PER_TRADE_KEYS:
+        out[k] = data[k][idx]
+    return out
+
+
+# ==============================
+# EVALUATION
+# ==============================
+
+def allocate(data, params, scale_day=True):
+    """
+    Phase-4 edge filter + 4A–4E sizing for one parameter set, vectorized.
+
+    Args:
+        scale_day: apply 4E (pro-rate the day down to C_PER_DAY); off when
+                   capital is enforced trade by trade instead
+
+    Returns:
+        quantity per trade (0 = not traded)
+    """
+    day = data["day"]
+    entry = np.nan_to_num(data["entry"], nan=0.0)
+    keep = (data["potential"] >= params["COST_BUFFER"]) & (day >= 0)
+    n_days = data["n_days"]
+    d = np.where(keep, day, 0)
+
+    s_i = np.where(keep, data["s_i"], 0.0)
+    sum_s = np.bincount(d, weights=s_i, minlength=n_days)[d]
+    weight = np.divide(s_i, sum_s, out=np.zeros_like(s_i), where=sum_s > 0)
+
+    c_day = float(params["C_PER_DAY"])
+    loss_cap = np.nan_to_num(c_day * params["L_PCT"] * weight, nan=0.0)
+    risk = np.nan_to_num(entry - data["stop"], nan=0.0)
+    qty_risk = np.floor(np.divide(loss_cap, risk, out=np.zeros_like(risk), where=risk > 0))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        qty_cap = np.floor((c_day * params["C_PCT"]) / entry)
+    qty_cap[~np.isfinite(qty_cap)] = 0
+    qty = np.where(keep, np.minimum(qty_risk, qty_cap), 0.0)
+
+    if not scale_day:
+        return qty
+
+    # 4E — scale the day down to C_PER_DAY
+    deployed = np.bincount(d, weights=qty * entry, minlength=n_days)[d]
+    over = keep & (deployed > c_day)
+    qty[over] = np.floor(qty[over] * (c_day / deployed[over]))
+    return qty
+
+
+def simulate(data, sim_params, trades):
+    """Exit prices for `trades` (indexes) under one tiers / force-exit setting."""
+    exit_price = data["entry"][trades].copy()
+    sel = trades[data["has_data"][trades]]
+    if len(sel):
+        h, m = (int(x) for x in str(sim_params["FORCE_EXIT_TIME"]).split(":")[:2])
+        sim = exit_engine.simulate_trades(
+            data["packed"], data["starts"][sel], data["ends"][sel],
+            entry_tods=data["entry_tods"][sel],
+            entry_prices=data["entry"][sel],
+            stops=data["stop"][sel],
+            targets=data["target"][sel],
+            force_exit_tod=h * 3600 + m * 60,
+            tiers=(sim_params["TIER_BREAKEVEN_R"], sim_params["TIER_LOCK_R"], sim_params["TIER_LOCK_PROFIT_R"],
+                   sim_params["TIER_TRAIL_R"], sim_params["TIER_TRAIL_DIST_R"]),
+            cost_buffer_pct=sim_params["BREAKEVEN_BUFFER_PCT"],
+        )
+        pos = np.searchsorted(trades, sel)
+        exit_price[pos] = np.where(sim["exit_idx"] >= 0, sim["exit_price"], data["entry"][sel])
+    return exit_price
+
+
+def trade_pnl(data, params, qty, trades, exit_price):
+    """(gross, costs) per trade; slippage is charged on both legs."""
+    entry = data["entry"][trades]
+    q = qty[trades]
+    gross = (exit_price - entry) * q
+    costs = q * entry * params["TRANSACTION_COST_PCT"] + q * (entry + exit_price) * params["SLIPPAGE_PCT"]
+    return gross, costs
+
+
+def max_drawdown(daily_pnl):
+    equity = np.cumsum(daily_pnl)
+    peak = np.maximum.accumulate(np.concatenate([[0.0], equity]))[1:]
+    return float(np.max(peak - equity)) if len(equity) else 0.0
+
+
+def run_group(data, configs, max_dd=MAX_DRAWDOWN, day_chunks=DAY_CHUNKS):
+    """
+    Evaluate every config sharing one exit simulation.
+
+    Days are simulated chunk by chunk; configs breaching max_dd are pruned,
+    and the remaining chunks are skipped once every config is pruned.
+    """
+    n_days = data["n_days"]
+    traded = [(params, allocate(data, params)) for params in configs]
+    any_traded = np.zeros(len(data["day"]), dtype=bool)
+    for _, qty in traded:
+        any_traded |= qty > 0
+
+    state = [{"daily": np.zeros(n_days), "wins": 0, "trades": 0, "gross": 0.0, "costs": 0.0,
+              "pruned": False, "days": 0} for _ in configs]
+
+    bounds = np.linspace(0, n_days, min(day_chunks, n_days) + 1).astype(int) if n_days else [0, 0]
+    for lo, hi in zip(bounds[:-1], bounds[1:]):
+        live = [i for i, st in enumerate(state) if not st["pruned"]]
+        if not live:
+            break
+        trades = np.flatnonzero(any_traded & (data["day"] >= lo) & (data["day"] < hi))
+        exit_price = simulate(data, configs[0], trades)
+
+        for i in live:
+            params, qty = traded[i]
+            st = state[i]
+            gross, costs = trade_pnl(data, params, qty, trades, exit_price)
+            open_ = qty[trades] > 0
+            final = gross - costs
+            np.add.at(st["daily"], data["day"][trades][open_], final[open_])
+            st["trades"] += int(open_.sum())
+            st["wins"] += int((final[open_] > 0).sum())
+            st["gross"] += float(gross[open_].sum())
+            st["costs"] += float(costs[open_].sum())
+            st["days"] = int(hi)
+            if max_dd is not None and max_drawdown(st["daily"][:hi]) > max_dd:
+                st["pruned"] = True
+
+    rows = []
+    for params, st in zip(configs, state):
+        daily = st["daily"][:st["days"]]
+        rows.append({
+            "config_id": config_id(params),
+            "status": "PRUNED" if st["pruned"] else "DONE",
+            "days": st["days"],
+            "trades": st["trades"],
+            "net_pnl": round(st["gross"] - st["costs"], 2),
+            "gross_pnl": round(st["gross"], 2),
+            "costs": round(st["costs"], 2),
+            "win_rate": round(st["wins"] / st["trades"] * 100.0, 2) if st["trades"] else 0.0,
+            "max_drawdown": round(max_drawdown(daily), 2),
+            **params,
+        })
+    return rows
+
+
+# ==============================
+# PROCESS POOL
+# ==============================
+
+_DATA = None
+
+
+def _init_worker(data):
+    global _DATA
+    _DATA = data
+
+
+def _run_group_worker(configs, max_dd, day_chunks):
+    return run_group(_DATA, configs, max_dd, day_chunks)
+
+
+def load_done(results_file=RESULTS_FILE):
+    """config_ids already in the results file (for resume)."""
+    if not os.path.exists(results_file):
+        return set()
+    try:
+        return set(pd.read_csv(results_file, usecols=["config_id"])["config_id"].astype(str))
+    except (ValueError, pd.errors.EmptyDataError):
+        return set()
+
+
+def append_rows(rows, results_file=RESULTS_FILE):
+    header = not os.path.exists(results_file) or os.path.getsize(results_file) == 0
+    pd.DataFrame(rows).to_csv(results_file, mode="a", header=header, index=False)
+
+
+def run_sweep(grid=None, workers=WORKERS, max_dd=MAX_DRAWDOWN, day_chunks=DAY_CHUNKS,
+              results_file=RESULTS_FILE, data=None):
+    """
+    Run (or resume) a sweep; returns the full results table sorted by net P&L.
+    """
+    os.makedirs(os.path.dirname(results_file) or ".", exist_ok=True)
+    configs = expand_grid(grid or DEFAULT_GRID)
+    done = load_done(results_file)
+    todo = [p for p in configs if config_id(p) not in done]
+    groups = list(group_by_simulation(todo).values())
+    print(f"🧪 Sweep: {len(configs)} settings, {len(configs) - len(todo)} already done, "
+          f"{len(groups)} exit simulations to run on {workers} workers")
+
+    started = _time.perf_counter()
+    if groups:
+        data = data or load_sweep_data()
+        finished = 0
+        if workers <= 1:
+            for configs_ in groups:
+                append_rows(run_group(data, configs_, max_dd, day_chunks), results_file)
+                finished += len(configs_)
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(data,)) as pool:
+                futures = [pool.submit(_run_group_worker, g, max_dd, day_chunks) for g in groups]
+                for fut in as_completed(futures):
+                    rows = fut.result()
+                    append_rows(rows, results_file)
+                    finished += len(rows)
+                    print(f"   {finished}/{len(todo)} settings done")
+        print(f"⏱️ Sweep finished in {_time.perf_counter() - started:.1f}s")
+
+    results = pd.read_csv(results_file)
+    results = results[results["config_id"].astype(str).isin({config_id(p) for p in configs})]
+    return results.sort_values("net_pnl", ascending=False).reset_index(drop=True)
+
+
+def main():
+    grid = None
+    if len(sys.argv) > 1:
+        with open(sys.argv[1]) as f:
+            grid = json.load(f)
+    results = run_sweep(grid)
+    swept = list(grid or DEFAULT_GRID)
+    print("\n🏆 Top settings by net P&L:")
+    print(results[RESULT_COLUMNS[1:] + swept].head(10).to_string(index=False))
+    print(f"\n✅ Results table: {RESULTS_FILE}")
+
+
+if __name__ == "__main__":
+    main()
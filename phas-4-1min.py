@@ -7,12 +7,15 @@ import warnings
 from datetime import time, datetime
 import logging
 
+import exit_engine
+import bar_store
+import risk_engine
+import report_writer
+import open_trade_tracker
+
 # Suppress pandas datetime parsing warnings
 warnings.filterwarnings('ignore', message='Could not infer format')
 
-import openpyxl
-from openpyxl.styles import PatternFill, Font, Alignment
-from openpyxl.formatting.rule import CellIsRule
 # ===============================
 # CONFIG
 # ===============================
@@ -61,49 +64,6 @@ logging.basicConfig(
 )
 logger = logging.getLogger("phase4")
 
-# ===============================
-# TRAILING STOP CALCULATION
-# ===============================
-def calculate_trailing_stop(entry_price, initial_stop, current_high, current_stop):
-    """
-    Calculate trailing stop-loss based on 3-tier R-multiple strategy:
-    - 1R: Move to breakeven + costs
-    - 1.5R: Lock 0.5R profit
-    - 2R+: Trail by 1R distance from high
-    
-    Args:
-        entry_price: Entry price of the trade
-        initial_stop: Initial stop-loss price
-        current_high: Highest price achieved since entry
-        current_stop: Current stop-loss price
-    
-    Returns:
-        new_stop: Updated stop-loss price
-    """
-    R = entry_price - initial_stop
-    
-    # Cost buffer (approx 0.1% or fixed amount to cover brokerage)
-    cost_buffer = entry_price * 0.001 
-    
-    new_stop = current_stop
-    
-    # 1. Check Breakeven Trigger (1R)
-    if current_high >= (entry_price + R):
-        # Move to Entry + Costs (Ensure we don't move stop DOWN if it's already higher)
-        new_stop = max(new_stop, entry_price + cost_buffer)
-        
-    # 2. Check Profit Locking Trigger (1.5R)
-    if current_high >= (entry_price + (1.5 * R)):
-        # Lock 0.5R profit
-        new_stop = max(new_stop, entry_price + (0.5 * R))
-        
-    # 3. Dynamic Trail (Deep Profit > 2R)
-    if current_high >= (entry_price + (2.0 * R)):
-        # Trail by 1R distance from High
-        new_stop = max(new_stop, current_high - R)
-        
-    return new_stop
-
 # ===============================
 # LOAD PHASE-3 OUTPUT
 # ===============================
@@ -228,267 +188,75 @@ df = pd.concat(all_days_data, ignore_index=True) if all_days_data else pd.DataFr
 # ===============================
 # PHASE-4 EXIT RESOLUTION (5-MIN BACKTEST)
 # ===============================
-sell_prices = []
-sell_times = []
-exit_reasons = []
-pnls = []
-
-exec_entry_times = []
-exec_entry_prices = []
-
-# State persistence lists for Phase-4B continuity
-state_highest_prices = []
-state_current_stops = []
-state_last_candle_times = []
-state_trailing_armed = [] # FIX #1: Persist trailing armed state
-
 df = df.copy()
 
-for _, row in df.iterrows():
-    symbol = row["symbol"]
-    buy_price = row["entry_price"]  # default
-    stop = row["stop_price"]
-    target = row["target_price"]
-    qty = row["quantity"]
-    buy_time = row["buy_time"]
-
-    # normalize buy_time to a time object if possible
-    if pd.isna(buy_time):
-        buy_time = time(0, 0)
-    elif isinstance(buy_time, str):
-        try:
-            bt = pd.to_datetime(buy_time).time()
-            buy_time = bt
-        except Exception:
-            try:
-                parts = [int(x) for x in buy_time.split(":")]
-                buy_time = time(*parts[:3])
-            except Exception:
-                buy_time = time(0, 0)
-    elif isinstance(buy_time, pd.Timestamp):
-        buy_time = buy_time.time()
-
-    # Build path to 1-minute CSV: downloaded_data/1min_candles/<SYMBOL>.csv
-    date_val = row.get("date")
-    date_str = None
-    if pd.isna(date_val):
-        date_str = None
-    else:
-        try:
-            date_ts = pd.to_datetime(date_val)
-            date_str = date_ts.strftime("%Y-%m-%d")
-        except Exception:
-            date_str = str(date_val)
-
-    # Updated Logic: Data is stored as downloaded_data/1min/1min/<SYMBOL>/<DATE>.csv
-    one_min_file = None
-    if date_str:
-        one_min_file = os.path.join(ONE_MIN_DATA_DIR, symbol, f"{date_str}.csv")
-    
-    # Fallback to old path if not found (optional, but good for safety)
-    if not one_min_file or not os.path.exists(one_min_file):
-        # check if maybe it's the old structure
-        alt_file = os.path.join(ONE_MIN_DATA_DIR, f"{symbol}.csv")
-        if os.path.exists(alt_file):
-            one_min_file = alt_file
-
-
-    sell_price = buy_price
-    sell_time = None
-    exit_reason = "NO_EXIT"
-    had_post_buy_candle = False
-    last_candle_close = None
-    last_candle_time = None
-    
-    # Initialize trailing stop variables
-    initial_stop = stop  # Store the original stop for R calculation
-    current_stop = stop  # This will be updated dynamically
-    highest_price = buy_price  # Track the highest price achieved
-    trailing_armed = False     # Track if 1R target was crossed
-
-    if one_min_file and os.path.exists(one_min_file):
-        mdf = pd.read_csv(one_min_file)
-        # normalize column names to lowercase
-        mdf.columns = [c.lower() for c in mdf.columns]
-
-        # 1-min data has 'date' column with full datetime (e.g., '2025-11-03 09:15:00+05:30')
-        if "date" in mdf.columns:
-            try:
-                mdf["datetime"] = pd.to_datetime(mdf["date"])
-            except Exception:
-                mdf["datetime"] = pd.NaT
-        elif "time" in mdf.columns and date_str:
-             # If only 'time' exists (e.g. 09:15), combine with the trade date
-             try:
-                 mdf["datetime"] = pd.to_datetime(f"{date_str} " + mdf["time"])
-             except Exception:
-                 mdf["datetime"] = pd.NaT
-        else:
-            # cannot interpret timestamps; skip
-            mdf["datetime"] = pd.NaT
-
-        # Filter for the specific trade date only
-        if date_str:
-            mdf = mdf[mdf["datetime"].dt.strftime("%Y-%m-%d") == date_str]
-        
-        mdf = mdf.sort_values("datetime")
-
-        # -------------------------------
-        # MODEL A1 ENTRY EXECUTION (BROKER-REALISTIC)
-        # Phase-3 confirms on 5m close
-        # Execute at OPEN of the NEXT 1-min candle
-        # -------------------------------
-
-        actual_entry_time = None
-        actual_entry_price = None
-
-        for _, m in mdf.iterrows():
-            if pd.isna(m.get("datetime")):
-                continue
-
-            t = m["datetime"].time()
-
-            # first 1-minute candle AFTER Phase-3 confirmation
-            if t > buy_time:
-                actual_entry_time = t
-                actual_entry_price = float(m.get("open", buy_price))
-                break
-
-        # Apply execution
-        if actual_entry_time:
-            buy_time = actual_entry_time
-            buy_price = actual_entry_price
-
-        for _, m in mdf.iterrows():
-            # skip rows without valid datetime
-            if pd.isna(m.get("datetime")):
-                continue
-            t = m["datetime"].time()
-
-            # start checking only from the candle strictly after the buy_time
-            if t <= buy_time:
-                continue
-
-            had_post_buy_candle = True
-            last_candle_close = float(m.get("close", np.nan)) if not pd.isna(m.get("close", np.nan)) else None
-            last_candle_time = t
-
-            high = float(m.get("high", np.nan))
-            low = float(m.get("low", np.nan))
-            op = float(m.get("open", np.nan))
-            close = float(m.get("close", np.nan))
-
-            # Update highest price if this candle made a new high
-            if not np.isnan(high) and high > highest_price:
-                highest_price = high
-                # Check 1R trigger to arm trailing stop
-                if not trailing_armed and highest_price >= (buy_price + (buy_price - initial_stop)):
-                    trailing_armed = True
-                
-                # Recalculate trailing stop based on new high
-                current_stop = calculate_trailing_stop(buy_price, initial_stop, highest_price, current_stop)
-
-            # Check exits using the DYNAMIC trailing stop
-            hit_stop = (not np.isnan(low)) and (low <= current_stop)
-            hit_target = (not np.isnan(high)) and (high >= target)
-
-            # Both hit in same candle → approximate intrabar order using distance from open
-            if hit_stop and hit_target:
-                dist_stop = abs(op - current_stop) if not np.isnan(op) else float('inf')
-                dist_target = abs(op - target) if not np.isnan(op) else float('inf')
-                if dist_stop <= dist_target:
-                    sell_price = current_stop
-                    exit_reason = "TRAILING_STOP_INTRABAR"
-                else:
-                    sell_price = target
-                    exit_reason = "TARGET_INTRABAR"
-                sell_time = t
-                break
-
-            if hit_stop:
-                sell_price = current_stop
-                sell_time = t
-                # Determine which tier of trailing stop was hit
-                if current_stop > buy_price:
-                    exit_reason = "TRAILING_STOP_PROFIT"
-                else:
-                    exit_reason = "STOP_LOSS"
-                break
-
-            if hit_target:
-                sell_price = target
-                sell_time = t
-                exit_reason = "TARGET"
-                break
-
-            # Force-exit at or after FORCE_EXIT_TIME using candle close
-            if t >= FORCE_EXIT_TIME:
-                sell_price = close if not np.isnan(close) else m.get("close", buy_price)
-                sell_time = t
-                exit_reason = "TIME_EXIT_1510"
-                break
-
-        # If no explicit exit was found but there were candles after the buy_time,
-        # close at the last available candle close to approximate end-of-data exit.
-        if exit_reason == "NO_EXIT" and had_post_buy_candle and last_candle_close is not None:
-            sell_price = last_candle_close
-            sell_time = last_candle_time
-            exit_reason = "NO_EXIT_LASTCANDLE"
-    else:
-        # No 1-minute data available for this symbol — close at buy price and mark
-        sell_price = buy_price
-        sell_time = buy_time
-        exit_reason = "NO_1M_DATA"
-        # Set default state for trades with no data
-        highest_price = buy_price
-        current_stop = stop
-        last_candle_time = buy_time
-
-    pnl = (sell_price - buy_price) * qty
-
-    # Normalize sell_time to string for consistent Excel output
-    st = ""
-    try:
-        if isinstance(sell_time, time):
-            st = sell_time.strftime("%H:%M:%S")
-        elif isinstance(sell_time, str):
-            st = sell_time
-        elif pd.isna(sell_time) or sell_time is None:
-            st = ""
-        else:
-            st = str(sell_time)
-    except Exception:
-        st = ""
-    
-    # Normalize last_candle_time to string
-    lct = ""
-    try:
-        if isinstance(last_candle_time, time):
-            lct = last_candle_time.strftime("%H:%M:%S")
-        elif pd.isna(last_candle_time) or last_candle_time is None:
-            lct = ""
-        else:
-            lct = str(last_candle_time)
-    except Exception:
-        lct = ""
-
-    # Append to result lists (SINGLE append point)
-    sell_prices.append(sell_price)
-    sell_times.append(st)
-    exit_reasons.append(exit_reason)
-    pnls.append(pnl)
-    
-    # Execution prices (SINGLE append point)
-    exec_entry_times.append(buy_time)
-    exec_entry_prices.append(buy_price)
-    
-    # State for Phase-4B continuity (SINGLE append point)
-    state_highest_prices.append(highest_price)
-    state_current_stops.append(current_stop)
-    state_last_candle_times.append(lct)
-    state_trailing_armed.append(trailing_armed)
+# 1) Parse signal times + (symbol, date) keys per trade
+# Data is stored as downloaded_data/1min/1min/<SYMBOL>/<DATE>.csv, with the
+# old monolithic <SYMBOL>.csv as fallback; each symbol-day is loaded once.
+BARS = bar_store.one_min_store(ONE_MIN_DATA_DIR)
+trade_keys, buy_times = bar_store.trade_keys(df)
+buy_secs = np.array([exit_engine.time_to_seconds(t) for t in buy_times], dtype=np.int64)
+
+# 2) Simulate every trade in one batch (Numba kernel / NumPy fallback)
+# -------------------------------
+# MODEL A1 ENTRY EXECUTION (BROKER-REALISTIC)
+# Phase-3 confirms on 5m close
+# Execute at OPEN of the NEXT 1-min candle, then check exits strictly after it.
+# The trailing high starts from the Phase-3 entry price.
+# -------------------------------
+packed, starts, ends, has_data, _ = bar_store.pack_trades(BARS, trade_keys)
+logger.info(BARS.report())
+phase3_entry = df["entry_price"].to_numpy(dtype=float)[has_data] if len(df) else np.zeros(0)
+sim = exit_engine.simulate_trades(
+    packed, starts, ends,
+    entry_tods=buy_secs[has_data],
+    entry_prices=phase3_entry,
+    stops=df["stop_price"].to_numpy(dtype=float)[has_data] if len(df) else np.zeros(0),
+    targets=df["target_price"].to_numpy(dtype=float)[has_data] if len(df) else np.zeros(0),
+    force_exit_tod=exit_engine.time_to_seconds(FORCE_EXIT_TIME),
+    fill_next_open=True,
+    start_highs=phase3_entry,
+    stop_reason="STOP_LOSS",
+)
 
-# Assign accumulated lists to DataFrame
+# 3) Map results back to trades (array ops; j-th sim row = i-th trade with data)
+# Trades without 1-minute data close flat at the Phase-3 entry ("NO_1M_DATA").
+tods = np.append(packed[4], -1)  # sentinel: index -1 (no fill / no exit) → -1 seconds
+d = np.flatnonzero(has_data)
+exec_entry_prices = df["entry_price"].to_numpy(dtype=float).copy() if len(df) else np.zeros(0)
+exec_entry_times = np.empty(len(df), dtype=object)
+exec_entry_times[:] = buy_times
+sell_prices = exec_entry_prices.copy()
+exit_reasons = np.full(len(df), "NO_1M_DATA", dtype=object)
+state_highest_prices = exec_entry_prices.copy()
+state_current_stops = df["stop_price"].to_numpy(dtype=float).copy() if len(df) else np.zeros(0)
+state_trailing_armed = np.zeros(len(df), dtype=bool)
+sell_secs = buy_secs.copy()
+last_secs = buy_secs.copy()
+
+fill = sim["fill_idx"]
+filled = fill >= 0
+exec_entry_times[d[filled]] = exit_engine.seconds_to_times(tods[fill[filled]])
+exec_entry_prices[d[filled]] = sim["fill_price"][filled]
+
+k = sim["exit_idx"]
+exited = k >= 0
+sell_prices[d[exited]] = sim["exit_price"][exited]
+exit_reasons[d] = np.where(exited, sim["reason"], "NO_EXIT")
+sell_secs[d] = tods[k]
+# Last candle seen: the exit bar, else the day's last bar if it is past the fill
+last_bar = tods[ends - 1]
+last_secs[d] = np.where(exited, tods[k], np.where(filled & (last_bar > tods[fill]), last_bar, -1))
+
+state_highest_prices[d] = sim["highest"]
+state_current_stops[d] = sim["stop"]
+state_trailing_armed[d] = sim["armed"]
+
+pnls = (sell_prices - exec_entry_prices) * (df["quantity"].to_numpy(dtype=float) if len(df) else np.zeros(0))
+sell_times = exit_engine.seconds_to_strings(sell_secs)
+state_last_candle_times = exit_engine.seconds_to_strings(last_secs)
+
+# Assign result arrays to DataFrame
 df["exec_entry_time"] = exec_entry_times
 df["exec_entry_price"] = exec_entry_prices
 df["highest_price_state"] = state_highest_prices
@@ -536,30 +304,20 @@ else:
     logger.info("  Closed: %s", len(closed_trades))
     logger.info("  Still Open: %s", len(open_trades))
 
-    # Save open trades state for Phase-4B
+    # Hand open trades to the Phase-4B tracker in process (typed .npz state for resume)
     if len(open_trades) > 0:
-        state_file = os.path.join(OUTPUT_DIR, "phase-4b-tracking-state.csv")
-        open_trades.to_csv(state_file, index=False)
-        logger.info("[SAVED] Open trades saved to: %s", state_file)
-        logger.info("[STARTING] Triggering Phase-4B Live Tracker...")
-        
-        import subprocess
+        state_file = os.path.join(OUTPUT_DIR, "phase-4b-tracking-state.npz")
+        logger.info("[STARTING] Phase-4B open-trade tracker (state: %s)...", state_file)
         try:
-            subprocess.run([sys.executable, "phase-4b-live.py"], check=True)
-        except subprocess.CalledProcessError as e:
+            tracker = open_trade_tracker.OpenTradeTracker.from_frame(open_trades)
+            tracked = open_trade_tracker.track(tracker, state_path=state_file)
+            logger.info("[PHASE-4B] Closed: %s | Still open: %s", int((~tracked["is_open"]).sum()), int(tracked["is_open"].sum()))
+        except Exception as e:
             logger.error("Phase-4B Failed: %s", e)
-        except KeyboardInterrupt:
-            logger.info("Live tracking stopped by user.")
 
 # Use closed_trades for Excel output
 df = closed_trades
 
-# Add final columns to df (closed trades only)
-df["sell_price"] = sell_prices[:len(df)]
-df["sell_time"] = sell_times[:len(df)]
-df["exit_reason"] = exit_reasons[:len(df)]
-df["pnl"] = pnls[:len(df)]
-
 # Ensure integer quantities
 if not df.empty and "quantity" in df.columns:
     df["quantity"] = df["quantity"].astype(int)
@@ -578,125 +336,53 @@ trade_log_cols = [
     'TransactionCost', 'FinalProfit', 'P&L%'
 ]
 
-# Build trade log rows
-trade_rows = []
-for _, r in df.iterrows():
-    date_val = r.get('date')
-    try:
-        date_str = pd.to_datetime(date_val).strftime('%Y-%m-%d')
-    except Exception:
-        date_str = str(date_val)
+# Build trade log (column-wise; costs applied to all trades at once)
+def col(name, default=np.nan):
+    return df[name] if name in df.columns else pd.Series([default] * len(df), index=df.index, dtype=object)
 
-    invested = float(r.get('trade_value', 0.0))
-    profit_before = float(r.get('pnl', 0.0))
+if df.empty:
+    trade_log_df = pd.DataFrame(columns=trade_log_cols)
+else:
+    dates = pd.to_datetime(df['date'], errors='coerce')
+    invested = col('trade_value', 0.0).astype(float)
+    profit_before = col('pnl', 0.0).astype(float)
     tx_cost = invested * TRANSACTION_COST_PCT
     final_profit = profit_before - tx_cost
-    pl_pct = (final_profit / invested * 100.0) if invested > 0 else 0.0
-
-    # OHLCV will be filled from daily merge file (not from minute data here)
-    day_open = np.nan
-    day_high = np.nan
-    day_low = np.nan
-    day_close = np.nan
-    day_vol = np.nan
-
-    row = {
-        'Date': date_str,
-        'Stock': r.get('symbol'),
-        'Mode': r.get('mode', ''),
-        'Weight': float(r.get('weight', 0.0)),
-        'Open': day_open,   # Will be overwritten by daily merge if available
-        'High': day_high,
-        'Low': day_low,
-        'Close': day_close,
-        'Volume': day_vol,
-        'DataSource': r.get('DataSource') or ONE_MIN_DATA_DIR,
-        'CandleTimeframe': r.get('CandleTimeframe') or '1m',
-        'EntryTime': r.get('exec_entry_time', r.get('buy_time')),
-        'EntryPrice': float(r.get('exec_entry_price', r.get('entry_price', 0.0))),
-        'StopLoss': float(r.get('stop_price', np.nan)),
-        'Target': float(r.get('target_price', np.nan)),
-        'ExitTime': r.get('sell_time'),
-        'ExitReason': r.get('exit_reason'),
-        'ExitPrice': float(r.get('sell_price', 0.0)),
-        'Quantity': int(r.get('quantity', 0)),
+    data_source = col('DataSource', None)
+    timeframe = col('CandleTimeframe', None)
+
+    trade_log_df = pd.DataFrame({
+        'Date': dates.dt.strftime('%Y-%m-%d').where(dates.notna(), df['date'].astype(str)),
+        'Stock': col('symbol', None),
+        'Mode': col('mode', ''),
+        'Weight': col('weight', 0.0).astype(float),
+        # OHLCV will be filled from daily merge file (not from minute data here)
+        'Open': np.nan,
+        'High': np.nan,
+        'Low': np.nan,
+        'Close': np.nan,
+        'Volume': np.nan,
+        'DataSource': data_source.where(data_source.astype(bool), ONE_MIN_DATA_DIR),
+        'CandleTimeframe': timeframe.where(timeframe.astype(bool), '1m'),
+        'EntryTime': df['exec_entry_time'],
+        'EntryPrice': df['exec_entry_price'].astype(float),
+        'StopLoss': col('stop_price').astype(float),
+        'Target': col('target_price').astype(float),
+        'ExitTime': df['sell_time'],
+        'ExitReason': df['exit_reason'],
+        'ExitPrice': df['sell_price'].astype(float),
+        'Quantity': col('quantity', 0).astype(int),
         'InvestedAmount': invested,
         'ProfitBeforeCosts': profit_before,
         'TransactionCost': tx_cost,
         'FinalProfit': final_profit,
-        'P&L%': pl_pct
-    }
-    trade_rows.append(row)
-
-trade_log_df = pd.DataFrame(trade_rows, columns=trade_log_cols)
+        'P&L%': np.where(invested > 0, final_profit / invested.where(invested > 0, 1.0) * 100.0, 0.0),
+    }, columns=trade_log_cols).reset_index(drop=True)
 
 ohlcv_path = os.path.join('downloaded_data', 'daily_candles_nifty500.xlsx')
 if os.path.exists(ohlcv_path):
     try:
-        ohl = pd.read_excel(ohlcv_path)
-        ohl.columns = [str(c).strip() for c in ohl.columns]
-        
-        # Normalize symbol column
-        if 'Symbol' in ohl.columns:
-            ohl['Symbol'] = ohl['Symbol'].astype(str).str.upper().str.strip()
-        elif 'symbol' in ohl.columns:
-            ohl['Symbol'] = ohl['symbol'].astype(str).str.upper().str.strip()
-        
-        # Handle Datetime column (not Date)
-        if 'Datetime' in ohl.columns:
-            ohl['Date'] = pd.to_datetime(ohl['Datetime']).dt.strftime('%Y-%m-%d')
-        elif 'Date' in ohl.columns:
-            ohl['Date'] = pd.to_datetime(ohl['Date']).dt.strftime('%Y-%m-%d')
-        elif 'date' in ohl.columns:
-            ohl['Date'] = pd.to_datetime(ohl['date']).dt.strftime('%Y-%m-%d')
-
-        # Normalize OHLCV columns to capitalized
-        col_map = {
-            'open': 'Open', 'high': 'High', 'low': 'Low', 'close': 'Close', 'volume': 'Volume',
-            'Open': 'Open', 'High': 'High', 'Low': 'Low', 'Close': 'Close', 'Volume': 'Volume'
-        }
-        ohl.rename(columns=col_map, inplace=True)
-
-        # keep only relevant OHLCV cols that exist
-        ohlv_cols = [c for c in ['Open','High','Low','Close','Volume'] if c in ohl.columns]
-
-        # create lookup dict keyed by (symbol,date)
-        ohl['__key'] = ohl['Symbol'].astype(str) + '||' + ohl['Date'].astype(str)
-        ohl_lookup = ohl.set_index('__key')[ohlv_cols].to_dict(orient='index')
-
-        # normalize trade keys and attempt fast lookup
-        def try_get_ohlv(stock, date):
-            if pd.isna(stock) or pd.isna(date):
-                return None
-            k = str(stock).upper().strip() + '||' + str(date)
-            if k in ohl_lookup:
-                return ohl_lookup[k]
-            # fallback: try exact match in symbols for that date
-            for idx,row in ohl[ohl['Date']==str(date)].iterrows():
-                sym = row['Symbol']
-                if sym == str(stock).upper().strip():
-                    return row[ohlv_cols].to_dict()
-            # try partial match
-            for idx,row in ohl[ohl['Date']==str(date)].iterrows():
-                sym = row['Symbol']
-                if str(stock).upper().strip() in sym or sym in str(stock).upper().strip():
-                    return row[ohlv_cols].to_dict()
-            return None
-
-        # apply per-row fill
-        for i, tr in trade_log_df.iterrows():
-            stock = tr['Stock']
-            datev = tr['Date']
-            ovals = try_get_ohlv(stock, datev)
-            if ovals:
-                for c in ohlv_cols:
-                    trade_log_df.at[i, c] = ovals.get(c)
-        
-        # Ensure OHLCV columns are numeric (not strings)
-        for col in ['Open', 'High', 'Low', 'Close', 'Volume']:
-            if col in trade_log_df.columns:
-                trade_log_df[col] = pd.to_numeric(trade_log_df[col], errors='coerce')
-                
+        trade_log_df = bar_store.enrich_ohlcv(trade_log_df, bar_store.load_daily_ohlcv(ohlcv_path))
     except Exception as e:
         logger.warning("Could not load OHLCV data: %s", e)
         pass
@@ -805,138 +491,27 @@ alg_config = {
 }
 config_df = pd.DataFrame(list(alg_config.items()), columns=['Parameter','Value'])
 
+# ===============================
+# RISK ANALYSIS (BOOTSTRAP / MONTE CARLO)
+# ===============================
+risk_df, distribution_df = risk_engine.analyze(trade_log_df, C_PER_DAY, L_PCT)
+
 # Write sheets
 if len(df) > 0:
-    # Write sheets
-    with pd.ExcelWriter(OUTPUT_FILE, engine='openpyxl') as writer:
-        trade_log_df.to_excel(writer, sheet_name='Trade Log', index=False)
-        daily_summary.to_excel(writer, sheet_name='Daily Summary', index=False)
-        performance_df.to_excel(writer, sheet_name='Performance', index=False)
-        config_df.to_excel(writer, sheet_name='Algorithm Config', index=False)
-
-    # Load workbook and apply formatting
-    wb = openpyxl.load_workbook(OUTPUT_FILE)
-
-    def format_sheet(ws, header_fill=None, pnl_col_name=None):
-        hdr = Font(bold=True)
-        for cell in ws[1]:
-            cell.font = hdr
-            cell.alignment = Alignment(horizontal='center')
-            if header_fill:
-                cell.fill = header_fill
-        if pnl_col_name:
-            pnl_col = None
-            for idx, cell in enumerate(ws[1], start=1):
-                if str(cell.value).lower() == pnl_col_name.lower():
-                    pnl_col = idx
-                    break
-            if pnl_col and ws.max_row > 1:
-                col_letter = openpyxl.utils.get_column_letter(pnl_col)
-                green = PatternFill(start_color='C6EFCE', end_color='C6EFCE', fill_type='solid')
-                red = PatternFill(start_color='FFC7CE', end_color='FFC7CE', fill_type='solid')
-                range_str = f'{col_letter}2:{col_letter}{ws.max_row}'
-                ws.conditional_formatting.add(range_str,
-                                            CellIsRule(operator='greaterThan', formula=['0'], stopIfTrue=True, fill=green))
-                ws.conditional_formatting.add(range_str,
-                                            CellIsRule(operator='lessThan', formula=['0'], stopIfTrue=True, fill=red))
-
-    # Format Trade Log with blue header
-    if 'Trade Log' in wb.sheetnames:
-        ws = wb['Trade Log']
-        blue = PatternFill(start_color='BDD7EE', end_color='BDD7EE', fill_type='solid')
-        format_sheet(ws, header_fill=blue, pnl_col_name='FinalProfit')
-
-    # Format Daily Summary with bold headers and conditional coloring on DailyP&L
-    if 'Daily Summary' in wb.sheetnames:
-        ws2 = wb['Daily Summary']
-        yellow = PatternFill(start_color='FFF2CC', end_color='FFF2CC', fill_type='solid')
-        format_sheet(ws2, header_fill=yellow, pnl_col_name='DailyP&L')
-
-    # Format Performance (special handling for summary format)
-    if 'Performance' in wb.sheetnames:
-        ws3 = wb['Performance']
-        
-        # Style for section headers (lines with emojis and titles)
-        header_fill = PatternFill(start_color='4472C4', end_color='4472C4', fill_type='solid')
-        header_font = Font(bold=True, size=14, color='FFFFFF')
-        
-        # Style for separator lines
-        separator_fill = PatternFill(start_color='D9E1F2', end_color='D9E1F2', fill_type='solid')
-        
-        # Style for metric names
-        metric_font = Font(bold=True, size=11)
-        
-        # Style for values
-        value_font = Font(size=11)
-        
-        # Apply formatting row by row
-        for row_idx in range(1, ws3.max_row + 1):
-            metric_cell = ws3.cell(row=row_idx, column=1)
-            value_cell = ws3.cell(row=row_idx, column=2)
-            
-            metric_text = str(metric_cell.value) if metric_cell.value else ''
-            value_text = str(value_cell.value) if value_cell.value else ''
-            
-            # Header rows (with emojis or equals signs)
-            if '═' in metric_text or '📊' in metric_text:
-                metric_cell.font = header_font
-                metric_cell.fill = header_fill
-                value_cell.fill = header_fill
-                # Merge cells for header rows
-                if '📊' in metric_text or '═' in metric_text:
-                    ws3.merge_cells(start_row=row_idx, start_column=1, end_row=row_idx, end_column=2)
-                    metric_cell.alignment = Alignment(horizontal='center', vertical='center')
-            
-            # Section titles (with emojis)
-            elif any(emoji in metric_text for emoji in ['💰', '📈', '📊', '💵']):
-                metric_cell.font = Font(bold=True, size=12, color='1F4E78')
-                metric_cell.fill = PatternFill(start_color='E7E6E6', end_color='E7E6E6', fill_type='solid')
-                value_cell.fill = PatternFill(start_color='E7E6E6', end_color='E7E6E6', fill_type='solid')
-                ws3.merge_cells(start_row=row_idx, start_column=1, end_row=row_idx, end_column=2)
-            
-            # Separator lines
-            elif '─' in metric_text:
-                metric_cell.fill = separator_fill
-                value_cell.fill = separator_fill
-                ws3.merge_cells(start_row=row_idx, start_column=1, end_row=row_idx, end_column=2)
-            
-            # Data rows
-            elif metric_text and metric_text.strip():
-                metric_cell.font = metric_font
-                value_cell.font = value_font
-                
-                # Color code profit/loss values
-                if 'Net Profit/Loss' in metric_text or 'Final Status' in metric_text or 'Net Amount' in metric_text:
-                    if '✅' in value_text or (value_text.startswith('₹') and float(value_text.replace('₹','').replace(',','')) > 0):
-                        value_cell.fill = PatternFill(start_color='C6EFCE', end_color='C6EFCE', fill_type='solid')
-                        value_cell.font = Font(bold=True, size=12, color='006100')
-                    elif '❌' in value_text or (value_text.startswith('₹') and float(value_text.replace('₹','').replace(',','')) < 0):
-                        value_cell.fill = PatternFill(start_color='FFC7CE', end_color='FFC7CE', fill_type='solid')
-                        value_cell.font = Font(bold=True, size=12, color='9C0006')
-                
-                # Highlight ROI
-                if 'ROI' in metric_text:
-                    value_cell.font = Font(bold=True, size=12)
-        
-        # Adjust column widths
-        ws3.column_dimensions['A'].width = 35
-        ws3.column_dimensions['B'].width = 25
-
-    # Format Algorithm Config (dark header, clear key/value)
-    if 'Algorithm Config' in wb.sheetnames:
-        ws4 = wb['Algorithm Config']
-        dark = PatternFill(start_color='2F2F2F', end_color='2F2F2F', fill_type='solid')
-        for cell in ws4[1]:
-            cell.fill = dark
-            cell.font = Font(bold=True, color='FFFFFF')
-            cell.alignment = Alignment(horizontal='center')
-        # alternate shading for readability
-        for r in range(2, ws4.max_row+1):
-            fill = PatternFill(start_color='F7F7F7', end_color='F7F7F7', fill_type='solid') if r%2==0 else PatternFill(start_color='FFFFFF', end_color='FFFFFF', fill_type='solid')
-            for c in range(1, ws4.max_column+1):
-                ws4.cell(row=r, column=c).fill = fill
-
-    wb.save(OUTPUT_FILE)
+    # Write all sheets (formatted) in one streaming pass + Parquet/JSON copies
+    report_start = datetime.now()
+    report_writer.write_report(OUTPUT_FILE, [
+        report_writer.table_sheet('Trade Log', trade_log_df, report_writer.TRADE_LOG_FILL, pnl_col='FinalProfit'),
+        report_writer.table_sheet('Daily Summary', daily_summary, report_writer.DAILY_FILL, pnl_col='DailyP&L'),
+        report_writer.performance_sheet('Performance', performance_df),
+        report_writer.config_sheet('Algorithm Config', config_df),
+    ] + risk_engine.report_sheets(risk_df, distribution_df))
+    exports = report_writer.export_tables(OUTPUT_FILE, {
+        'Trade Log': trade_log_df,
+        'Daily Summary': daily_summary,
+        'Performance': performance_df,
+    })
+    logger.info("Report + %d table copies written in %.2fs", len(exports), (datetime.now() - report_start).total_seconds())
 
     logger.info("Phase-4 BACKTEST (1-minute) completed successfully")
     logger.info("Saved to: %s", OUTPUT_FILE)
@@ -55,6 +55,7 @@ if not MISTRAL_API_KEY:
     raise ValueError("MISTRAL_API_KEY environment variable not set. Add it to .env or export it.")
 
 import config_manager
+import benchmark_series
 P2_CFG = config_manager.get_phase_config("phase2")
 
 USE_PERCENTILE_SCORING = P2_CFG.get("USE_PERCENTILE_SCORING", True)
@@ -330,29 +331,19 @@ def main():
         raise FileNotFoundError("No NIFTY files")
     
     NIFTY_FILE = os.path.join(NIFTY_FOLDER, nifty_files[-1])
-    nifty_df = pd.read_csv(NIFTY_FILE)
-    if "Time" in nifty_df.columns:
-        # Fallback date if needed, but better to rely on what we have or just parse content
-        # For NIFTY intraday, usually it has date or we infer from content datetime
-        pass 
-        
-    if "date" in nifty_df.columns:
-        nifty_df["Datetime"] = pd.to_datetime(nifty_df["date"])
-    elif "Datetime" in nifty_df.columns:
-        nifty_df["Datetime"] = pd.to_datetime(nifty_df["Datetime"])
-    
-    col_close = "close" if "close" in nifty_df.columns else "Close"
-    nifty_df["Close"] = pd.to_numeric(nifty_df[col_close], errors="coerce")
-    nifty_df = nifty_df.dropna(subset=["Close"]).sort_values("Datetime")
-
-    # Safe Index Access for Nifty 30m
-    idx_30m_nifty = -7 if len(nifty_df) >= 7 else 0
-    
-    n_now = float(nifty_df["Close"].iloc[-1])
-    n_30m = float(nifty_df["Close"].iloc[idx_30m_nifty])
+    nifty = benchmark_series.load_index_csv(NIFTY_FILE, name="NIFTY")
+    if len(nifty) == 0:
+        raise ValueError(f"No usable NIFTY bars in {NIFTY_FILE}")
+
+    # Latest close and the close 30 minutes earlier (as-of), falling back to
+    # the first bar when there is less than 30 minutes of history
+    nifty_ts, n_now = nifty.latest()
+    n_30m = nifty.asof_one(nifty_ts - pd.Timedelta(minutes=30), tolerance=None)
+    if n_30m is None:
+        n_30m = nifty.first_close()
     
     # Extract date from Data, not filename (fixes intraday_5m issue)
-    nifty_date = nifty_df["Datetime"].iloc[-1].strftime("%Y-%m-%d")
+    nifty_date = nifty_ts.strftime("%Y-%m-%d")
 
     results = []
     
@@ -6,6 +6,7 @@ PHASE 3 — LIVE SIGNAL ENGINE
 • Emits trade signals instead of Excel output
 """
 
+import os
 import pandas as pd
 import numpy as np
 from datetime import time, datetime
@@ -27,6 +28,11 @@ STOP_MAX_PCT = 2.5
 RISK_REWARD_RATIO = 2.0
 ATR_LENGTH_5M = 14
 
+# Warm-start snapshot (bars ring + emitted signals)
+SNAPSHOT_FILE = "live_state/phase3_snapshot.npz"
+SNAPSHOT_VERSION = 1
+SNAPSHOT_COLUMNS = ["Open", "High", "Low", "Close", "Volume", "NIFTY_Close"]
+
 # ======================================================
 # INTERNAL STATE
 # ======================================================
@@ -156,7 +162,6 @@ def on_new_5m_candle(symbol, candle, nifty_close, is_backfill=False):
     
     # Export for Debugging / Inspection
     if not is_backfill:
-        import os
         os.makedirs("live_analysis", exist_ok=True)
         
         # Check if any signal was confirmed in this candle's result
@@ -352,3 +357,114 @@ def reset_daily_state():
     emitted_signals = set()
     confirmed_signals_buffer = []
     print("✅ Reset daily state (emitted_signals and confirmed_signals_buffer cleared)")
+
+# ======================================================
+# WARM-START SNAPSHOTS
+# ======================================================
+
+def save_snapshot(filepath=SNAPSHOT_FILE):
+    """
+    Persist per-symbol bars ring and emitted signals to a compact binary file.
+
+    Indicator columns (VWAP, ATR, VolMult profile) are derived from the raw
+    bars by process_symbol(), so only the bars themselves are stored.
+    The write is atomic (temp file + rename) so a crash never leaves a
+    half-written snapshot behind.
+
+    Returns:
+        True on success, False otherwise
+    """
+    symbols = sorted(live_5m_data.keys())
+    offsets = [0]
+    times, values = [], []
+
+    for symbol in symbols:
+        df = live_5m_data[symbol]
+        times.append(pd.to_datetime(df["Datetime"]).values.astype("datetime64[ns]").astype(np.int64))
+        values.append(df[SNAPSHOT_COLUMNS].to_numpy(dtype=np.float64))
+        offsets.append(offsets[-1] + len(df))
+
+    emitted = [f"{sym}|{day.isoformat()}" for sym, day in emitted_signals]
+
+    try:
+        os.makedirs(os.path.dirname(filepath) or ".", exist_ok=True)
+        tmp_path = filepath + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez_compressed(
+                f,
+                version=np.array([SNAPSHOT_VERSION], dtype=np.int64),
+                saved_at=np.array([datetime.now().timestamp()], dtype=np.float64),
+                symbols=np.array(symbols, dtype=str),
+                offsets=np.array(offsets, dtype=np.int64),
+                datetime=np.concatenate(times) if times else np.empty(0, dtype=np.int64),
+                values=np.vstack(values) if values else np.empty((0, len(SNAPSHOT_COLUMNS))),
+                emitted=np.array(emitted, dtype=str),
+            )
+        os.replace(tmp_path, filepath)
+        return True
+    except Exception as e:
+        print(f"⚠️ Failed to save snapshot: {e}")
+        return False
+
+
+def load_snapshot(filepath=SNAPSHOT_FILE, max_age_days=7):
+    """
+    Restore per-symbol state from a snapshot written by save_snapshot().
+
+    Each symbol's indicators are rebuilt with a single process_symbol() pass,
+    so the caller only needs to replay candles after the returned timestamps.
+
+    Args:
+        filepath: Snapshot path
+        max_age_days: Ignore snapshots older than this (stale history)
+
+    Returns:
+        dict symbol → last restored candle Datetime (empty if nothing loaded)
+    """
+    if not os.path.exists(filepath):
+        return {}
+
+    try:
+        with np.load(filepath, allow_pickle=False) as snap:
+            if int(snap["version"][0]) != SNAPSHOT_VERSION:
+                print(f"⚠️ Snapshot version mismatch, ignoring: {filepath}")
+                return {}
+
+            age_days = (datetime.now().timestamp() - float(snap["saved_at"][0])) / 86400
+            if age_days > max_age_days:
+                print(f"ℹ️ Snapshot is {age_days:.1f} days old, ignoring: {filepath}")
+                return {}
+
+            symbols = snap["symbols"]
+            offsets = snap["offsets"]
+            times = snap["datetime"]
+            values = snap["values"]
+            emitted = snap["emitted"]
+    except Exception as e:
+        print(f"⚠️ Failed to load snapshot: {e}")
+        return {}
+
+    last_seen = {}
+    for i, symbol in enumerate(symbols):
+        lo, hi = offsets[i], offsets[i + 1]
+        if hi <= lo:
+            continue
+
+        df = pd.DataFrame(values[lo:hi], columns=SNAPSHOT_COLUMNS)
+        df.insert(0, "Datetime", pd.to_datetime(times[lo:hi]))
+        df["Symbol"] = str(symbol)
+        df["Date"] = df["Datetime"].dt.date
+
+        df = process_symbol(df)
+        df["Candles_Used"] = df["Candle_num"]
+
+        live_5m_data[str(symbol)] = df
+        last_seen[str(symbol)] = df["Datetime"].iloc[-1].to_pydatetime()
+
+    emitted_signals.clear()
+    for key in emitted:
+        sym, day = str(key).rsplit("|", 1)
+        emitted_signals.add((sym, datetime.strptime(day, "%Y-%m-%d").date()))
+
+    print(f"✅ Restored snapshot: {len(last_seen)} symbols, {len(emitted_signals)} emitted signals")
+    return last_seen
@@ -12,6 +12,7 @@ NSEI_FILE = "downloaded_data/NSEI/intraday_5m.csv"
 PHASE2_FILE = "phase-2results/phase2_results.xlsx"
 
 import config_manager
+import benchmark_series
 P3_CFG = config_manager.get_phase_config("phase3")
 
 MARKET_OPEN = config_manager.get_time_from_config(P3_CFG, "MARKET_OPEN") or time(9, 30)
@@ -47,15 +48,17 @@ def load_phase2():
 # LOAD STOCK 5M
 # ======================================================
 
-def load_stock_5m(symbol):
+def load_stock_5m(symbol, dates=None):
+    """One symbol's 5m candles; `dates` limits the read to those trading days' files"""
     folder = os.path.join(BASE_DIR, symbol)
     dfs = []
 
     if not os.path.exists(folder):
         return None
 
+    wanted = None if dates is None else {f"{d}.csv" for d in dates}
     for file in sorted(os.listdir(folder)):
-        if not file.endswith(".csv"):
+        if not file.endswith(".csv") or (wanted is not None and file not in wanted):
             continue
 
         file_date = pd.to_datetime(file.replace(".csv", "")).date()
@@ -85,19 +88,8 @@ def load_stock_5m(symbol):
 # ======================================================
 
 def load_nsei_5m():
-    df = pd.read_csv(NSEI_FILE)
-    
-    # Handle column names dynamically
-    col_date = "Datetime" if "Datetime" in df.columns else ("date" if "date" in df.columns else None)
-    col_close = "Close" if "Close" in df.columns else ("close" if "close" in df.columns else None)
-    
-    if not col_date or not col_close:
-        available_cols = ", ".join(df.columns)
-        raise KeyError(f"Missing required columns in {NSEI_FILE}. Need Date/Datetime and Close. Found: {available_cols}")
-
-    df["Datetime"] = pd.to_datetime(df[col_date], utc=True)
-    df["Close"] = pd.to_numeric(df[col_close], errors="coerce")
-    return df[["Datetime", "Close"]].rename(columns={"Close": "NIFTY_Close"})
+    """Load the index into the shared benchmark series (sorted arrays, as-of lookups)"""
+    return benchmark_series.load_index_csv(NSEI_FILE, name="NIFTY")
 
 # ======================================================
 # METRICS
@@ -344,15 +336,22 @@ def compute_volmult_od(df):
 # PHASE 3
 # ======================================================
 
-def run_phase3_for_symbol(symbol, phase2_df, nsei_df):
+def compute_indicators(symbol, phase2_df, nsei):
+    """
+    Threshold-independent columns for one symbol's Phase-2 days
+    (VWAP, RS_30m, VolMult_od, ATR_5m_pct, ATR_pct, Buffer, Time).
+    Shared with the threshold sensitivity engine.
+    """
     stock = load_stock_5m(symbol)
     if stock is None:
         return None
 
     p2 = phase2_df[phase2_df["Symbol"] == symbol]
 
-    # Merge with NSEI data
-    df = pd.merge(stock, nsei_df, on="Datetime", how="inner")
+    # Align NSEI close as-of each stock candle (no bars dropped on a missing
+    # exact timestamp; stale/missing index bars leave NIFTY_Close as NaN)
+    df = stock.copy()
+    df["NIFTY_Close"] = nsei.asof(df["Datetime"])
     
     # Only keep dates that passed Phase 2
     df = pd.merge(df, p2, on=["Symbol", "Date"], how="inner")
@@ -377,6 +376,13 @@ def run_phase3_for_symbol(symbol, phase2_df, nsei_df):
         0.0005,
         0.10 * (df["ATR_pct"] / 100)
     )
+    return df
+
+
+def run_phase3_for_symbol(symbol, phase2_df, nsei):
+    df = compute_indicators(symbol, phase2_df, nsei)
+    if df is None:
+        return None
 
     # ================= MODES =================
     for m in ["A", "B", "C"]:
@@ -610,8 +616,8 @@ if __name__ == "__main__":
     print(f"Found {len(phase2_df)} Phase-2 qualified entries ({phase2_df['Symbol'].nunique()} unique symbols)")
     
     print("\nLoading NSEI data...")
-    nsei_df = load_nsei_5m()
-    print(f"Loaded {len(nsei_df)} NSEI 5m candles")
+    nsei = load_nsei_5m()
+    print(f"Loaded {len(nsei)} NSEI 5m candles")
 
     results = []
     symbols = phase2_df["Symbol"].unique()
@@ -619,7 +625,7 @@ if __name__ == "__main__":
     print(f"\nProcessing {len(symbols)} symbols...")
     for i, symbol in enumerate(symbols, 1):
         print(f"  [{i}/{len(symbols)}] Processing {symbol}...", end="\r")
-        out = run_phase3_for_symbol(symbol, phase2_df, nsei_df)
+        out = run_phase3_for_symbol(symbol, phase2_df, nsei)
         if out is not None:
             results.append(out)
 
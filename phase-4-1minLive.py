@@ -8,12 +8,20 @@ PHASE 4 — LIVE EXECUTION ENGINE (PAPER TRADING)
 """
 
 import time
-import requests
+import asyncio
+import queue
+import aiohttp
 from datetime import datetime, time as dtime
 from collections import defaultdict
 
 from kiteconnect import KiteConnect
 
+import exit_engine
+from engine_metrics import LatencyHistogram
+from trade_registry import TradeRegistry, TradeState
+from quote_cache import QuoteCache, kite_ltp_fetcher
+from stop_scheduler import StopUpdateScheduler
+
 # ===============================
 # CONFIG
 # ===============================
@@ -31,6 +39,17 @@ ACCESS_TOKEN = os.getenv("ACCESS_TOKEN")
 
 FORCE_EXIT_TIME = dtime(15, 25)
 
+# Engine tuning
+TICK_SECONDS = 1.0          # exit / force-exit cycle
+QUOTE_POLL_SECONDS = 1.0    # shared LTP poll (one kite.ltp batch per poll)
+QUOTE_MAX_AGE = 5.0         # older quotes are not acted on
+STOP_MIN_TICK = 0.05        # skip stop moves smaller than one tick...
+STOP_MIN_PCT = 0.0005       # ...or 0.05% of the last sent stop
+STOP_MIN_INTERVAL = 3.0     # max one modify per order every N seconds
+HTTP_TIMEOUT = 3            # seconds per paper API call
+HTTP_POOL_SIZE = 20         # pooled keep-alive connections to PAPER_API
+LATENCY_REPORT_EVERY = 60   # ticks between latency histogram prints
+
 # ===============================
 # KITE CLIENT
 # ===============================
@@ -42,74 +61,63 @@ kite.set_access_token(ACCESS_TOKEN)
 # INTERNAL STATE
 # ===============================
 
-# ===============================
-# INTERNAL STATE
-# ===============================
+# order_id / symbol / token indexes + signal dedupe, journaled to SQLite
+registry = TradeRegistry()
 
-active_trades = {}        # order_id → TradeState
-symbol_active = set()     # prevent double entry per symbol/day
-seen_signals = set()      # prevent duplicate processing of same signal message
+# One LTP poller for every consumer (trailing stops, force exit)
+QUOTES = QuoteCache(kite_ltp_fetcher(kite), poll_seconds=QUOTE_POLL_SECONDS, stale_after=QUOTE_MAX_AGE)
+# Coalesced / rate-limited trailing-stop modifications, flushed once per tick
+STOPS = StopUpdateScheduler(min_tick=STOP_MIN_TICK, min_pct=STOP_MIN_PCT, min_interval=STOP_MIN_INTERVAL)
 
-# ===============================
-# TRADE STATE MODEL
-# ===============================
-
-class TradeState:
-    def __init__(self, order_id, symbol, token, qty, entry, stop, target):
-        self.order_id = order_id
-        self.symbol = symbol
-        self.token = token
-        self.qty = qty
+for _trade in registry.open_trades():
+    QUOTES.watch(_trade.token)
+    STOPS.track(_trade.order_id, _trade.current_stop)
 
-        self.entry = entry
-        self.initial_stop = stop
-        self.current_stop = stop
-        self.target = target
-
-        self.highest_price = entry
-        self.open_time = datetime.now()
-        self.closed = False
+LOOP_LATENCY = LatencyHistogram("Engine tick latency")
 
 # ===============================
-# TRAILING STOP (UNCHANGED LOGIC)
+# TRAILING STOP (SHARED ENGINE, 2-DP FOR THE BROKER)
 # ===============================
 
 def calculate_trailing_stop(entry_price, initial_stop, current_high, current_stop):
-    R = entry_price - initial_stop
-    cost_buffer = entry_price * 0.001
-
-    new_stop = current_stop
+    return round(exit_engine.trailing_stop(entry_price, initial_stop, current_high, current_stop), 2)
 
-    if current_high >= entry_price + R:
-        new_stop = max(new_stop, entry_price + cost_buffer)
+# ===============================
+# PAPER API CLIENT (POOLED)
+# ===============================
 
-    if current_high >= entry_price + (1.5 * R):
-        new_stop = max(new_stop, entry_price + (0.5 * R))
+async def api_request(session, method, path, payload=None):
+    """Single pooled call to the paper API. Returns parsed JSON (raises on error)."""
+    async with session.request(method, f"{PAPER_API}{path}", json=payload) as r:
+        r.raise_for_status()
+        return await r.json()
 
-    if current_high >= entry_price + (2.0 * R):
-        new_stop = max(new_stop, current_high - R)
 
-    return round(new_stop, 2)
+async def fetch_portfolio(session):
+    """One portfolio snapshot per tick, shared by exit checks and force exit."""
+    try:
+        return await api_request(session, "GET", "/portfolio")
+    except Exception as e:
+        print(f"❌ PAPER API ERROR (Portfolio): {e}")
+        return None
 
 # ===============================
 # ORDER PLACEMENT
 # ===============================
 
-def place_trade(signal):
+async def place_trade(session, signal):
     """
     signal = {
         symbol, token, qty,
         entry, stop, target, time (datetime)
     }
     """
-    # 1. Global De-duplication
-    key = (signal["symbol"], signal["mode"], signal["time"].date())
-    if key in seen_signals:
-        print(f"⚠️ IGNORING DUPLICATE SIGNAL: {key}")
+    # 1. Global De-duplication + symbol reservation (atomic, before awaiting)
+    rejected = registry.claim(signal["symbol"], signal["mode"], signal["time"].date())
+    if rejected == "DUPLICATE":
+        print(f"⚠️ IGNORING DUPLICATE SIGNAL: {signal['symbol']} {signal['mode']}")
         return
-    seen_signals.add(key)
-
-    if signal["symbol"] in symbol_active:
+    if rejected == "ACTIVE":
         print(f"⚠️ IGNORING ACTIVE SYMBOL: {signal['symbol']}")
         return
 
@@ -123,10 +131,7 @@ def place_trade(signal):
     }
 
     try:
-        r = requests.post(f"{PAPER_API}/order", json=payload, timeout=3)
-        r.raise_for_status()
-        
-        data = r.json()
+        data = await api_request(session, "POST", "/order", payload)
         order_id = data["order_id"]
 
         trade = TradeState(
@@ -139,12 +144,14 @@ def place_trade(signal):
             target=signal["target"]
         )
 
-        active_trades[order_id] = trade
-        symbol_active.add(signal["symbol"])
+        registry.open(trade)
+        QUOTES.watch(trade.token)
+        STOPS.track(order_id, trade.current_stop)
 
         print(f"✅ ORDER PLACED | {signal['symbol']} | {order_id}")
         
     except Exception as e:
+        registry.release(signal["symbol"])
         print(f"❌ PAPER API ERROR (Place Order): {e}")
         # Do not retry blindly; failure here means no trade.
 
@@ -152,163 +159,212 @@ def place_trade(signal):
 # TRAILING STOP MANAGER
 # ===============================
 
-# ===============================
-# TRAILING STOP MANAGER
-# ===============================
-
-def update_trailing_stops():
-    if not active_trades:
-        return
-
-    # Batch Fetch LTP for all active tokens
-    # Avoids Rate Limit (3 req/sec) issues
-    tokens = [t.token for t in active_trades.values()]
-    if not tokens:
-        return
-
+async def modify_stop(session, trade, new_stop):
     try:
-        print(f"👀 Tracking {len(tokens)} active positions... Fetching LTP.", flush=True)
-        quotes = kite.ltp(tokens)
+        await api_request(session, "PUT", "/order/modify", {
+            "order_id": trade.order_id,
+            "sl": new_stop,
+            "tp": 0
+        })
+        STOPS.confirm(trade.order_id, new_stop)
+        registry.update_stop(trade.order_id, new_stop)
+        print(f"🔁 TRAIL | {trade.symbol} | SL → {new_stop}")
     except Exception as e:
-        print(f"⚠️ Failed to fetch LTP batch: {e}")
-        return
+        STOPS.retry(trade.order_id, new_stop)
+        print(f"❌ PAPER API ERROR (Modify Order): {e}")
 
-    for trade in list(active_trades.values()):
-        if trade.closed:
-            continue
-            
-        token_str = str(trade.token)
-        if token_str not in quotes:
+
+def update_trailing_stops(updates):
+    """Trail stops for the trades whose token just got a fresh quote (no I/O)."""
+    for token, quote in updates.items():
+        trade = registry.for_token(token)
+        if trade is None or trade.closed:
             continue
-            
-        ltp = quotes[token_str]["last_price"]
 
-        trade.highest_price = max(trade.highest_price, ltp)
+        trade.highest_price = max(trade.highest_price, quote.price)
 
+        # Floor is the highest stop already queued, not just the one sent
+        floor = max(trade.current_stop, STOPS.pending_stop(trade.order_id) or trade.current_stop)
         new_stop = calculate_trailing_stop(
             trade.entry,
             trade.initial_stop,
             trade.highest_price,
-            trade.current_stop
+            floor
         )
 
-        if new_stop > trade.current_stop:
-            modify_payload = {
-                "order_id": trade.order_id,
-                "sl": new_stop,
-                "tp": 0
-            }
-
-            try:
-                r = requests.put(f"{PAPER_API}/order/modify", json=modify_payload, timeout=3)
-                r.raise_for_status()
-                
-                trade.current_stop = new_stop
-                print(f"🔁 TRAIL | {trade.symbol} | SL → {new_stop}")
-            except Exception as e:
-                print(f"❌ PAPER API ERROR (Modify Order): {e}")
+        if new_stop > floor:
+            STOPS.propose(trade.order_id, new_stop)
+
+
+async def flush_stop_updates(session):
+    """Send this cycle's coalesced stop moves in one concurrent batch."""
+    modifications = []
+    for order_id, stop in STOPS.due():
+        trade = registry.get(order_id)
+        if trade is None:
+            STOPS.forget(order_id)
+            continue
+        modifications.append(modify_stop(session, trade, stop))
+
+    if modifications:
+        await asyncio.gather(*modifications)
+
+
+async def trailing_worker(quote_queue, stop_event):
+    """Quote-cache subscriber: each LTP batch queues stop moves for the next flush."""
+    while not stop_event.is_set():
+        try:
+            updates = await asyncio.wait_for(quote_queue.get(), timeout=0.5)
+        except asyncio.TimeoutError:
+            continue
+        update_trailing_stops(updates)
 
 # ===============================
 # EXIT MONITOR
 # ===============================
 
-def check_exits():
-    try:
-        r = requests.get(f"{PAPER_API}/portfolio", timeout=3)
-        r.raise_for_status()
-        
-        open_positions = r.json().get("open_positions", [])
-        open_symbols = {p["symbol"] for p in open_positions}
+def check_exits(portfolio, snapshot_time):
+    if portfolio is None:
+        return
 
-        for trade in list(active_trades.values()):
-            if trade.symbol not in open_symbols:
-                trade.closed = True
-                symbol_active.discard(trade.symbol)
-                active_trades.pop(trade.order_id, None)
+    open_positions = portfolio.get("open_positions", [])
+    open_symbols = {p["symbol"] for p in open_positions}
 
-                print(f"🏁 EXITED | {trade.symbol}")
-                
-    except Exception as e:
-        print(f"❌ PAPER API ERROR (Check Exits): {e}")
+    for trade in registry.open_trades():
+        # Orders placed while the snapshot was in flight aren't in it yet
+        if trade.open_time >= snapshot_time:
+            continue
+        if trade.symbol not in open_symbols:
+            registry.close(trade.order_id, "EXITED")
+            QUOTES.unwatch(trade.token)
+            STOPS.forget(trade.order_id)
+
+            print(f"🏁 EXITED | {trade.symbol}")
 
 # ===============================
 # FORCE EXIT (SAFETY)
 # ===============================
 
-def force_exit_if_needed():
+async def force_exit_if_needed(session, portfolio):
     if datetime.now().time() < FORCE_EXIT_TIME:
         return
+    if portfolio is None:
+        return
 
-    try:
-        r = requests.get(f"{PAPER_API}/portfolio", timeout=3)
-        r.raise_for_status()
+    exits = []
+    for pos in portfolio.get("open_positions", []):
+        symbol = pos['symbol']
+        
+        # O(1) symbol → order_id from the registry index
+        trade = registry.for_symbol(symbol)
+        if trade is None:
+            print(f"⚠️ Cannot Force Exit {symbol}: Order ID not found locally.")
+            continue
+        order_id = trade.order_id
 
-        for pos in r.json().get("open_positions", []):
-            symbol = pos['symbol']
-            
-            # Find order_id from local state (active_trades)
-            # Reverse lookup: symbol -> order_id
-            order_id = None
-            for trade in active_trades.values():
-                if trade.symbol == symbol:
-                    order_id = trade.order_id
-                    break
-            
-            if not order_id:
-                print(f"⚠️ Cannot Force Exit {symbol}: Order ID not found locally.")
-                continue
-
-            print(f"⏰ FORCE EXIT | {symbol}")
-            
-            try:
-                requests.put(
-                    f"{PAPER_API}/order/modify",
-                    json={
-                        "order_id": order_id,
-                        "sl": pos["ltp"],  # Set SL to Current Price to exit
-                        "tp": 0,
-                        "status": "TIME_EXIT"
-                    },
-                    timeout=3
-                )
-            except Exception:
-                pass # Try next one
-                
-    except Exception as e:
-        print(f"❌ PAPER API ERROR (Force Exit): {e}")
+        # Prefer our own fresh LTP; fall back to the broker's
+        ltp = QUOTES.price(trade.token, max_age=QUOTE_MAX_AGE) or pos["ltp"]
+
+        print(f"⏰ FORCE EXIT | {symbol}")
+        exits.append(api_request(session, "PUT", "/order/modify", {
+            "order_id": order_id,
+            "sl": ltp,  # Set SL to Current Price to exit
+            "tp": 0,
+            "status": "TIME_EXIT"
+        }))
+
+    if exits:
+        results = await asyncio.gather(*exits, return_exceptions=True)
+        for res in results:
+            if isinstance(res, Exception):
+                print(f"❌ PAPER API ERROR (Force Exit): {res}")
 
 # ===============================
 # MAIN LOOP
 # ===============================
 
-import queue
-
-def start_execution_engine(signal_queue, stop_event):
+async def signal_worker(session, signal_queue, stop_event):
     """
-    signal_queue: iterable yielding Phase-3 signals
-    stop_event: threading.Event to signal shutdown
+    Drain Phase-3 signals independently of the tick loop, so order
+    placement never waits behind trailing-stop I/O.
     """
-
-    print("🚀 Phase-4 Live Execution Started (Safe Mode)")
-
+    pending = set()
     while not stop_event.is_set():
-        # 1️⃣ Consume new signals (Blocking with timeout)
         try:
-            signal = signal_queue.get(timeout=1)
-            place_trade(signal)
-            signal_queue.task_done()
+            signal = await asyncio.to_thread(signal_queue.get, True, 0.5)
         except queue.Empty:
-            pass # Continue loop
+            continue
 
-        # 2️⃣ Update trailing stops
-        update_trailing_stops()
+        task = asyncio.create_task(place_trade(session, signal))
+        pending.add(task)
+        task.add_done_callback(pending.discard)
+        signal_queue.task_done()
 
-        # 3️⃣ Check exits
-        check_exits()
+    if pending:
+        await asyncio.gather(*pending, return_exceptions=True)
 
-        # 4️⃣ Force exit
-        force_exit_if_needed()
 
-        # Small sleep removed as queue.get(timeout=1) acts as a throttle when empty
-        # If queue was full, we process fast. If empty, we wait 1s.
+async def tick_loop(session, stop_event):
+    loop = asyncio.get_running_loop()
+    ticks = 0
+
+    while not stop_event.is_set():
+        started = loop.time()
+        snapshot_time = datetime.now()
+
+        # 1️⃣ One portfolio snapshot + this cycle's batch of stop moves
+        portfolio, _ = await asyncio.gather(
+            fetch_portfolio(session),
+            flush_stop_updates(session)
+        )
+
+        # 2️⃣ Check exits (from the shared snapshot)
+        check_exits(portfolio, snapshot_time)
+
+        # 3️⃣ Force exit (same snapshot)
+        await force_exit_if_needed(session, portfolio)
+
+        elapsed = loop.time() - started
+        LOOP_LATENCY.observe(elapsed)
+
+        ticks += 1
+        if ticks % LATENCY_REPORT_EVERY == 0:
+            print(LOOP_LATENCY.format(), flush=True)
+            print(QUOTES.format_metrics(), flush=True)
+            print(STOPS.format(), flush=True)
+
+        await asyncio.sleep(max(0.0, TICK_SECONDS - elapsed))
+
+
+async def run_engine(signal_queue, stop_event):
+    connector = aiohttp.TCPConnector(limit=HTTP_POOL_SIZE, keepalive_timeout=30)
+    timeout = aiohttp.ClientTimeout(total=HTTP_TIMEOUT)
+
+    quote_queue = QUOTES.subscribe_queue()
+    QUOTES.start()
+
+    try:
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+            await asyncio.gather(
+                signal_worker(session, signal_queue, stop_event),
+                trailing_worker(quote_queue, stop_event),
+                tick_loop(session, stop_event)
+            )
+    finally:
+        QUOTES.stop()
+        QUOTES.unsubscribe_queue(quote_queue)
+
+    registry.checkpoint()
+    print(LOOP_LATENCY.format())
+    print(QUOTES.format_metrics())
+    print(STOPS.format())
+
+
+def start_execution_engine(signal_queue, stop_event):
+    """
+    signal_queue: queue.Queue yielding Phase-3 signals
+    stop_event: threading.Event to signal shutdown
+    """
 
+    print("🚀 Phase-4 Live Execution Started (Async Mode)")
+    asyncio.run(run_engine(signal_queue, stop_event))
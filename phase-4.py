@@ -6,17 +6,21 @@ import numpy as np
 import warnings
 from datetime import time, datetime
 
+import exit_engine
+import bar_store
+import risk_engine
+import report_writer
+
 # Suppress pandas datetime parsing warnings
 warnings.filterwarnings('ignore', message='Could not infer format')
 
-import openpyxl
-from openpyxl.styles import PatternFill, Font, Alignment
-from openpyxl.formatting.rule import CellIsRule
 # ===============================
 # CONFIG
 # ===============================
 PHASE3_FILE = "phase-3results/Phase3_results.xlsx"
 FIVE_MIN_DATA_DIR = "downloaded_data"   # 5-minute candles
+ONE_MIN_DATA_DIR = "downloaded_data/1min/1min"   # 1-minute candles (ambiguous bars only)
+INTRABAR_DRILL_DOWN = True   # re-resolve ambiguous 5m exit bars on 1m bars when available
 OUTPUT_DIR = "phase-4results"
 ts = datetime.now().strftime("%Y%m%d_%H%M%S")
 OUTPUT_FILE = os.path.join(OUTPUT_DIR, f"phase4_backtest_5m_{ts}.xlsx")
@@ -41,49 +45,6 @@ COST_BUFFER = 0.0025  # 0.25% minimum profit after costs
 
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
-# ===============================
-# TRAILING STOP CALCULATION
-# ===============================
-def calculate_trailing_stop(entry_price, initial_stop, current_high, current_stop):
-    """
-    Calculate trailing stop-loss based on 3-tier R-multiple strategy:
-    - 1R: Move to breakeven + costs
-    - 1.5R: Lock 0.5R profit
-    - 2R+: Trail by 1R distance from high
-    
-    Args:
-        entry_price: Entry price of the trade
-        initial_stop: Initial stop-loss price
-        current_high: Highest price achieved since entry
-        current_stop: Current stop-loss price
-    
-    Returns:
-        new_stop: Updated stop-loss price
-    """
-    R = entry_price - initial_stop
-    
-    # Cost buffer (approx 0.1% or fixed amount to cover brokerage)
-    cost_buffer = entry_price * 0.001 
-    
-    new_stop = current_stop
-    
-    # 1. Check Breakeven Trigger (1R)
-    if current_high >= (entry_price + R):
-        # Move to Entry + Costs (Ensure we don't move stop DOWN if it's already higher)
-        new_stop = max(new_stop, entry_price + cost_buffer)
-        
-    # 2. Check Profit Locking Trigger (1.5R)
-    if current_high >= (entry_price + (1.5 * R)):
-        # Lock 0.5R profit
-        new_stop = max(new_stop, entry_price + (0.5 * R))
-        
-    # 3. Dynamic Trail (Deep Profit > 2R)
-    if current_high >= (entry_price + (2.0 * R)):
-        # Trail by 1R distance from High
-        new_stop = max(new_stop, current_high - R)
-        
-    return new_stop
-
 # ===============================
 # LOAD PHASE-3 OUTPUT
 # ===============================
@@ -208,160 +169,61 @@ df = pd.concat(all_days_data, ignore_index=True) if all_days_data else pd.DataFr
 # ===============================
 # PHASE-4 EXIT RESOLUTION (5-MIN BACKTEST)
 # ===============================
+# 1) Parse entry times + (symbol, date) keys per trade
+BARS = bar_store.five_min_store(FIVE_MIN_DATA_DIR)
+trade_keys, buy_times = bar_store.trade_keys(df)
+
+# 2) Load each symbol-day once, then simulate every trade in one batch
+#    (Numba kernel / NumPy fallback). Exit bars that 5m data cannot order
+#    (stop + target, or a stop the bar itself raised) are replayed on 1m
+#    bars, loaded only for those trades.
+packed, starts, ends, has_data, bar_times = bar_store.pack_trades(BARS, trade_keys)
+print(BARS.report())
+FINE_BARS = bar_store.one_min_store(ONE_MIN_DATA_DIR)
+data_keys = [k for k, ok in zip(trade_keys, has_data) if ok]
+fine_bars = (lambda j: FINE_BARS.get(*data_keys[j])) if INTRABAR_DRILL_DOWN else (lambda j: None)
+sim = exit_engine.simulate_trades_multires(
+    packed, starts, ends,
+    entry_tods=np.array([exit_engine.time_to_seconds(t) for t in buy_times], dtype=np.int64)[has_data],
+    entry_prices=df["entry_price"].to_numpy(dtype=float)[has_data],
+    stops=df["stop_price"].to_numpy(dtype=float)[has_data],
+    targets=df["target_price"].to_numpy(dtype=float)[has_data],
+    force_exit_tod=exit_engine.time_to_seconds(FORCE_EXIT_TIME),
+    fine_bars=fine_bars,
+    stop_reason="TRAILING_STOP",
+)
+if INTRABAR_DRILL_DOWN:
+    print(f"🔬 {int(sim['drilled'].sum())} ambiguous exit bars re-resolved on 1m bars")
+    print(FINE_BARS.report())
+
+# 3) Map results back to trades
 sell_prices = []
 sell_times = []
 exit_reasons = []
 pnls = []
 
-for _, row in df.iterrows():
-    symbol = row["symbol"]
+j = 0
+for i, (_, row) in enumerate(df.iterrows()):
     buy_price = row["entry_price"]
-    stop = row["stop_price"]
-    target = row["target_price"]
     qty = row["quantity"]
-    buy_time = row["buy_time"]
 
-    # normalize buy_time to a time object if possible
-    if pd.isna(buy_time):
-        buy_time = time(0, 0)
-    elif isinstance(buy_time, str):
-        try:
-            bt = pd.to_datetime(buy_time).time()
-            buy_time = bt
-        except Exception:
-            try:
-                parts = [int(x) for x in buy_time.split(":")]
-                buy_time = time(*parts[:3])
-            except Exception:
-                buy_time = time(0, 0)
-    elif isinstance(buy_time, pd.Timestamp):
-        buy_time = buy_time.time()
-
-    # Build per-symbol per-date 5-minute CSV path: downloaded_data/<SYMBOL>/<YYYY-MM-DD>.csv
-    date_val = row.get("date")
-    date_str = None
-    if pd.isna(date_val):
-        date_str = None
-    else:
-        try:
-            date_ts = pd.to_datetime(date_val)
-            date_str = date_ts.strftime("%Y-%m-%d")
-        except Exception:
-            date_str = str(date_val)
-
-    five_min_file = None
-    if date_str:
-        five_min_file = os.path.join(FIVE_MIN_DATA_DIR, symbol, f"{date_str}.csv")
-
-    sell_price = buy_price
-    sell_time = None
-    exit_reason = "NO_EXIT"
-    had_post_buy_candle = False
-    last_candle_close = None
-    last_candle_time = None
-    
-    # Initialize trailing stop variables
-    initial_stop = stop  # Store the original stop for R calculation
-    current_stop = stop  # This will be updated dynamically
-    highest_price = buy_price  # Track the highest price achieved
-
-    if five_min_file and os.path.exists(five_min_file):
-        mdf = pd.read_csv(five_min_file)
-        # normalize column names to lowercase
-        mdf.columns = [c.lower() for c in mdf.columns]
-
-        # expect a 'time' column (e.g., 09:15:00). Create a datetime by combining file date and time
-        if "time" in mdf.columns:
-            try:
-                mdf["datetime"] = pd.to_datetime(date_str + " " + mdf["time"].astype(str))
-            except Exception:
-                # fallback: parse time only and attach arbitrary date
-                mdf["datetime"] = pd.to_datetime(mdf["time"].astype(str))
-        else:
-            # if already has 'datetime' column, try parsing it
-            if "datetime" in mdf.columns:
-                mdf["datetime"] = pd.to_datetime(mdf["datetime"])
-            else:
-                # cannot interpret timestamps; skip
-                mdf["datetime"] = pd.NaT
-
-        mdf = mdf.sort_values("datetime")
-
-        for _, m in mdf.iterrows():
-            # skip rows without valid datetime
-            if pd.isna(m.get("datetime")):
-                continue
-            t = m["datetime"].time()
-
-            # start checking only from the candle strictly after the buy_time
-            if t <= buy_time:
-                continue
-
-            had_post_buy_candle = True
-            last_candle_close = float(m.get("close", np.nan)) if not pd.isna(m.get("close", np.nan)) else None
-            last_candle_time = t
-
-            high = float(m.get("high", np.nan))
-            low = float(m.get("low", np.nan))
-            op = float(m.get("open", np.nan))
-            close = float(m.get("close", np.nan))
-
-            # Update highest price if this candle made a new high
-            if not np.isnan(high) and high > highest_price:
-                highest_price = high
-                # Recalculate trailing stop based on new high
-                current_stop = calculate_trailing_stop(buy_price, initial_stop, highest_price, current_stop)
-
-            # Check exits using the DYNAMIC trailing stop
-            hit_stop = (not np.isnan(low)) and (low <= current_stop)
-            hit_target = (not np.isnan(high)) and (high >= target)
-
-            # Both hit in same candle → approximate intrabar order using distance from open
-            if hit_stop and hit_target:
-                dist_stop = abs(op - current_stop) if not np.isnan(op) else float('inf')
-                dist_target = abs(op - target) if not np.isnan(op) else float('inf')
-                if dist_stop <= dist_target:
-                    sell_price = current_stop
-                    exit_reason = "TRAILING_STOP_INTRABAR"
-                else:
-                    sell_price = target
-                    exit_reason = "TARGET_INTRABAR"
-                sell_time = t
-                break
-
-            if hit_stop:
-                sell_price = current_stop
-                sell_time = t
-                # Determine which tier of trailing stop was hit
-                if current_stop > buy_price:
-                    exit_reason = "TRAILING_STOP_PROFIT"
-                else:
-                    exit_reason = "TRAILING_STOP"
-                break
-
-            if hit_target:
-                sell_price = target
-                sell_time = t
-                exit_reason = "TARGET"
-                break
-
-            # Force-exit at or after FORCE_EXIT_TIME using candle close
-            if t >= FORCE_EXIT_TIME:
-                sell_price = close if not np.isnan(close) else m.get("close", buy_price)
-                sell_time = t
-                exit_reason = "TIME_EXIT_1510"
-                break
-
-        # If no explicit exit was found but there were candles after the buy_time,
-        # close at the last available candle close to approximate end-of-data exit.
-        if exit_reason == "NO_EXIT" and had_post_buy_candle and last_candle_close is not None:
-            sell_price = last_candle_close
-            sell_time = last_candle_time
-            exit_reason = "NO_EXIT_LASTCANDLE"
+    if has_data[i]:
+        sell_price = buy_price
+        sell_time = None
+        exit_reason = "NO_EXIT"
+        k = sim["exit_idx"][j]
+        if k >= 0:
+            sell_price = sim["exit_price"][j]
+            sell_time = bar_times[i][k - starts[j]]
+            if sim["drilled"][j]:
+                tod = int(sim["exit_tod"][j])
+                sell_time = time(tod // 3600, tod // 60 % 60, tod % 60)
+            exit_reason = sim["reason"][j]
+        j += 1
     else:
         # No 5-minute data available for this symbol — close at buy price and mark
         sell_price = buy_price
-        sell_time = buy_time
+        sell_time = buy_times[i]
         exit_reason = "NO_5M_DATA"
 
     pnl = (sell_price - buy_price) * qty
@@ -458,63 +320,7 @@ trade_log_df = pd.DataFrame(trade_rows, columns=trade_log_cols)
 ohlcv_path = os.path.join(FIVE_MIN_DATA_DIR, 'daily_candles_nifty500.xlsx')
 if os.path.exists(ohlcv_path):
     try:
-        ohl = pd.read_excel(ohlcv_path)
-        ohl.columns = [str(c).strip() for c in ohl.columns]
-        
-        # Normalize symbol column
-        if 'Symbol' in ohl.columns:
-            ohl['Symbol'] = ohl['Symbol'].astype(str).str.upper().str.strip()
-        elif 'symbol' in ohl.columns:
-            ohl['Symbol'] = ohl['symbol'].astype(str).str.upper().str.strip()
-        
-        # Handle Datetime column (not Date)
-        if 'Datetime' in ohl.columns:
-            ohl['Date'] = pd.to_datetime(ohl['Datetime']).dt.strftime('%Y-%m-%d')
-        elif 'Date' in ohl.columns:
-            ohl['Date'] = pd.to_datetime(ohl['Date']).dt.strftime('%Y-%m-%d')
-        elif 'date' in ohl.columns:
-            ohl['Date'] = pd.to_datetime(ohl['date']).dt.strftime('%Y-%m-%d')
-
-        # keep only relevant OHLCV cols that exist
-        ohlv_cols = [c for c in ['Open','High','Low','Close','Volume'] if c in ohl.columns]
-
-        # create lookup dict keyed by (symbol,date)
-        ohl['__key'] = ohl['Symbol'].astype(str) + '||' + ohl['Date'].astype(str)
-        ohl_lookup = ohl.set_index('__key')[ohlv_cols].to_dict(orient='index')
-
-        # normalize trade keys and attempt fast lookup
-        def try_get_ohlv(stock, date):
-            if pd.isna(stock) or pd.isna(date):
-                return None
-            k = str(stock).upper().strip() + '||' + str(date)
-            if k in ohl_lookup:
-                return ohl_lookup[k]
-            # fallback: try exact match in symbols for that date
-            for idx,row in ohl[ohl['Date']==str(date)].iterrows():
-                sym = row['Symbol']
-                if sym == str(stock).upper().strip():
-                    return row[ohlv_cols].to_dict()
-            # try partial match
-            for idx,row in ohl[ohl['Date']==str(date)].iterrows():
-                sym = row['Symbol']
-                if str(stock).upper().strip() in sym or sym in str(stock).upper().strip():
-                    return row[ohlv_cols].to_dict()
-            return None
-
-        # apply per-row fill
-        for i, tr in trade_log_df.iterrows():
-            stock = tr['Stock']
-            datev = tr['Date']
-            ovals = try_get_ohlv(stock, datev)
-            if ovals:
-                for c in ohlv_cols:
-                    trade_log_df.at[i, c] = ovals.get(c)
-        
-        # Ensure OHLCV columns are numeric (not strings)
-        for col in ['Open', 'High', 'Low', 'Close', 'Volume']:
-            if col in trade_log_df.columns:
-                trade_log_df[col] = pd.to_numeric(trade_log_df[col], errors='coerce')
-                
+        trade_log_df = bar_store.enrich_ohlcv(trade_log_df, bar_store.load_daily_ohlcv(ohlcv_path))
     except Exception as e:
         print(f"⚠️ Warning: Could not load OHLCV data: {e}")
         pass
@@ -623,136 +429,25 @@ alg_config = {
 }
 config_df = pd.DataFrame(list(alg_config.items()), columns=['Parameter','Value'])
 
-# Write sheets
-with pd.ExcelWriter(OUTPUT_FILE, engine='openpyxl') as writer:
-    trade_log_df.to_excel(writer, sheet_name='Trade Log', index=False)
-    daily_summary.to_excel(writer, sheet_name='Daily Summary', index=False)
-    performance_df.to_excel(writer, sheet_name='Performance', index=False)
-    config_df.to_excel(writer, sheet_name='Algorithm Config', index=False)
-
-# Load workbook and apply formatting
-wb = openpyxl.load_workbook(OUTPUT_FILE)
-
-def format_sheet(ws, header_fill=None, pnl_col_name=None):
-    hdr = Font(bold=True)
-    for cell in ws[1]:
-        cell.font = hdr
-        cell.alignment = Alignment(horizontal='center')
-        if header_fill:
-            cell.fill = header_fill
-    if pnl_col_name:
-        pnl_col = None
-        for idx, cell in enumerate(ws[1], start=1):
-            if str(cell.value).lower() == pnl_col_name.lower():
-                pnl_col = idx
-                break
-        if pnl_col and ws.max_row > 1:
-            col_letter = openpyxl.utils.get_column_letter(pnl_col)
-            green = PatternFill(start_color='C6EFCE', end_color='C6EFCE', fill_type='solid')
-            red = PatternFill(start_color='FFC7CE', end_color='FFC7CE', fill_type='solid')
-            range_str = f'{col_letter}2:{col_letter}{ws.max_row}'
-            ws.conditional_formatting.add(range_str,
-                                          CellIsRule(operator='greaterThan', formula=['0'], stopIfTrue=True, fill=green))
-            ws.conditional_formatting.add(range_str,
-                                          CellIsRule(operator='lessThan', formula=['0'], stopIfTrue=True, fill=red))
-
-# Format Trade Log with blue header
-if 'Trade Log' in wb.sheetnames:
-    ws = wb['Trade Log']
-    blue = PatternFill(start_color='BDD7EE', end_color='BDD7EE', fill_type='solid')
-    format_sheet(ws, header_fill=blue, pnl_col_name='FinalProfit')
-
-# Format Daily Summary with bold headers and conditional coloring on DailyP&L
-if 'Daily Summary' in wb.sheetnames:
-    ws2 = wb['Daily Summary']
-    yellow = PatternFill(start_color='FFF2CC', end_color='FFF2CC', fill_type='solid')
-    format_sheet(ws2, header_fill=yellow, pnl_col_name='DailyP&L')
-
-# Format Performance (special handling for summary format)
-if 'Performance' in wb.sheetnames:
-    ws3 = wb['Performance']
-    
-    # Style for section headers (lines with emojis and titles)
-    header_fill = PatternFill(start_color='4472C4', end_color='4472C4', fill_type='solid')
-    header_font = Font(bold=True, size=14, color='FFFFFF')
-    
-    # Style for separator lines
-    separator_fill = PatternFill(start_color='D9E1F2', end_color='D9E1F2', fill_type='solid')
-    
-    # Style for metric names
-    metric_font = Font(bold=True, size=11)
-    
-    # Style for values
-    value_font = Font(size=11)
-    
-    # Apply formatting row by row
-    for row_idx in range(1, ws3.max_row + 1):
-        metric_cell = ws3.cell(row=row_idx, column=1)
-        value_cell = ws3.cell(row=row_idx, column=2)
-        
-        metric_text = str(metric_cell.value) if metric_cell.value else ''
-        value_text = str(value_cell.value) if value_cell.value else ''
-        
-        # Header rows (with emojis or equals signs)
-        if '═' in metric_text or '📊' in metric_text:
-            metric_cell.font = header_font
-            metric_cell.fill = header_fill
-            value_cell.fill = header_fill
-            # Merge cells for header rows
-            if '📊' in metric_text or '═' in metric_text:
-                ws3.merge_cells(start_row=row_idx, start_column=1, end_row=row_idx, end_column=2)
-                metric_cell.alignment = Alignment(horizontal='center', vertical='center')
-        
-        # Section titles (with emojis)
-        elif any(emoji in metric_text for emoji in ['💰', '📈', '📊', '💵']):
-            metric_cell.font = Font(bold=True, size=12, color='1F4E78')
-            metric_cell.fill = PatternFill(start_color='E7E6E6', end_color='E7E6E6', fill_type='solid')
-            value_cell.fill = PatternFill(start_color='E7E6E6', end_color='E7E6E6', fill_type='solid')
-            ws3.merge_cells(start_row=row_idx, start_column=1, end_row=row_idx, end_column=2)
-        
-        # Separator lines
-        elif '─' in metric_text:
-            metric_cell.fill = separator_fill
-            value_cell.fill = separator_fill
-            ws3.merge_cells(start_row=row_idx, start_column=1, end_row=row_idx, end_column=2)
-        
-        # Data rows
-        elif metric_text and metric_text.strip():
-            metric_cell.font = metric_font
-            value_cell.font = value_font
-            
-            # Color code profit/loss values
-            if 'Net Profit/Loss' in metric_text or 'Final Status' in metric_text or 'Net Amount' in metric_text:
-                if '✅' in value_text or (value_text.startswith('₹') and float(value_text.replace('₹','').replace(',','')) > 0):
-                    value_cell.fill = PatternFill(start_color='C6EFCE', end_color='C6EFCE', fill_type='solid')
-                    value_cell.font = Font(bold=True, size=12, color='006100')
-                elif '❌' in value_text or (value_text.startswith('₹') and float(value_text.replace('₹','').replace(',','')) < 0):
-                    value_cell.fill = PatternFill(start_color='FFC7CE', end_color='FFC7CE', fill_type='solid')
-                    value_cell.font = Font(bold=True, size=12, color='9C0006')
-            
-            # Highlight ROI
-            if 'ROI' in metric_text:
-                value_cell.font = Font(bold=True, size=12)
-    
-    # Adjust column widths
-    ws3.column_dimensions['A'].width = 35
-    ws3.column_dimensions['B'].width = 25
-
-# Format Algorithm Config (dark header, clear key/value)
-if 'Algorithm Config' in wb.sheetnames:
-    ws4 = wb['Algorithm Config']
-    dark = PatternFill(start_color='2F2F2F', end_color='2F2F2F', fill_type='solid')
-    for cell in ws4[1]:
-        cell.fill = dark
-        cell.font = Font(bold=True, color='FFFFFF')
-        cell.alignment = Alignment(horizontal='center')
-    # alternate shading for readability
-    for r in range(2, ws4.max_row+1):
-        fill = PatternFill(start_color='F7F7F7', end_color='F7F7F7', fill_type='solid') if r%2==0 else PatternFill(start_color='FFFFFF', end_color='FFFFFF', fill_type='solid')
-        for c in range(1, ws4.max_column+1):
-            ws4.cell(row=r, column=c).fill = fill
-
-wb.save(OUTPUT_FILE)
+# ===============================
+# RISK ANALYSIS (BOOTSTRAP / MONTE CARLO)
+# ===============================
+risk_df, distribution_df = risk_engine.analyze(trade_log_df, C_PER_DAY, L_PCT)
+
+# Write all sheets (formatted) in one streaming pass + Parquet/JSON copies
+report_start = datetime.now()
+report_writer.write_report(OUTPUT_FILE, [
+    report_writer.table_sheet('Trade Log', trade_log_df, report_writer.TRADE_LOG_FILL, pnl_col='FinalProfit'),
+    report_writer.table_sheet('Daily Summary', daily_summary, report_writer.DAILY_FILL, pnl_col='DailyP&L'),
+    report_writer.performance_sheet('Performance', performance_df),
+    report_writer.config_sheet('Algorithm Config', config_df),
+] + risk_engine.report_sheets(risk_df, distribution_df))
+exports = report_writer.export_tables(OUTPUT_FILE, {
+    'Trade Log': trade_log_df,
+    'Daily Summary': daily_summary,
+    'Performance': performance_df,
+})
+print(f"📝 Report + {len(exports)} table copies written in {(datetime.now() - report_start).total_seconds():.2f}s")
 
 print("✅ Phase-4 BACKTEST (5-minute) completed successfully")
 print(f"📄 Output saved to: {OUTPUT_FILE}")
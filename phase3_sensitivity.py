@@ -0,0 +1,389 @@
+"""
+PHASE-3 THRESHOLD SENSITIVITY ENGINE
+------------------------------------
+• Indicator columns (VWAP, RS_30m, VolMult_od, ATR, Buffer) computed ONCE
+  via phase-3's compute_indicators
+• Threshold-free parts (ORB levels, day high, triggers, confirmation scans)
+  precomputed once per candle
+• Eligibility for every threshold combo as broadcast boolean masks
+  (candles × combos), first eligible candle per symbol-day via reduceat
+• Stop / target for every confirmed entry × (ATR_MULTIPLIER, RISK_REWARD_RATIO)
+• Outputs (phase-3results/):
+    phase3_sensitivity_summary.csv — signal / entry counts per combo
+    phase3_sensitivity_entries.csv — entries per combo in Phase-3 result
+                                     columns (load_entries → param_sweep)
+
+Usage:
+    python phase3_sensitivity.py [grid.json]
+"""
+
+import os
+import sys
+import json
+import time as _time
+import importlib
+import itertools
+import numpy as np
+import pandas as pd
+from datetime import time
+
+phase3 = importlib.import_module("phase-3")
+
+# ==============================
+# CONFIG
+# ==============================
+
+OUTPUT_DIR = "phase-3results"
+SUMMARY_FILE = os.path.join(OUTPUT_DIR, "phase3_sensitivity_summary.csv")
+ENTRIES_FILE = os.path.join(OUTPUT_DIR, "phase3_sensitivity_entries.csv")
+
+# Current phase-3.py thresholds
+BASE_THRESHOLDS = {
+    "VOLMULT_A": 1.8,
+    "VOLMULT_B": 1.3,
+    "VOLMULT_C": 1.5,
+    "RS_MIN": 0.6,
+    "NEAR_VWAP_PCT": 0.0025,
+    "NEAR_HIGH_PCT": 0.004,
+    "ATR_MULTIPLIER": phase3.ATR_MULTIPLIER,
+    "RISK_REWARD_RATIO": phase3.RISK_REWARD_RATIO,
+}
+
+DEFAULT_GRID = {
+    "VOLMULT_A": [1.5, 1.8, 2.1],
+    "VOLMULT_B": [1.1, 1.3, 1.5],
+    "VOLMULT_C": [1.3, 1.5, 1.8],
+    "RS_MIN": [0.4, 0.6, 0.8],
+    "ATR_MULTIPLIER": [1.0, 1.25, 1.5],
+    "RISK_REWARD_RATIO": [1.5, 2.0, 2.5],
+}
+
+MODE_B_TIME_GATE = time(9, 45)
+MIN_STOP_DISTANCE_PCT = 0.0075
+MODE_LABELS = {"A": "A - ORB Breakout", "B": "B - VWAP Reclaim", "C": "C - Day High Break"}
+
+# Which thresholds drive each mode's eligibility
+MODE_KEYS = {
+    "A": ("VOLMULT_A", "RS_MIN"),
+    "B": ("VOLMULT_B", "NEAR_VWAP_PCT"),
+    "C": ("VOLMULT_C", "NEAR_HIGH_PCT"),
+}
+
+
+def _tod(t):
+    return t.hour * 3600 + t.minute * 60 + t.second
+
+
+# ==============================
+# INDICATORS (ONCE)
+# ==============================
+
+def load_indicators():
+    """phase-3 indicator frame for every Phase-2 symbol-day, one row per candle."""
+    phase2_df = phase3.load_phase2()
+    nsei = phase3.load_nsei_5m()
+    frames = []
+    for symbol in phase2_df["Symbol"].unique():
+        df = phase3.compute_indicators(symbol, phase2_df, nsei)
+        if df is not None:
+            frames.append(df)
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames, ignore_index=True)
+
+
+def prepare(df):
+    """
+    Threshold-free per-candle arrays: groups, eligibility bases, triggers,
+    confirmation scans and stop inputs.
+    """
+    grp = df.groupby(["Symbol", "Date"], sort=False).ngroup().to_numpy()
+    if len(grp) and np.any(np.diff(grp) < 0):
+        order = np.argsort(grp, kind="stable")
+        df = df.iloc[order].reset_index(drop=True)
+        grp = grp[order]
+    n = len(df)
+    idx = np.arange(n)
+    starts = np.flatnonzero(np.r_[True, grp[1:] != grp[:-1]]) if n else np.zeros(0, dtype=np.int64)
+    pos = idx - starts[grp]
+
+    col = lambda c: pd.to_numeric(df[c], errors="coerce").to_numpy(dtype=float)
+    o, h, l, c, v = col("Open"), col("High"), col("Low"), col("Close"), col("Volume")
+    vwap, buf = col("VWAP"), col("Buffer")
+    dt = df["Datetime"].dt
+    tod = (dt.hour * 3600 + dt.minute * 60 + dt.second).to_numpy()
+
+    def prev(x):
+        out = np.full(n, np.nan)
+        out[1:] = x[:-1]
+        out[pos == 0] = np.nan
+        return out
+
+    hs = pd.Series(h)
+    day_high = hs.groupby(grp).cummax().to_numpy()
+
+    # ORB per symbol-day (needs ≥ 3 candles in the window)
+    in_orb = (tod >= _tod(phase3.MARKET_OPEN)) & (tod <= _tod(phase3.ORB_END))
+    orb_n = np.bincount(grp, weights=in_orb, minlength=len(starts))
+    orb_high = pd.Series(np.where(in_orb, h, np.nan)).groupby(grp).max().to_numpy()[grp]
+    orb_low = pd.Series(np.where(in_orb, l, np.nan)).groupby(grp).min().to_numpy()[grp]
+    orb_ok = orb_n[grp] >= 3
+
+    after_a_start = tod >= _tod(phase3.MODE_A_START)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        base = {
+            "A": orb_ok & after_a_start & (tod <= _tod(phase3.MODE_A_END)) & (c > vwap),
+            "B": (prev(c) <= prev(vwap)) & (c > vwap) & after_a_start,
+            "C": after_a_start.copy(),
+        }
+        trig = {
+            "A": phase3.round_to_tick(orb_high + buf),
+            "B": phase3.round_to_tick(vwap + buf),
+            "C": phase3.round_to_tick(day_high + buf),
+        }
+        dist = {
+            "B": np.abs((c - vwap) / vwap),
+            "C": (day_high - c) / day_high,
+        }
+    for m in base:
+        base[m] &= ~np.isnan(trig[m])
+
+    green = c > o
+    with np.errstate(invalid="ignore"):
+        vol_spike = v > prev(v) * 1.1
+    filters = {
+        "A": np.ones(n, dtype=bool),
+        "B": (tod >= _tod(MODE_B_TIME_GATE)) & green,
+        "C": green,
+    }
+
+    # Mode-C consolidation low: min Low of the previous ≤6 candles (≥3 needed)
+    cons = pd.Series(l).groupby(grp).transform(lambda x: x.shift(1).rolling(6, min_periods=1).min()).to_numpy()
+    cons = np.where(pos >= 3, cons, np.nan)
+    cons_ok = pos >= 3
+
+    g_end = np.r_[starts[1:], n] if n else np.zeros(0, dtype=np.int64)
+    data = {
+        "df": df, "n": n, "grp": grp, "starts": starts, "g_end": g_end[grp] if n else g_end,
+        "close": c, "low": l, "volume": v, "vwap": vwap, "vol_spike": vol_spike,
+        "volmult": col("VolMult_od"), "rs": col("RS_30m"), "atr5": col("ATR_5m_pct"),
+        "orb_low": orb_low, "cons_low": cons, "cons_ok": cons_ok,
+        "base": base, "trig": trig, "dist": dist, "filters": filters,
+    }
+    data["confirm"] = {m: confirm_rows(data, m) for m in "ABC"}
+    return data
+
+
+def confirm_rows(data, mode):
+    """
+    For every candle f that could be a mode's first eligible candle: the
+    first candle r ≥ f of the same symbol-day with Close > trigger(f) and
+    the mode's confirmation filters (-1 if none). One pass per offset.
+    """
+    n = data["n"]
+    out = np.full(n, -1, dtype=np.int64)
+    cand = np.flatnonzero(data["base"][mode])
+    if len(cand) == 0:
+        return out
+    close, filt, g_end = data["close"], data["filters"][mode], data["g_end"]
+    trig = data["trig"][mode][cand]
+    pending = np.ones(len(cand), dtype=bool)
+    max_len = int((g_end[cand] - cand).max())
+    for k in range(max_len):
+        r = cand + k
+        valid = pending & (r < g_end[cand])
+        if not valid.any():
+            break
+        rr = np.where(valid, r, 0)
+        hit = valid & (close[rr] > trig) & filt[rr]
+        if mode == "B":
+            # volume spike vs the previous candle of the scanned window
+            hit &= (k > 0) & data["vol_spike"][rr]
+        out[cand[hit]] = r[hit]
+        pending &= ~hit
+    return out
+
+
+# ==============================
+# ELIGIBILITY (BROADCAST)
+# ==============================
+
+def eligibility_masks(data, mode, values):
+    """Boolean (candles × combos) eligibility for one mode's (threshold, threshold) pairs."""
+    base = data["base"][mode][:, None]
+    vol_t = np.array([p[0] for p in values], dtype=float)[None, :]
+    second = np.array([p[1] for p in values], dtype=float)[None, :]
+    with np.errstate(invalid="ignore"):
+        vm = data["volmult"][:, None] >= vol_t
+        if mode == "A":
+            other = data["rs"][:, None] >= second
+        else:
+            other = data["dist"][mode][:, None] <= second
+    return base & vm & other
+
+
+def first_per_group(mask, starts, n):
+    """(groups × combos) index of the first True row per group, -1 if none."""
+    if n == 0:
+        return np.full((0, mask.shape[1]), -1, dtype=np.int64)
+    pos = np.where(mask, np.arange(n)[:, None], n)
+    red = np.minimum.reduceat(pos, starts, axis=0)
+    return np.where(red < n, red, -1)
+
+
+# ==============================
+# STOP / TARGET
+# ==============================
+
+def stops_and_targets(data, rows, mode, atr_mult, rr):
+    """Phase-3 hybrid stop + target for entry candles `rows`, vectorized."""
+    entry = data["close"][rows]
+    tick = phase3.TICK_SIZE
+    delta = np.maximum(2 * tick, 0.0005 * entry)
+
+    atr = data["atr5"][rows]
+    atr = np.where(np.isnan(atr), 1.5, atr)
+    stop_distance_pct = np.clip(atr_mult * atr, phase3.STOP_MIN_PCT, phase3.STOP_MAX_PCT) / 100
+    stop_atr = entry - entry * stop_distance_pct
+
+    if mode == "A":
+        structure = data["orb_low"][rows] - delta
+    elif mode == "B":
+        structure = data["vwap"][rows] - delta
+    else:
+        structure = np.where(data["cons_ok"][rows], data["cons_low"][rows], data["low"][rows]) - delta
+
+    # max(structure, stop_atr) with Python's NaN semantics
+    final = np.where(stop_atr > structure, stop_atr, structure)
+    final = phase3.round_to_tick_down(final)
+
+    min_stop_distance = entry * MIN_STOP_DISTANCE_PCT
+    too_tight = (entry - final) < min_stop_distance
+    final = np.where(too_tight, phase3.round_to_tick_down(entry - min_stop_distance), final)
+
+    risk = entry - final
+    target = phase3.round_to_tick_up(entry + rr * risk)
+    r2 = lambda x: np.array([round(float(val), 2) for val in x])
+    return r2(final), r2(target), r2(risk), r2(risk / entry * 100)
+
+
+# ==============================
+# GRID EVALUATION
+# ==============================
+
+def run(grid=None, data=None):
+    """
+    Evaluate every threshold combo.
+
+    Returns:
+        (summary DataFrame, entries DataFrame)
+    """
+    grid = {**{k: [v] for k, v in BASE_THRESHOLDS.items()}, **(grid or DEFAULT_GRID)}
+    unknown = set(grid) - set(BASE_THRESHOLDS)
+    if unknown:
+        raise ValueError(f"❌ Unknown thresholds: {sorted(unknown)}")
+
+    started = _time.perf_counter()
+    if data is None:
+        data = prepare(load_indicators())
+    n, starts = data["n"], data["starts"]
+
+    # Per mode: first eligible candle → confirmed entry candle, per (group, sub-combo)
+    sub = {}
+    for m, keys in MODE_KEYS.items():
+        values = list(itertools.product(grid[keys[0]], grid[keys[1]]))
+        first = first_per_group(eligibility_masks(data, m, values), starts, n)
+        conf = np.where(first >= 0, data["confirm"][m][np.maximum(first, 0)], -1)
+        sub[m] = (values, first, conf)
+
+    df = data["df"]
+    entry_rows = {m: np.unique(sub[m][2][sub[m][2] >= 0]) for m in "ABC"}
+    levels = {}
+    for m in "ABC":
+        for a in grid["ATR_MULTIPLIER"]:
+            for rr in grid["RISK_REWARD_RATIO"]:
+                levels[(m, a, rr)] = stops_and_targets(data, entry_rows[m], m, a, rr)
+
+    summary, entries = [], []
+    combo = 0
+    for ia, ib, ic in itertools.product(*(range(len(sub[m][0])) for m in "ABC")):
+        a, b, c = sub["A"][2][:, ia], sub["B"][2][:, ib], sub["C"][2][:, ic]
+        # Cascading priority A > B > C per symbol-day
+        picks = {"A": a[a >= 0], "B": b[(a < 0) & (b >= 0)], "C": c[(a < 0) & (b < 0) & (c >= 0)]}
+        signals = {m: int((sub[m][1][:, i] >= 0).sum()) for m, i in zip("ABC", (ia, ib, ic))}
+
+        for atr_mult in grid["ATR_MULTIPLIER"]:
+            for rr in grid["RISK_REWARD_RATIO"]:
+                params = {
+                    MODE_KEYS["A"][0]: sub["A"][0][ia][0], MODE_KEYS["A"][1]: sub["A"][0][ia][1],
+                    MODE_KEYS["B"][0]: sub["B"][0][ib][0], MODE_KEYS["B"][1]: sub["B"][0][ib][1],
+                    MODE_KEYS["C"][0]: sub["C"][0][ic][0], MODE_KEYS["C"][1]: sub["C"][0][ic][1],
+                    "ATR_MULTIPLIER": atr_mult, "RISK_REWARD_RATIO": rr,
+                }
+                risk_pcts = []
+                for m in "ABC":
+                    rows = np.sort(picks[m])
+                    if len(rows) == 0:
+                        continue
+                    stop, target, risk, risk_pct = levels[(m, atr_mult, rr)]
+                    k = np.searchsorted(entry_rows[m], rows)
+                    risk_pcts.append(risk_pct[k])
+                    entries.append((np.full(len(rows), combo), rows, np.full(len(rows), m),
+                                    stop[k], target[k], risk[k], risk_pct[k]))
+                all_risk = np.concatenate(risk_pcts) if risk_pcts else np.zeros(0)
+                summary.append({
+                    "combo": combo, **params,
+                    **{f"signals_{m}": signals[m] for m in "ABC"},
+                    **{f"entries_{m}": len(picks[m]) for m in "ABC"},
+                    "entries": sum(len(p) for p in picks.values()),
+                    "avg_risk_pct": round(float(np.nanmean(all_risk)), 3) if len(all_risk) else np.nan,
+                })
+                combo += 1
+
+    summary_df = pd.DataFrame(summary)
+    combos, rows, modes, stop, target, risk, risk_pct = (
+        [np.concatenate(parts) for parts in zip(*entries)] if entries
+        else [np.zeros(0, dtype=np.int64)] * 2 + [np.zeros(0, dtype=object)] + [np.zeros(0)] * 4
+    )
+    entries_df = pd.DataFrame({
+        "combo": combos,
+        "Date": df["Date"].to_numpy()[rows],
+        "Stock": df["Symbol"].to_numpy()[rows],
+        "Entry Mode": pd.Series(modes, dtype=object).map(MODE_LABELS).to_numpy(),
+        "Entry Time": df["Time"].to_numpy()[rows],
+        "Entry Price (₹)": np.round(data["close"][rows], 2),
+        "Stop-Loss (₹)": stop,
+        "Target (₹)": target,
+        "Risk Per Share (₹)": risk,
+        "Risk %": risk_pct,
+    })
+    entries_df = entries_df.sort_values(["combo", "Date", "Entry Time"], kind="stable").reset_index(drop=True)
+    print(f"⏱️ {len(summary_df)} threshold combos evaluated over {n} candles in {_time.perf_counter() - started:.1f}s")
+    return summary_df, entries_df
+
+
+def save(summary_df, entries_df, summary_file=SUMMARY_FILE, entries_file=ENTRIES_FILE):
+    os.makedirs(os.path.dirname(summary_file) or ".", exist_ok=True)
+    summary_df.to_csv(summary_file, index=False)
+    entries_df.to_csv(entries_file, index=False)
+
+
+def load_entries(combo, entries_file=ENTRIES_FILE):
+    """Entries of one combo in Phase3_results column layout (for param_sweep)."""
+    df = pd.read_csv(entries_file)
+    return df[df["combo"] == combo].drop(columns=["combo"]).reset_index(drop=True)
+
+
+def main():
+    grid = None
+    if len(sys.argv) > 1:
+        with open(sys.argv[1]) as f:
+            grid = json.load(f)
+    summary_df, entries_df = run(grid)
+    save(summary_df, entries_df)
+    print(summary_df.sort_values("entries", ascending=False).head(10).to_string(index=False))
+    print(f"\n✅ Summary: {SUMMARY_FILE}\n✅ Entries: {ENTRIES_FILE}")
+
+
+if __name__ == "__main__":
+    main()
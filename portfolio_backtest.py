@@ -0,0 +1,343 @@
+"""
+EVENT-DRIVEN INTRADAY PORTFOLIO BACKTEST
+----------------------------------------
+• Same Phase-3 entries, edge filter, 4A–4D sizing and exit rules as
+  phase-4.py — but capital is accounted for in time order instead of
+  pro-rating each day up front (4E)
+• Per day, entries and exits are merged into one time-ordered event heap:
+  an early exit frees its cash before later signals are sized
+• Live limits at every entry: available cash, gross exposure, open
+  positions; trades that do not fit are shrunk or rejected (with reason)
+• Daily loss stop: once realised day P&L reaches −C_PER_DAY × L_PCT, no
+  new entries and every open position is flattened at that bar's close
+• Exits for every candidate come from one batched exit_engine call, so a
+  position costs two heap events (entry + exit), never a Python step per bar
+• Output: phase-4results/portfolio_backtest_<ts>.xlsx (Trade Log incl.
+  rejected signals, Daily Summary with exposure/cash, Portfolio Config,
+  risk sheets)
+
+Usage:
+    python portfolio_backtest.py
+"""
+
+import os
+import heapq
+import time as _time
+import warnings
+import numpy as np
+import pandas as pd
+from datetime import datetime
+
+import exit_engine
+import param_sweep
+import risk_engine
+
+warnings.filterwarnings('ignore', message='Could not infer format')
+
+# ==============================
+# CONFIG
+# ==============================
+
+PHASE3_FILE = param_sweep.PHASE3_FILE
+FIVE_MIN_DATA_DIR = param_sweep.FIVE_MIN_DATA_DIR
+OUTPUT_DIR = "phase-4results"
+
+PARAMS = dict(param_sweep.BASE_PARAMS)
+
+MAX_EXPOSURE_PCT = 1.0          # gross open notional ≤ C_PER_DAY × this
+MAX_POSITIONS = None            # concurrent open positions (None = no limit)
+MIN_TRADE_VALUE = 5000          # shrunk orders below this are rejected
+DAILY_LOSS_STOP = True          # flatten + stop at −C_PER_DAY × L_PCT realised
+
+END_OF_DAY = 86_400             # exit time for trades the kernel never closed
+
+TRADE_COLUMNS = ["Date", "Stock", "EntryTime", "ExitTime", "Status", "Reason", "EntryPrice", "StopLoss",
+                 "Target", "ExitPrice", "TargetQty", "Quantity", "InvestedAmount", "ProfitBeforeCosts",
+                 "TransactionCost", "FinalProfit"]
+DAILY_COLUMNS = ["Date", "Signals", "Filled", "Resized", "Rejected", "PeakExposure", "MinCash",
+                 "MaxOpenPositions", "DailyP&L", "LossStopTime"]
+
+
+# ==============================
+# HELPERS
+# ==============================
+
+def tod_str(tod):
+    if tod < 0:
+        return ""
+    tod = min(int(tod), END_OF_DAY - 1)
+    return f"{tod // 3600:02d}:{tod // 60 % 60:02d}:{tod % 60:02d}"
+
+
+def simulate_exits(data, params, trades):
+    """
+    Exit price / time-of-day / reason for every candidate trade, batched.
+
+    Returns:
+        exit_price, exit_tod (END_OF_DAY when never closed), reason arrays
+    """
+    n = len(trades)
+    exit_price = data["entry"][trades].copy()
+    exit_tod = np.full(n, END_OF_DAY, dtype=np.int64)
+    reason = np.full(n, "NO_EXIT", dtype=object)
+
+    sel = data["has_data"][trades]
+    # no bars → closed at entry, immediately (as phase-4.py does)
+    reason[~sel] = "NO_5M_DATA"
+    exit_tod[~sel] = data["entry_tods"][trades][~sel]
+    if sel.any():
+        t = trades[sel]
+        h, m = (int(x) for x in str(params["FORCE_EXIT_TIME"]).split(":")[:2])
+        sim = exit_engine.simulate_trades(
+            data["packed"], data["starts"][t], data["ends"][t],
+            entry_tods=data["entry_tods"][t],
+            entry_prices=data["entry"][t],
+            stops=data["stop"][t],
+            targets=data["target"][t],
+            force_exit_tod=h * 3600 + m * 60,
+            tiers=(params["TIER_BREAKEVEN_R"], params["TIER_LOCK_R"], params["TIER_LOCK_PROFIT_R"],
+                   params["TIER_TRAIL_R"], params["TIER_TRAIL_DIST_R"]),
+            cost_buffer_pct=params["BREAKEVEN_BUFFER_PCT"],
+        )
+        hit = sim["exit_idx"] >= 0
+        tods = data["packed"][4]
+        exit_price[sel] = np.where(hit, sim["exit_price"], data["entry"][t])
+        exit_tod[sel] = np.where(hit, tods[np.maximum(sim["exit_idx"], 0)], END_OF_DAY)
+        reason[sel] = sim["reason"]
+    return exit_price, exit_tod, reason
+
+
+def mark_price(data, trade, tod):
+    """Close of the trade's last bar at/before `tod` after its entry (entry price if none)."""
+    s, e = data["starts"][trade], data["ends"][trade]
+    if s < 0:
+        return data["entry"][trade]
+    tods = data["packed"][4][s:e]
+    k = np.searchsorted(tods, tod, side="right") - 1
+    if k < 0 or tods[k] <= data["entry_tods"][trade]:
+        return data["entry"][trade]
+    return data["packed"][3][s + k]
+
+
+# ==============================
+# EVENT LOOP
+# ==============================
+
+class DayBook:
+    """Cash / exposure / realised P&L of one trading day."""
+
+    def __init__(self, c_day, params):
+        self.cash = float(c_day)
+        self.exposure = 0.0
+        self.realised = 0.0
+        self.open = 0
+        self.peak_exposure = 0.0
+        self.min_cash = float(c_day)
+        self.max_open = 0
+        self.stop_tod = -1
+        self.max_exposure = c_day * MAX_EXPOSURE_PCT
+        self.loss_stop = c_day * params["L_PCT"] if DAILY_LOSS_STOP else np.inf
+        self.tx = params["TRANSACTION_COST_PCT"]
+        self.slip = params["SLIPPAGE_PCT"]
+
+    def fit(self, qty, price):
+        """Largest quantity ≤ qty the cash / exposure limits allow right now."""
+        unit_cost = price * (1.0 + self.tx + self.slip)
+        qty = min(qty, np.floor(self.cash / unit_cost) if unit_cost > 0 else 0.0,
+                  np.floor((self.max_exposure - self.exposure) / price) if price > 0 else 0.0)
+        return max(qty, 0.0)
+
+    def enter(self, qty, price):
+        invested = qty * price
+        self.cash -= invested * (1.0 + self.tx + self.slip)
+        self.exposure += invested
+        self.open += 1
+        self.peak_exposure = max(self.peak_exposure, self.exposure)
+        self.min_cash = min(self.min_cash, self.cash)
+        self.max_open = max(self.max_open, self.open)
+
+    def exit(self, qty, entry, price):
+        """Settle a position; returns (gross, costs)."""
+        gross = (price - entry) * qty
+        costs = qty * entry * self.tx + qty * (entry + price) * self.slip
+        self.cash += qty * price * (1.0 - self.slip)
+        self.exposure -= qty * entry
+        self.realised += gross - costs
+        self.open -= 1
+        return gross, costs
+
+
+def run_day(data, trades, target_qty, exit_price, exit_tod, reason, params, out):
+    """
+    Replay one day's candidates (`trades` = trade indexes, other arrays
+    aligned with it) in entry-time order through the exit heap, filling
+    `out` in place.
+
+    Returns:
+        DayBook after the last exit
+    """
+    book = DayBook(params["C_PER_DAY"], params)
+    heap = []               # pending exits: (tod, seq, candidate)
+    stopped = False
+
+    def settle(c, tod, price, why):
+        trade = trades[c]
+        gross, costs = book.exit(out["qty"][c], data["entry"][trade], price)
+        out["exit_price"][c], out["exit_tod"][c], out["reason"][c] = price, tod, why
+        out["gross"][c], out["costs"][c] = gross, costs
+
+    def flatten(tod):
+        while heap:
+            _, _, c = heapq.heappop(heap)
+            settle(c, tod, mark_price(data, trades[c], tod), "DAILY_LOSS_STOP")
+        book.stop_tod = tod
+
+    def drain(until):
+        nonlocal stopped
+        while heap and heap[0][0] <= until:
+            tod, _, c = heapq.heappop(heap)
+            settle(c, tod, exit_price[c], reason[c])
+            if not stopped and book.realised <= -book.loss_stop:
+                stopped = True
+                flatten(tod)
+
+    for seq, c in enumerate(trades_order(data, trades)):
+        tod = data["entry_tods"][trades[c]]
+        drain(tod)          # exits at/before this second free their cash first
+
+        if stopped:
+            out["reason"][c] = "REJECTED_DAILY_STOP"
+            continue
+        if MAX_POSITIONS is not None and book.open >= MAX_POSITIONS:
+            out["reason"][c] = "REJECTED_MAX_POSITIONS"
+            continue
+
+        price = data["entry"][trades[c]]
+        qty = book.fit(target_qty[c], price)
+        if qty <= 0 or qty * price < min(MIN_TRADE_VALUE, target_qty[c] * price):
+            out["reason"][c] = "REJECTED_CAPITAL"
+            continue
+
+        book.enter(qty, price)
+        out["qty"][c] = qty
+        out["status"][c] = "FILLED" if qty == target_qty[c] else "RESIZED"
+        heapq.heappush(heap, (exit_tod[c], seq, c))
+
+    drain(END_OF_DAY)
+    return book
+
+
+def trades_order(data, trades):
+    """Candidate positions in entry-time order (ties keep Phase-3 order)."""
+    return np.argsort(data["entry_tods"][trades], kind="stable")
+
+
+def run_portfolio(data, params=None):
+    """
+    Event-driven backtest of every traded Phase-3 signal.
+
+    Returns:
+        (trade_log_df, daily_df)
+    """
+    params = dict(PARAMS if params is None else params)
+    target = param_sweep.allocate(data, params, scale_day=False)
+    cand = np.flatnonzero(target > 0)
+
+    exit_price, exit_tod, reason = simulate_exits(data, params, cand)
+    n = len(cand)
+    out = {
+        "qty": np.zeros(n),
+        "status": np.full(n, "REJECTED", dtype=object),
+        "reason": np.empty(n, dtype=object),
+        "exit_price": np.full(n, np.nan),
+        "exit_tod": np.full(n, -1, dtype=np.int64),
+        "gross": np.zeros(n),
+        "costs": np.zeros(n),
+    }
+
+    days = data["day"][cand]
+    labels = np.array([pd.to_datetime(d).strftime("%Y-%m-%d") for d in data["days"]], dtype=object)
+    by_day = np.argsort(days, kind="stable")
+    bounds = np.flatnonzero(np.diff(days[by_day])) + 1
+    daily_rows = []
+    for pos in np.split(by_day, bounds) if n else []:
+        d = days[pos[0]]
+        sub = {k: v[pos] for k, v in out.items()}
+        book = run_day(data, cand[pos], target[cand][pos], exit_price[pos], exit_tod[pos], reason[pos],
+                       params, sub)
+        for k, v in sub.items():
+            out[k][pos] = v
+
+        status = sub["status"]
+        daily_rows.append({
+            "Date": labels[d],
+            "Signals": len(pos),
+            "Filled": int((status == "FILLED").sum()),
+            "Resized": int((status == "RESIZED").sum()),
+            "Rejected": int((status == "REJECTED").sum()),
+            "PeakExposure": round(book.peak_exposure, 2),
+            "MinCash": round(book.min_cash, 2),
+            "MaxOpenPositions": book.max_open,
+            "DailyP&L": round(book.realised, 2),
+            "LossStopTime": tod_str(book.stop_tod),
+        })
+
+    trade_log_df = pd.DataFrame({
+        "Date": labels[days],
+        "Stock": data["symbol"][cand],
+        "EntryTime": [tod_str(t) for t in data["entry_tods"][cand]],
+        "ExitTime": [tod_str(t) for t in out["exit_tod"]],
+        "Status": out["status"],
+        "Reason": out["reason"],
+        "EntryPrice": data["entry"][cand],
+        "StopLoss": data["stop"][cand],
+        "Target": data["target"][cand],
+        "ExitPrice": out["exit_price"],
+        "TargetQty": target[cand].astype(int),
+        "Quantity": out["qty"].astype(int),
+        "InvestedAmount": out["qty"] * data["entry"][cand],
+        "ProfitBeforeCosts": out["gross"],
+        "TransactionCost": out["costs"],
+        "FinalProfit": out["gross"] - out["costs"],
+    }, columns=TRADE_COLUMNS)
+    return trade_log_df, pd.DataFrame(daily_rows, columns=DAILY_COLUMNS)
+
+
+# ==============================
+# MAIN
+# ==============================
+
+def main():
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    t0 = _time.time()
+    data = param_sweep.load_sweep_data(PHASE3_FILE, FIVE_MIN_DATA_DIR)
+    print(f"📥 {len(data['entry'])} Phase-3 signals over {data['n_days']} days loaded in {_time.time() - t0:.1f}s")
+
+    t0 = _time.time()
+    trade_log_df, daily_df = run_portfolio(data)
+    print(f"⚡ Event-driven replay: {len(trade_log_df)} signals in {_time.time() - t0:.2f}s")
+
+    filled = trade_log_df[trade_log_df["Quantity"] > 0]
+    config_df = pd.DataFrame(
+        list(PARAMS.items()) + [("MAX_EXPOSURE_PCT", MAX_EXPOSURE_PCT), ("MAX_POSITIONS", MAX_POSITIONS),
+                                ("MIN_TRADE_VALUE", MIN_TRADE_VALUE), ("DAILY_LOSS_STOP", DAILY_LOSS_STOP)],
+        columns=["Parameter", "Value"])
+    risk_df, distribution_df = risk_engine.analyze(filled, PARAMS["C_PER_DAY"], PARAMS["L_PCT"])
+
+    output_file = os.path.join(OUTPUT_DIR, f"portfolio_backtest_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx")
+    with pd.ExcelWriter(output_file, engine="openpyxl") as writer:
+        trade_log_df.to_excel(writer, sheet_name="Trade Log", index=False)
+        daily_df.to_excel(writer, sheet_name="Daily Summary", index=False)
+        config_df.to_excel(writer, sheet_name="Portfolio Config", index=False)
+        risk_engine.write_sheets(writer, risk_df, distribution_df)
+
+    status = trade_log_df["Status"].value_counts().to_dict()
+    stops = int((daily_df["LossStopTime"] != "").sum()) if len(daily_df) else 0
+    print(f"📊 Filled {status.get('FILLED', 0)}, resized {status.get('RESIZED', 0)}, rejected {status.get('REJECTED', 0)}")
+    print(f"🛑 Daily loss stop hit on {stops} day(s)")
+    print(f"Total P&L: ₹{filled['FinalProfit'].sum():,.2f}")
+    print(f"📄 Output saved to: {output_file}")
+
+
+if __name__ == "__main__":
+    main()
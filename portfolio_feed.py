@@ -0,0 +1,268 @@
+"""
+PORTFOLIO FEED
+--------------
+• One upstream poller of the paper broker's /portfolio for the whole API
+  server → broker load is constant however many dashboards are connected
+• P&L enrichment (current_pnl, pnl_pct, current_price) computed once per
+  poll and shared by /api/portfolio, /api/positions and the websocket
+• Every poll is diffed against the previous snapshot; only changes are
+  pushed: positions added / changed (changed fields only) / removed, and
+  the account totals that moved. Nothing changed → nothing sent
+• REST reads come from the snapshot while it is fresh; a stale snapshot
+  triggers one coalesced refresh (single flight, failures back off too)
+• Optional shared QuoteCache: open positions' tokens are watched on it and
+  every quote update re-prices them (and pushes the diff) between broker
+  polls, so the dashboard rides the same LTP poller as everything else in
+  the process. Without quotes, or when a quote is stale, the broker's ltp
+  is used
+• Runner-agnostic: start(spawn, sleep) takes socketio.start_background_task
+  / socketio.sleep, plain threads by default. Idle without subscribers
+
+Diff payload (event DIFF_EVENT):
+    {"seq": n, "added": [pos], "changed": [{"key": id, field: value}],
+     "removed": [id], "account": {field: value}}
+"""
+
+import time
+import threading
+
+# ==============================
+# CONFIG
+# ==============================
+
+POLL_SECONDS = 1.0
+MAX_AGE_SECONDS = 2.0           # REST reads older than this refresh upstream
+QUOTE_MAX_AGE_SECONDS = 5.0     # older shared quotes fall back to the broker's ltp
+SNAPSHOT_EVENT = "portfolio_update"
+DIFF_EVENT = "portfolio_diff"
+
+
+def enrich_positions(positions, prices=None):
+    """Open positions with current_pnl, pnl_pct and current_price added (prices: token → live LTP)."""
+    prices = prices or {}
+    enriched = []
+    for pos in positions:
+        entry = pos.get('entry_price', 0)
+        ltp = prices.get(pos.get('token'), pos.get('ltp', entry))
+        qty = pos.get('qty', 0)
+
+        pnl = (ltp - entry) * qty
+        pnl_pct = ((ltp - entry) / entry * 100) if entry > 0 else 0
+
+        enriched.append({
+            **pos,
+            'current_pnl': round(pnl, 2),
+            'pnl_pct': round(pnl_pct, 2),
+            'current_price': ltp
+        })
+    return enriched
+
+
+def position_key(pos):
+    """Stable identity of a position across polls."""
+    return pos.get('order_id') or pos.get('symbol')
+
+
+def diff_snapshots(old, new):
+    """
+    Changes from snapshot old (None → everything is new) to new.
+
+    Returns:
+        diff payload dict, or None when nothing changed
+    """
+    old_pos = {position_key(p): p for p in old["positions"]} if old else {}
+    new_pos = {position_key(p): p for p in new["positions"]}
+
+    added = [p for k, p in new_pos.items() if k not in old_pos]
+    removed = [k for k in old_pos if k not in new_pos]
+    changed = []
+    for k, p in new_pos.items():
+        before = old_pos.get(k)
+        if before is not None and before != p:
+            changed.append({"key": k, **{f: v for f, v in p.items() if before.get(f) != v}})
+
+    old_account = old["account"] if old else {}
+    account = {f: v for f, v in new["account"].items() if old_account.get(f) != v}
+
+    if not (added or removed or changed or account):
+        return None
+    return {"seq": new["seq"], "added": added, "changed": changed, "removed": removed, "account": account}
+
+
+# ==============================
+# FEED
+# ==============================
+
+class PortfolioFeed:
+    """Shared portfolio snapshot: one poller, diffs fanned out through emit."""
+
+    def __init__(self, fetcher, emit=None, poll_seconds=POLL_SECONDS, max_age=MAX_AGE_SECONDS,
+                 quotes=None, quote_max_age=QUOTE_MAX_AGE_SECONDS):
+        self.fetcher = fetcher          # () → portfolio dict or None
+        self.emit = emit                # (event, payload) → None, e.g. socketio.emit to a room
+        self.poll_seconds = poll_seconds
+        self.max_age = max_age
+        self.quotes = quotes            # shared quote_cache.QuoteCache (or None)
+        self.quote_max_age = quote_max_age
+
+        self._snapshot = None           # never mutated in place; readers don't lock
+        self._refresh_lock = threading.Lock()   # single upstream fetch at a time
+        self._state_lock = threading.Lock()     # snapshot / seq / watched tokens
+        self._watched = set()
+        self._last_attempt = 0.0
+        self._seq = 0
+        self._subscribers = set()
+        self._running = False
+        self._stop = threading.Event()
+
+        self.stats = {"polls": 0, "errors": 0, "diffs": 0, "unchanged": 0, "rest_refreshes": 0,
+                      "quote_repricings": 0}
+        if quotes is not None:
+            quotes.subscribe(self._on_quotes)
+
+    # ------------------------------
+    # SNAPSHOTS
+    # ------------------------------
+
+    def snapshot(self):
+        """Latest snapshot {seq, ts, portfolio, positions, account} (or None). Read-only."""
+        return self._snapshot
+
+    def poll_once(self):
+        """Fetch upstream once, publish the diff. Returns the new snapshot (None on failure)."""
+        with self._refresh_lock:
+            self._last_attempt = time.monotonic()
+            portfolio = self.fetcher()
+            self.stats["polls"] += 1
+            if not portfolio:
+                self.stats["errors"] += 1
+                return None
+            return self._publish(portfolio)
+
+    def _prices(self, positions):
+        """Live token → price from the shared quote cache for these positions."""
+        if self.quotes is None:
+            return {}
+        prices = {}
+        for pos in positions:
+            price = self.quotes.price(pos.get("token"), max_age=self.quote_max_age)
+            if price is not None:
+                prices[pos.get("token")] = price
+        return prices
+
+    def _watch(self, positions):
+        """Keep the quote cache watching exactly the open positions' tokens."""
+        tokens = {pos.get("token") for pos in positions if pos.get("token") is not None}
+        for token in tokens - self._watched:
+            self.quotes.watch(token)
+        for token in self._watched - tokens:
+            self.quotes.unwatch(token)
+        self._watched = tokens
+
+    def _publish(self, portfolio=None):
+        """New snapshot from a broker portfolio (None → re-price the current one)."""
+        with self._state_lock:
+            ts = time.time()
+            if portfolio is None:
+                if self._snapshot is None:
+                    return None
+                # A re-price keeps the broker poll's freshness clock
+                portfolio, ts = self._snapshot["portfolio"], self._snapshot["ts"]
+            positions = portfolio.get("open_positions", [])
+            if self.quotes is not None:
+                self._watch(positions)
+            self._seq += 1
+            snap = {
+                "seq": self._seq,
+                "ts": ts,
+                "portfolio": portfolio,
+                "positions": enrich_positions(positions, self._prices(positions)),
+                "account": {k: v for k, v in portfolio.items() if k != "open_positions"},
+            }
+            diff = diff_snapshots(self._snapshot, snap)
+            self._snapshot = snap
+
+        if diff is None:
+            self.stats["unchanged"] += 1
+        elif self.emit is not None and self._subscribers:
+            self.stats["diffs"] += 1
+            try:
+                self.emit(DIFF_EVENT, diff)
+            except Exception as e:
+                print(f"⚠️ Portfolio push failed: {e}")
+        return snap
+
+    def _on_quotes(self, updates):
+        """QuoteCache callback: re-price the last broker snapshot when one of its tokens moved."""
+        if self._snapshot is None or not any(t in self._watched for t in updates):
+            return
+        self.stats["quote_repricings"] += 1
+        self._publish()
+
+    def get(self):
+        """
+        Snapshot for a REST read: the cached one while younger than max_age,
+        else one refresh shared by all concurrent callers (a failed refresh
+        is not retried before max_age either). None if never fetched.
+        """
+        snap = self._snapshot
+        if snap is not None and time.time() - snap["ts"] < self.max_age:
+            return snap
+        with self._refresh_lock:
+            recent_attempt = time.monotonic() - self._last_attempt < self.max_age
+        if recent_attempt:
+            return self._snapshot
+        self.stats["rest_refreshes"] += 1
+        return self.poll_once() or self._snapshot
+
+    # ------------------------------
+    # SUBSCRIBERS
+    # ------------------------------
+
+    def subscribe(self, sid):
+        self._subscribers.add(sid)
+
+    def unsubscribe(self, sid):
+        self._subscribers.discard(sid)
+
+    # ------------------------------
+    # POLLER
+    # ------------------------------
+
+    def _run(self, sleep):
+        while not self._stop.is_set():
+            started = time.monotonic()
+            if self._subscribers:
+                self.poll_once()
+            sleep(max(0.0, self.poll_seconds - (time.monotonic() - started)))
+        self._running = False
+
+    def start(self, spawn=None, sleep=None):
+        """Start the single poller once (spawn(target, *args) runs it in the background)."""
+        with self._refresh_lock:
+            if self._running:
+                return
+            self._running = True
+            self._stop.clear()
+        sleep = sleep or time.sleep
+        if self.quotes is not None:
+            self.quotes.start()
+        if spawn is None:
+            threading.Thread(target=self._run, args=(sleep,), name="portfolio-poller", daemon=True).start()
+        else:
+            spawn(self._run, sleep)
+
+    def stop(self):
+        self._stop.set()
+
+    def metrics(self):
+        snap = self._snapshot
+        return {
+            **self.stats,
+            "subscribers": len(self._subscribers),
+            "running": self._running,
+            "watched_tokens": len(self._watched),
+            "quotes": self.quotes.metrics() if self.quotes is not None else None,
+            "seq": snap["seq"] if snap else 0,
+            "age_s": round(time.time() - snap["ts"], 2) if snap else None,
+        }
@@ -5,6 +5,8 @@ import glob
 import json
 from datetime import datetime, time
 
+import exit_engine
+
 # Constants
 RESULTS_DIR = "phase-4results"
 DATA_DIR = "downloaded_data/1min/1min"
@@ -102,25 +104,6 @@ def load_candle_data(symbol, date_str, start_time, end_time):
         })
     return candles
 
-def calculate_trailing_stop(entry_price, initial_stop, current_high, current_stop):
-    R = entry_price - initial_stop
-    cost_buffer = entry_price * 0.001 
-    new_stop = current_stop
-    
-    # 1. Check Breakeven Trigger (1R)
-    if current_high >= (entry_price + R):
-        new_stop = max(new_stop, entry_price + cost_buffer)
-        
-    # 2. Check Profit Locking Trigger (1.5R)
-    if current_high >= (entry_price + (1.5 * R)):
-        new_stop = max(new_stop, entry_price + (0.5 * R))
-        
-    # 3. Dynamic Trail (Deep Profit > 2R)
-    if current_high >= (entry_price + (2.0 * R)):
-        new_stop = max(new_stop, current_high - R)
-        
-    return new_stop
-
 def main():
     latest_file = get_latest_results_file()
     if not latest_file:
@@ -190,26 +173,14 @@ def main():
              print("  Error parsing price data")
              continue
         
-        current_stop = initial_stop
-        highest_price = entry_price
-        
-        for c in candles:
-            if c["time"] < entry_ts:
-                continue
-            if c["time"] > exit_ts:
-                break
-                
-            # Update high
-            if c["high"] > highest_price:
-                highest_price = c["high"]
-            
-            # Update stop
-            current_stop = calculate_trailing_stop(entry_price, initial_stop, highest_price, current_stop)
-            
-            trailing_stop_line.append({
-                "time": c["time"],
-                "value": current_stop
-            })
+        # Stop after each candle in [entry, exit] from the shared trailing-stop engine
+        window = [c for c in candles if entry_ts <= c["time"] <= exit_ts]
+        highs = np.array([c["high"] for c in window], dtype=float)
+        _, stops = exit_engine.tier_stops(entry_price, initial_stop, highs)
+
+        trailing_stop_line = [
+            {"time": c["time"], "value": float(v)} for c, v in zip(window, stops)
+        ]
 
         trades_data.append({
             "type": label,
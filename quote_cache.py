@@ -0,0 +1,240 @@
+"""
+SHARED LIVE QUOTE CACHE
+-----------------------
+• One poller (or a push feed via update_many) per process
+• Latest price per token in an immutable snapshot dict → readers never lock,
+  writers swap the whole reference
+• Subscribers: plain callbacks (called on the poller thread) or asyncio
+  queues (delivered thread-safely onto the subscriber's loop)
+• Staleness metrics: per-token age, stale count, poll latency histogram
+"""
+
+import time
+import asyncio
+import threading
+from collections import namedtuple
+
+from engine_metrics import LatencyHistogram
+
+# ==============================
+# CONFIG
+# ==============================
+
+POLL_SECONDS = 1.0
+STALE_AFTER_SECONDS = 5.0
+QUEUE_MAXSIZE = 100
+
+Quote = namedtuple("Quote", ["token", "price", "ts"])   # ts = time.time() when received
+
+
+def kite_ltp_fetcher(kite):
+    """Adapt KiteConnect.ltp → fetcher(tokens) returning {token: price}."""
+    def fetch(tokens):
+        data = kite.ltp(list(tokens))
+        out = {}
+        for t in tokens:
+            q = data.get(str(t))
+            if q is not None:
+                out[t] = q["last_price"]
+        return out
+    return fetch
+
+
+class QuoteCache:
+    """Latest-price snapshot per token with subscription fan-out."""
+
+    def __init__(self, fetcher=None, poll_seconds=POLL_SECONDS, stale_after=STALE_AFTER_SECONDS):
+        self.fetcher = fetcher
+        self.poll_seconds = poll_seconds
+        self.stale_after = stale_after
+
+        self._snapshot = {}             # token → Quote (never mutated in place)
+        self._write_lock = threading.Lock()
+        self._watch = {}                # token → refcount
+        self._callbacks = []
+        self._queues = []               # (loop, asyncio.Queue)
+
+        self._thread = None
+        self._stop = threading.Event()
+
+        self.poll_latency = LatencyHistogram("Quote poll latency")
+        self.stats = {"polls": 0, "errors": 0, "updates": 0, "dropped_queue_msgs": 0}
+
+    # ------------------------------
+    # WATCHLIST
+    # ------------------------------
+
+    def watch(self, token):
+        with self._write_lock:
+            self._watch[token] = self._watch.get(token, 0) + 1
+
+    def unwatch(self, token):
+        with self._write_lock:
+            n = self._watch.get(token, 0) - 1
+            if n > 0:
+                self._watch[token] = n
+            else:
+                self._watch.pop(token, None)
+                snap = dict(self._snapshot)
+                snap.pop(token, None)
+                self._snapshot = snap
+
+    def watched(self):
+        return list(self._watch)
+
+    # ------------------------------
+    # READS (lock-free)
+    # ------------------------------
+
+    def snapshot(self):
+        """Current token → Quote mapping. Treat as read-only."""
+        return self._snapshot
+
+    def get(self, token, max_age=None):
+        """Latest Quote for token, or None if missing / older than max_age seconds."""
+        q = self._snapshot.get(token)
+        if q is None:
+            return None
+        if max_age is not None and time.time() - q.ts > max_age:
+            return None
+        return q
+
+    def price(self, token, max_age=None):
+        q = self.get(token, max_age)
+        return None if q is None else q.price
+
+    # ------------------------------
+    # WRITES
+    # ------------------------------
+
+    def update_many(self, prices, ts=None):
+        """Apply {token: price} (from the poller or a streaming feed) and fan out."""
+        if not prices:
+            return
+        ts = ts or time.time()
+        updates = {t: Quote(t, float(p), ts) for t, p in prices.items() if p is not None}
+        with self._write_lock:
+            snap = dict(self._snapshot)
+            snap.update(updates)
+            self._snapshot = snap
+            self.stats["updates"] += len(updates)
+            callbacks = list(self._callbacks)
+            queues = list(self._queues)
+
+        for cb in callbacks:
+            try:
+                cb(updates)
+            except Exception as e:
+                print(f"⚠️ Quote subscriber error: {e}")
+        for loop, q in queues:
+            try:
+                loop.call_soon_threadsafe(self._offer, q, updates)
+            except RuntimeError:
+                # Subscriber loop already closed
+                self.unsubscribe_queue(q)
+
+    def update(self, token, price, ts=None):
+        self.update_many({token: price}, ts)
+
+    # ------------------------------
+    # SUBSCRIPTIONS
+    # ------------------------------
+
+    def subscribe(self, callback):
+        """callback(updates: dict token → Quote), called on the writer's thread."""
+        with self._write_lock:
+            self._callbacks.append(callback)
+        return callback
+
+    def unsubscribe(self, callback):
+        with self._write_lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def subscribe_queue(self, loop=None, maxsize=QUEUE_MAXSIZE):
+        """Return an asyncio.Queue fed with update dicts on `loop` (default: running loop)."""
+        loop = loop or asyncio.get_running_loop()
+        q = asyncio.Queue(maxsize=maxsize)
+        with self._write_lock:
+            self._queues.append((loop, q))
+        return q
+
+    def unsubscribe_queue(self, q):
+        with self._write_lock:
+            self._queues = [(l, x) for l, x in self._queues if x is not q]
+
+    def _offer(self, q, updates):
+        # Slow consumer → drop the oldest batch; the snapshot still has the latest prices
+        if q.full():
+            q.get_nowait()
+            self.stats["dropped_queue_msgs"] += 1
+        q.put_nowait(updates)
+
+    # ------------------------------
+    # POLLER
+    # ------------------------------
+
+    def poll_once(self):
+        tokens = self.watched()
+        if not tokens or self.fetcher is None:
+            return 0
+        started = time.perf_counter()
+        try:
+            prices = self.fetcher(tokens)
+        except Exception as e:
+            self.stats["errors"] += 1
+            print(f"⚠️ Failed to fetch LTP batch: {e}")
+            return 0
+        finally:
+            self.poll_latency.observe(time.perf_counter() - started)
+        self.stats["polls"] += 1
+        self.update_many(prices)
+        return len(prices)
+
+    def _run(self):
+        while not self._stop.is_set():
+            started = time.monotonic()
+            self.poll_once()
+            self._stop.wait(max(0.0, self.poll_seconds - (time.monotonic() - started)))
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="quote-poller", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    # ------------------------------
+    # STALENESS METRICS
+    # ------------------------------
+
+    def ages(self):
+        """token → seconds since last quote (missing watched tokens → None)."""
+        now = time.time()
+        snap = self._snapshot
+        return {t: (now - snap[t].ts if t in snap else None) for t in self.watched()}
+
+    def metrics(self):
+        ages = self.ages()
+        known = [a for a in ages.values() if a is not None]
+        return {
+            **self.stats,
+            "watched": len(ages),
+            "missing": sum(1 for a in ages.values() if a is None),
+            "stale": sum(1 for a in known if a > self.stale_after),
+            "max_age_s": round(max(known), 2) if known else None,
+            "poll_latency": self.poll_latency.summary(),
+        }
+
+    def format_metrics(self):
+        m = self.metrics()
+        return (
+            f"💹 Quotes: watched={m['watched']} stale={m['stale']} missing={m['missing']} "
+            f"max_age={m['max_age_s']}s polls={m['polls']} errors={m['errors']} "
+            f"dropped={m['dropped_queue_msgs']} | {self.poll_latency.format()}"
+        )
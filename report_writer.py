@@ -0,0 +1,508 @@
+"""
+PHASE-4 REPORT WRITER
+---------------------
+• Writes the backtest workbook in ONE streaming pass straight to the
+  .xlsx zip: no pandas → disk → openpyxl reopen → per-cell restyle
+• Cell XML is built column by column (one format per column dtype), so
+  10k-trade logs write in well under a second without lxml / xlsxwriter
+• Formats are range-level wherever possible: header row styles, column
+  widths, P&L conditional colouring and Algorithm Config row shading;
+  only the ~30-row Performance sheet is styled cell by cell
+• Same look as the old post-hoc formatting in phase-4.py / phas-4-1min.py
+• export_tables: Parquet (when pyarrow / fastparquet is installed) and JSON
+  copies of Trade Log, Daily Summary and Performance next to the workbook
+"""
+
+import os
+import re
+import json
+import math
+import zipfile
+import numpy as np
+import pandas as pd
+from datetime import datetime, date, time
+
+try:
+    import pyarrow  # noqa: F401
+    HAVE_PARQUET = True
+except ImportError:
+    try:
+        import fastparquet  # noqa: F401
+        HAVE_PARQUET = True
+    except ImportError:
+        HAVE_PARQUET = False
+
+# ==============================
+# CONFIG
+# ==============================
+
+EXPORT_SHEETS = ["Trade Log", "Daily Summary", "Performance"]
+ZIP_LEVEL = 1                   # deflate level: speed over a few % of file size
+
+GREEN = "C6EFCE"
+RED = "FFC7CE"
+
+# Sheet header colours (as the old format_sheet calls)
+TRADE_LOG_FILL = "BDD7EE"
+DAILY_FILL = "FFF2CC"
+RISK_FILL = "E4DFEC"
+CONFIG_FILL = "2F2F2F"
+
+EXCEL_EPOCH = datetime(1899, 12, 30)
+DATETIME_FORMAT = "yyyy-mm-dd hh:mm:ss"
+DATE_FORMAT = "yyyy-mm-dd"
+
+_NS = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+_NS_R = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+_ILLEGAL_XML = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+
+# ==============================
+# SHEET SPECS
+# ==============================
+
+def table_sheet(name, df, header_fill=None, pnl_col=None):
+    """Plain table: styled header row, optional green/red P&L column."""
+    return {"kind": "table", "name": name, "df": df, "header_fill": header_fill, "pnl_col": pnl_col}
+
+
+def performance_sheet(name, df):
+    """Metric/Value summary with section headers, separators and merges."""
+    return {"kind": "performance", "name": name, "df": df}
+
+
+def config_sheet(name, df):
+    """Key/value table with a dark header and alternating row shading."""
+    return {"kind": "config", "name": name, "df": df}
+
+
+# ==============================
+# STYLES
+# ==============================
+
+class Styles:
+    """Registry of cell formats (cellXfs) and conditional-format fills (dxfs)."""
+
+    def __init__(self):
+        self.fonts = [(False, 11, None)]
+        self.fills = [None, "gray125"]
+        self.borders = [False]
+        self.num_fmts = {}
+        self.xfs = [(0, 0, 0, 0, None, None)]
+        self.dxfs = []
+
+    @staticmethod
+    def _index(items, item):
+        if item not in items:
+            items.append(item)
+        return items.index(item)
+
+    def xf(self, bold=False, size=11, color=None, fill=None, border=False, halign=None, valign=None,
+           num_fmt=None):
+        font = self._index(self.fonts, (bold, size, color))
+        fill = self._index(self.fills, fill) if fill else 0
+        border = self._index(self.borders, border)
+        fmt = 0
+        if num_fmt:
+            fmt = self.num_fmts.setdefault(num_fmt, 164 + len(self.num_fmts))
+        return self._index(self.xfs, (font, fill, border, fmt, halign, valign))
+
+    def dxf(self, fill):
+        return self._index(self.dxfs, fill)
+
+    def to_xml(self):
+        out = [f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n<styleSheet xmlns="{_NS}">']
+        if self.num_fmts:
+            out.append(f'<numFmts count="{len(self.num_fmts)}">')
+            out += [f'<numFmt numFmtId="{i}" formatCode="{_esc(code)}"/>' for code, i in self.num_fmts.items()]
+            out.append("</numFmts>")
+
+        out.append(f'<fonts count="{len(self.fonts)}">')
+        for bold, size, color in self.fonts:
+            out.append("<font>" + ("<b/>" if bold else "") + f'<sz val="{size}"/>'
+                       + (f'<color rgb="FF{color}"/>' if color else "")
+                       + '<name val="Calibri"/><family val="2"/></font>')
+        out.append("</fonts>")
+
+        out.append(f'<fills count="{len(self.fills)}">')
+        for fill in self.fills:
+            if fill is None:
+                out.append('<fill><patternFill patternType="none"/></fill>')
+            elif fill == "gray125":
+                out.append('<fill><patternFill patternType="gray125"/></fill>')
+            else:
+                out.append(f'<fill><patternFill patternType="solid"><fgColor rgb="FF{fill}"/>'
+                           f'<bgColor rgb="FF{fill}"/></patternFill></fill>')
+        out.append("</fills>")
+
+        out.append(f'<borders count="{len(self.borders)}">')
+        for thin in self.borders:
+            if thin:
+                out.append('<border><left style="thin"/><right style="thin"/><top style="thin"/>'
+                           '<bottom style="thin"/><diagonal/></border>')
+            else:
+                out.append("<border><left/><right/><top/><bottom/><diagonal/></border>")
+        out.append("</borders>")
+
+        out.append('<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>')
+        out.append(f'<cellXfs count="{len(self.xfs)}">')
+        for font, fill, border, fmt, halign, valign in self.xfs:
+            attrs = (f'numFmtId="{fmt}" fontId="{font}" fillId="{fill}" borderId="{border}" xfId="0"'
+                     + (' applyNumberFormat="1"' if fmt else "")
+                     + (' applyFont="1"' if font else "")
+                     + (' applyFill="1"' if fill else "")
+                     + (' applyBorder="1"' if border else ""))
+            if halign or valign:
+                align = (f' horizontal="{halign}"' if halign else "") + (f' vertical="{valign}"' if valign else "")
+                out.append(f'<xf {attrs} applyAlignment="1"><alignment{align}/></xf>')
+            else:
+                out.append(f"<xf {attrs}/>")
+        out.append("</cellXfs>")
+        out.append('<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>')
+
+        out.append(f'<dxfs count="{len(self.dxfs)}">')
+        out += [f'<dxf><fill><patternFill patternType="solid"><fgColor rgb="FF{fill}"/><bgColor rgb="FF{fill}"/>'
+                f'</patternFill></fill></dxf>' for fill in self.dxfs]
+        out.append("</dxfs></styleSheet>")
+        return "".join(out)
+
+
+# ==============================
+# CELL XML
+# ==============================
+
+def _esc(text):
+    text = _ILLEGAL_XML.sub("", text)
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;").replace('"', "&quot;")
+
+
+def _col_letter(i):
+    letters = ""
+    i += 1
+    while i:
+        i, r = divmod(i - 1, 26)
+        letters = chr(65 + r) + letters
+    return letters
+
+
+def _str_cell(ref, text, style=0):
+    s = f' s="{style}"' if style else ""
+    space = ' xml:space="preserve"' if text[:1].isspace() or text[-1:].isspace() else ""
+    return f'<c r="{ref}"{s} t="inlineStr"><is><t{space}>{_esc(text)}</t></is></c>'
+
+
+def _serial(v):
+    if isinstance(v, datetime):
+        if v.tzinfo is not None:
+            v = v.replace(tzinfo=None)
+        return (v - EXCEL_EPOCH).total_seconds() / 86400.0
+    return float((v - EXCEL_EPOCH.date()).days)
+
+
+def _cell_value(v):
+    """Python value as pandas' ExcelWriter would store it (None = empty cell)."""
+    if v is None or v is pd.NaT:
+        return None
+    if isinstance(v, (float, np.floating)):
+        v = float(v)
+        return None if math.isnan(v) or math.isinf(v) else v
+    if isinstance(v, (bool, np.bool_)):
+        return bool(v)
+    if isinstance(v, (int, np.integer)):
+        return int(v)
+    if isinstance(v, pd.Timestamp):
+        return v.to_pydatetime()
+    if isinstance(v, (str, datetime, date)):
+        return v
+    if isinstance(v, time):
+        return str(v)       # pandas' ExcelWriter stores times as text
+    try:
+        if pd.isna(v):
+            return None
+    except (TypeError, ValueError):
+        pass
+    return str(v)
+
+
+def _any_cell(ref, v, styles, style=0):
+    """One cell from an arbitrary Python value."""
+    v = _cell_value(v)
+    s = f' s="{style}"' if style else ""
+    if v is None:
+        return f'<c r="{ref}"{s}/>' if style else ""
+    if isinstance(v, bool):
+        return f'<c r="{ref}"{s} t="b"><v>{int(v)}</v></c>'
+    if isinstance(v, (int, float)):
+        return f'<c r="{ref}"{s}><v>{v!r}</v></c>'
+    if isinstance(v, (datetime, date)):
+        fmt = styles.xf(num_fmt=DATETIME_FORMAT if isinstance(v, datetime) else DATE_FORMAT)
+        return f'<c r="{ref}" s="{style or fmt}"><v>{_serial(v)!r}</v></c>'
+    return _str_cell(ref, v, style)
+
+
+def _column_cells(series, letter, first_row, styles):
+    """Cell XML for one column, formatted by dtype in a single list pass."""
+    rows = range(first_row, first_row + len(series))
+    if pd.api.types.is_bool_dtype(series):
+        return [f'<c r="{letter}{r}" t="b"><v>{int(v)}</v></c>' for r, v in zip(rows, series.tolist())]
+    if pd.api.types.is_integer_dtype(series) and not series.hasnans:
+        return [f'<c r="{letter}{r}"><v>{v}</v></c>' for r, v in zip(rows, series.tolist())]
+    if pd.api.types.is_float_dtype(series):
+        values = series.to_numpy(dtype=np.float64)
+        finite = np.isfinite(values).tolist()
+        return [f'<c r="{letter}{r}"><v>{v!r}</v></c>' if ok else ""
+                for r, v, ok in zip(rows, values.tolist(), finite)]
+    if pd.api.types.is_datetime64_any_dtype(series):
+        fmt = styles.xf(num_fmt=DATETIME_FORMAT)
+        values = series.dt.tz_localize(None) if getattr(series.dt, "tz", None) is not None else series
+        serial = ((values - pd.Timestamp(EXCEL_EPOCH)) / pd.Timedelta(days=1)).tolist()
+        return [f'<c r="{letter}{r}" s="{fmt}"><v>{v!r}</v></c>' if v == v else ""
+                for r, v in zip(rows, serial)]
+    return [_any_cell(f"{letter}{r}", v, styles) for r, v in zip(rows, series.tolist())]
+
+
+# ==============================
+# SHEET BUILDERS
+# ==============================
+
+class _Sheet:
+    """Worksheet parts collected before the single write."""
+
+    def __init__(self):
+        self.widths = {}
+        self.rows = []           # row XML strings, in order
+        self.merges = []
+        self.formats = []        # (sqref, [cfRule xml])
+
+    def add_conditional(self, sqref, rules):
+        self.formats.append((sqref, rules))
+
+    def to_xml(self):
+        out = [f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+               f'<worksheet xmlns="{_NS}" xmlns:r="{_NS_R}">']
+        if self.widths:
+            out.append("<cols>" + "".join(f'<col min="{c}" max="{c}" width="{w}" customWidth="1"/>'
+                                          for c, w in sorted(self.widths.items())) + "</cols>")
+        out.append("<sheetData>")
+        out += self.rows
+        out.append("</sheetData>")
+        if self.merges:
+            out.append(f'<mergeCells count="{len(self.merges)}">'
+                       + "".join(f'<mergeCell ref="{m}"/>' for m in self.merges) + "</mergeCells>")
+        priority = 1
+        for sqref, rules in self.formats:
+            out.append(f'<conditionalFormatting sqref="{sqref}">')
+            for rule in rules:
+                out.append(rule.format(priority=priority))
+                priority += 1
+            out.append("</conditionalFormatting>")
+        out.append("</worksheet>")
+        return "".join(out)
+
+
+def _row(r, cells):
+    return f'<row r="{r}">' + "".join(cells) + "</row>"
+
+
+def _data_rows(sheet, df, styles, first_row=2):
+    letters = [_col_letter(i) for i in range(len(df.columns))]
+    columns = [_column_cells(df.iloc[:, i], letters[i], first_row, styles) for i in range(len(df.columns))]
+    sheet.rows += [_row(r, cells) for r, cells in zip(range(first_row, first_row + len(df)), zip(*columns))]
+
+
+def _header_row(sheet, df, style):
+    sheet.rows.append(_row(1, [_str_cell(f"{_col_letter(i)}1", str(c), style) for i, c in enumerate(df.columns)]))
+
+
+def _pnl_rules(styles):
+    green, red = styles.dxf(GREEN), styles.dxf(RED)
+    return [
+        f'<cfRule type="cellIs" dxfId="{green}" priority="{{priority}}" operator="greaterThan" stopIfTrue="1">'
+        f'<formula>0</formula></cfRule>',
+        f'<cfRule type="cellIs" dxfId="{red}" priority="{{priority}}" operator="lessThan" stopIfTrue="1">'
+        f'<formula>0</formula></cfRule>',
+    ]
+
+
+def _build_table(spec, styles):
+    df, sheet = spec["df"], _Sheet()
+    _header_row(sheet, df, styles.xf(bold=True, fill=spec["header_fill"], border=True, halign="center"))
+    _data_rows(sheet, df, styles)
+
+    pnl_col = spec["pnl_col"]
+    lower = [str(c).lower() for c in df.columns]
+    if pnl_col and len(df) and pnl_col.lower() in lower:
+        letter = _col_letter(lower.index(pnl_col.lower()))
+        sheet.add_conditional(f"{letter}2:{letter}{len(df) + 1}", _pnl_rules(styles))
+    return sheet
+
+
+def _money(text):
+    try:
+        return float(text.replace("₹", "").replace(",", ""))
+    except ValueError:
+        return 0.0
+
+
+def _performance_styles(metric_text, value_text, styles):
+    """(metric style, value style, merge) for one Performance row."""
+    # Header rows (with emojis or equals signs)
+    if "═" in metric_text or "📊" in metric_text:
+        return (styles.xf(bold=True, size=14, color="FFFFFF", fill="4472C4", halign="center", valign="center"),
+                styles.xf(fill="4472C4"), True)
+
+    # Section titles (with emojis)
+    if any(emoji in metric_text for emoji in ["💰", "📈", "📊", "💵"]):
+        return styles.xf(bold=True, size=12, color="1F4E78", fill="E7E6E6"), styles.xf(fill="E7E6E6"), True
+
+    # Separator lines
+    if "─" in metric_text:
+        return styles.xf(fill="D9E1F2"), styles.xf(fill="D9E1F2"), True
+
+    # Data rows
+    if metric_text.strip():
+        value = styles.xf()
+        if "Net Profit/Loss" in metric_text or "Final Status" in metric_text or "Net Amount" in metric_text:
+            if "✅" in value_text or (value_text.startswith("₹") and _money(value_text) > 0):
+                value = styles.xf(bold=True, size=12, color="006100", fill=GREEN)
+            elif "❌" in value_text or (value_text.startswith("₹") and _money(value_text) < 0):
+                value = styles.xf(bold=True, size=12, color="9C0006", fill=RED)
+        if "ROI" in metric_text:
+            value = styles.xf(bold=True, size=12)
+        return styles.xf(bold=True), value, False
+    return 0, 0, False
+
+
+def _build_performance(spec, styles):
+    df, sheet = spec["df"], _Sheet()
+    sheet.widths = {1: 35, 2: 25}
+    rows = [list(map(str, df.columns))] + df.iloc[:, :2].values.tolist()
+    for r, values in enumerate(rows, start=1):
+        metric, value = (list(values) + [None, None])[:2]
+        metric_text = str(metric) if _cell_value(metric) else ""
+        value_text = str(value) if _cell_value(value) else ""
+        m_style, v_style, merge = _performance_styles(metric_text, value_text, styles)
+        if r == 1:
+            # column header row keeps the table-header border
+            m_style = styles.xf(bold=True, border=True)
+            v_style = styles.xf(border=True)
+        cells = [_any_cell(f"A{r}", metric, styles, m_style), _any_cell(f"B{r}", value, styles, v_style)]
+        sheet.rows.append(_row(r, cells))
+        if merge:
+            sheet.merges.append(f"A{r}:B{r}")
+    return sheet
+
+
+def _build_config(spec, styles):
+    df, sheet = spec["df"], _Sheet()
+    _header_row(sheet, df, styles.xf(bold=True, color="FFFFFF", fill=CONFIG_FILL, border=True, halign="center"))
+    _data_rows(sheet, df, styles)
+    if len(df):
+        # alternate shading for readability
+        even, odd = styles.dxf("F7F7F7"), styles.dxf("FFFFFF")
+        sheet.add_conditional(f"A2:{_col_letter(max(len(df.columns), 1) - 1)}{len(df) + 1}", [
+            f'<cfRule type="expression" dxfId="{even}" priority="{{priority}}"><formula>MOD(ROW(),2)=0</formula></cfRule>',
+            f'<cfRule type="expression" dxfId="{odd}" priority="{{priority}}"><formula>MOD(ROW(),2)=1</formula></cfRule>',
+        ])
+    return sheet
+
+
+_BUILDERS = {"table": _build_table, "performance": _build_performance, "config": _build_config}
+
+
+# ==============================
+# PUBLIC API
+# ==============================
+
+def write_report(path, sheets):
+    """
+    Write all sheets (list of *_sheet specs) to `path` in one pass.
+    """
+    styles = Styles()
+    built = [(spec["name"], _BUILDERS[spec["kind"]](spec, styles)) for spec in sheets]
+    n = len(built)
+
+    content_types = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/styles.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+        + "".join(f'<Override PartName="/xl/worksheets/sheet{i}.xml" '
+                  f'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+                  for i in range(1, n + 1))
+        + "</Types>")
+    root_rels = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/></Relationships>')
+    workbook = (
+        f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n<workbook xmlns="{_NS}" xmlns:r="{_NS_R}">'
+        '<bookViews><workbookView activeTab="0"/></bookViews><sheets>'
+        + "".join(f'<sheet name="{_esc(name[:31])}" sheetId="{i}" r:id="rId{i}"/>'
+                  for i, (name, _) in enumerate(built, start=1))
+        + "</sheets></workbook>")
+    workbook_rels = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        + "".join(f'<Relationship Id="rId{i}" '
+                  f'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+                  f'Target="worksheets/sheet{i}.xml"/>' for i in range(1, n + 1))
+        + f'<Relationship Id="rId{n + 1}" '
+          'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" '
+          'Target="styles.xml"/></Relationships>')
+
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED, compresslevel=ZIP_LEVEL) as zf:
+        zf.writestr("[Content_Types].xml", content_types)
+        zf.writestr("_rels/.rels", root_rels)
+        zf.writestr("xl/workbook.xml", workbook)
+        zf.writestr("xl/_rels/workbook.xml.rels", workbook_rels)
+        for i, (_, sheet) in enumerate(built, start=1):
+            zf.writestr(f"xl/worksheets/sheet{i}.xml", sheet.to_xml())
+        zf.writestr("xl/styles.xml", styles.to_xml())
+    return path
+
+
+def _slug(name):
+    return name.lower().replace(" ", "_").replace("&", "and")
+
+
+def _records(df):
+    cols = [str(c) for c in df.columns]
+    values = [[_cell_value(v) for v in df[c].tolist()] if df[c].dtype == object
+              else df[c].astype(object).where(df[c].notna(), None).tolist() for c in df.columns]
+    return [dict(zip(cols, row)) for row in zip(*values)]
+
+
+def export_tables(path, frames, names=EXPORT_SHEETS):
+    """
+    Parquet / JSON copies of the named frames next to the workbook:
+    <workbook>.<sheet_slug>.parquet / .json
+
+    Returns:
+        list of written file paths
+    """
+    base = os.path.splitext(path)[0]
+    written = []
+    for name in names:
+        df = frames.get(name)
+        if df is None:
+            continue
+        stem = f"{base}.{_slug(name)}"
+        if HAVE_PARQUET:
+            # mixed object columns (e.g. time / str) are stored as text
+            pq = df.copy()
+            for col in pq.columns[pq.dtypes == object]:
+                pq[col] = [None if _cell_value(v) is None else str(v) for v in pq[col].tolist()]
+            pq.columns = [str(c) for c in pq.columns]
+            pq.to_parquet(stem + ".parquet", index=False)
+            written.append(stem + ".parquet")
+        with open(stem + ".json", "w", encoding="utf-8") as f:
+            json.dump(_records(df), f, ensure_ascii=False, default=str)
+        written.append(stem + ".json")
+    return written
@@ -0,0 +1,259 @@
+"""
+BACKTEST RESULT CACHE
+---------------------
+• Parses each result workbook once per version and keeps it in memory for
+  every api_server endpoint (latest backtest, trades, summary, analytics)
+• Versions are keyed by (path, mtime_ns, size): a rewritten file is a new
+  key and its stale entry is replaced on the next lookup — no polling
+• Sheets are parsed lazily (one pd.read_excel per sheet per version) and
+  each endpoint's ready-to-serialize view is memoized on the entry, so a
+  dashboard poll costs one os.stat + jsonify
+• Bounded LRU (MAX_ENTRIES workbooks) + explicit invalidate(path | all)
+• ColumnarTable: JSON-ready column arrays of a prepared sheet for paged
+  reads — filter keys normalised once, each (filters, sort) selection
+  cached as an index array, so a page costs O(page) not O(file)
+• Hit / miss / parse-time stats for /api/cache/stats
+
+Usage:
+    RESULTS = ResultCache()
+    wb = RESULTS.get("phase-4results/phase4_backtest_x.xlsx")
+    trades = wb.view("trades", lambda: build_records(wb.sheet("Trade Log")))
+    table = wb.view("trades_table", lambda: ColumnarTable(wb.sheet("Trade Log")))
+    rows = table.page(table.select({"symbol": ["INFY"]}, sort="-FinalProfit"), 0, 100)
+"""
+
+import os
+import time
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+# ==============================
+# CONFIG
+# ==============================
+
+MAX_ENTRIES = 8                 # cached workbook versions (LRU)
+MAX_SELECTIONS = 32             # cached (filters, sort) index arrays per table
+
+# Filter field → candidate columns (first present wins)
+FILTER_COLUMNS = {
+    "symbol": ["Stock", "Symbol"],
+    "mode": ["Mode", "Entry Mode"],
+    "exit_reason": ["ExitReason", "Exit Reason"],
+    "date": ["Date"],
+}
+
+
+class QueryError(ValueError):
+    """Bad page / filter / sort request (→ HTTP 400)."""
+
+
+def file_stamp(path):
+    """(mtime_ns, size) of a file — the version half of the cache key."""
+    st = os.stat(path)
+    return st.st_mtime_ns, st.st_size
+
+
+# ==============================
+# CACHED WORKBOOK
+# ==============================
+
+class CachedWorkbook:
+    """One version of a workbook: lazily parsed sheets + memoized views."""
+
+    def __init__(self, path, stamp, stats):
+        self.path = path
+        self.stamp = stamp
+        self.mtime = stamp[0] / 1e9
+        self._stats = stats
+        self._lock = threading.RLock()
+        self._sheet_names = None
+        self._sheets = {}
+        self._views = {}
+
+    @property
+    def filename(self):
+        return os.path.basename(self.path)
+
+    def sheet_names(self):
+        with self._lock:
+            if self._sheet_names is None:
+                with pd.ExcelFile(self.path) as xls:
+                    self._sheet_names = list(xls.sheet_names)
+            return self._sheet_names
+
+    def has_sheet(self, name):
+        return name in self.sheet_names()
+
+    def sheet(self, name=0):
+        """Parsed sheet (name or index) as a DataFrame. Treat as read-only."""
+        with self._lock:
+            df = self._sheets.get(name)
+            if df is None:
+                started = time.perf_counter()
+                df = pd.read_excel(self.path, sheet_name=name)
+                self._stats["sheet_parses"] += 1
+                self._stats["parse_seconds"] += time.perf_counter() - started
+                self._sheets[name] = df
+            return df
+
+    def view(self, key, build):
+        """build() once per workbook version (e.g. JSON-ready records)."""
+        with self._lock:
+            if key not in self._views:
+                self._views[key] = build()
+            else:
+                self._stats["view_hits"] += 1
+            return self._views[key]
+
+
+# ==============================
+# CACHE
+# ==============================
+
+class ResultCache:
+    """Bounded LRU of CachedWorkbook, validated against the file on each get."""
+
+    def __init__(self, max_entries=MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()       # abs path → CachedWorkbook
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0,
+                      "sheet_parses": 0, "parse_seconds": 0.0, "view_hits": 0}
+
+    def get(self, path):
+        """CachedWorkbook for the file's current version (raises if it does not exist)."""
+        key = os.path.abspath(path)
+        stamp = file_stamp(key)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.stamp == stamp:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return entry
+
+            self.stats["misses"] += 1
+            entry = CachedWorkbook(key, stamp, self.stats)
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+            return entry
+
+    def invalidate(self, path=None):
+        """Drop one file's entry (or everything). Returns the number dropped."""
+        with self._lock:
+            if path is None:
+                n = len(self._entries)
+                self._entries.clear()
+            else:
+                n = 1 if self._entries.pop(os.path.abspath(path), None) is not None else 0
+            self.stats["invalidations"] += n
+            return n
+
+    def metrics(self):
+        with self._lock:
+            files = [{"file": e.filename, "sheets": len(e._sheets), "views": len(e._views)}
+                     for e in self._entries.values()]
+        return {**self.stats, "parse_seconds": round(self.stats["parse_seconds"], 3),
+                "entries": len(files), "max_entries": self.max_entries, "files": files}
+
+
+# ==============================
+# COLUMNAR TABLES (PAGINATION)
+# ==============================
+
+class ColumnarTable:
+    """Column arrays of one prepared frame, paged by cached index selections."""
+
+    def __init__(self, df):
+        self.columns = [str(c) for c in df.columns]
+        self.n = len(df)
+        self._cols = {}
+        for name, col in zip(self.columns, df.columns):
+            arr = np.empty(self.n, dtype=object)
+            arr[:] = df[col].tolist()       # python scalars, as to_dict(orient='records')
+            self._cols[name] = arr
+        self._lock = threading.Lock()
+        self._keys = {}                     # filter field → normalised key array
+        self._orders = {}                   # (column, descending) → full sort order
+        self._selections = OrderedDict()    # (filters, sort) → index array
+
+    def has_column(self, name):
+        return name in self._cols
+
+    def filter_column(self, field):
+        """Column backing a filter field, or None if the table has none."""
+        return next((c for c in FILTER_COLUMNS.get(field, []) if c in self._cols), None)
+
+    def _key(self, field):
+        if field not in self._keys:
+            values = pd.Series(self._cols[self.filter_column(field)])
+            if field == "date":
+                parsed = pd.to_datetime(values.astype(str), errors="coerce")
+                key = parsed.dt.strftime("%Y-%m-%d").fillna("").to_numpy(dtype=object)
+            else:
+                key = values.astype(str).str.strip().str.upper().to_numpy(dtype=object)
+            self._keys[field] = key
+        return self._keys[field]
+
+    def _order(self, column, descending):
+        if (column, descending) not in self._orders:
+            values = pd.Series(self._cols[column])
+            numeric = pd.to_numeric(values, errors="coerce")
+            # Numeric when every non-blank value parses, text otherwise
+            blank = values.isna() | (values.astype(str) == "")
+            key = numeric if numeric.notna().sum() == (~blank).sum() else values.astype(str).where(~blank)
+            order = key.sort_values(ascending=not descending, kind="mergesort", na_position="last").index
+            self._orders[(column, descending)] = order.to_numpy(dtype=np.int64)
+        return self._orders[(column, descending)]
+
+    def select(self, filters=None, sort=None):
+        """
+        Row indexes matching filters, in sort order (cached per combination).
+
+        Args:
+            filters: {"symbol" | "mode" | "exit_reason": [values]} (case-
+                     insensitive), {"date_from" | "date_to": "YYYY-MM-DD"}
+            sort: column name, "-column" for descending
+        """
+        filters = {k: v for k, v in (filters or {}).items() if v}
+        cache_key = (tuple(sorted((k, tuple(v) if isinstance(v, list) else v) for k, v in filters.items())), sort)
+        with self._lock:
+            sel = self._selections.get(cache_key)
+            if sel is not None:
+                self._selections.move_to_end(cache_key)
+                return sel
+
+            mask = np.ones(self.n, dtype=bool)
+            for field, wanted in filters.items():
+                if self.filter_column("date" if field in ("date_from", "date_to") else field) is None:
+                    raise QueryError(f"❌ Filter '{field}' not supported for this table")
+                if field in ("date_from", "date_to"):
+                    key = self._key("date")
+                    mask &= (key >= wanted) if field == "date_from" else ((key <= wanted) & (key != ""))
+                else:
+                    mask &= np.isin(self._key(field), [str(w).strip().upper() for w in wanted])
+
+            if sort and sort.lstrip("-") not in self._cols:
+                raise QueryError(f"❌ Unknown sort column: {sort.lstrip('-')}")
+            if sort:
+                order = self._order(sort.lstrip("-"), sort.startswith("-"))
+                sel = order[mask[order]]
+            else:
+                sel = np.flatnonzero(mask)
+
+            self._selections[cache_key] = sel
+            while len(self._selections) > MAX_SELECTIONS:
+                self._selections.popitem(last=False)
+            return sel
+
+    def page(self, index, offset=0, limit=None, columns=None):
+        """Records for index[offset:offset + limit], projected onto columns."""
+        rows = index[offset:] if limit is None else index[offset:offset + limit]
+        columns = columns or self.columns
+        values = [self._cols[c][rows].tolist() for c in columns]
+        return [dict(zip(columns, row)) for row in zip(*values)]
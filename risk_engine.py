@@ -0,0 +1,330 @@
+"""
+BACKTEST RISK ENGINE (BOOTSTRAP / MONTE CARLO)
+----------------------------------------------
+• Works from a Phase-4 Trade Log (Date + FinalProfit per trade)
+• Block bootstrap by day: resamples blocks of consecutive trading days
+  with replacement → distribution of final P&L and max drawdown
+• Trade-order permutation: same trades, shuffled order → how much of the
+  realised drawdown was sequencing luck
+• Risk of ruin: share of paths whose equity falls RUIN_BUDGETS daily loss
+  budgets (C_PER_DAY × L_PCT) below the starting capital
+• Confidence intervals on total / per-day P&L
+• 10k+ paths vectorized in NumPy, chunked to keep memory flat
+• Writes 'Risk Analysis' + 'Drawdown Distribution' sheets next to the
+  existing Phase-4 sheets (also usable standalone on an existing workbook)
+"""
+
+import os
+import sys
+import glob
+import numpy as np
+import pandas as pd
+
+# ==============================
+# CONFIG
+# ==============================
+
+PHASE4_DIR = "phase-4results"
+N_PATHS = 10000
+BLOCK_DAYS = 3                  # consecutive days per bootstrap block
+CHUNK_PATHS = 1000              # paths simulated per vectorized chunk
+CONFIDENCE = 0.90               # two-sided CI width
+RUIN_BUDGETS = 5                # ruin = losing this many daily loss budgets
+SEED = 42
+PERCENTILES = [1, 5, 10, 25, 50, 75, 90, 95, 99]
+
+RISK_SHEET = "Risk Analysis"
+DISTRIBUTION_SHEET = "Drawdown Distribution"
+RISK_COLUMNS = ["Method", "Metric", "Value", "CI_Low", "CI_High"]
+
+
+# ==============================
+# INPUTS
+# ==============================
+
+def trade_pnl(trade_log_df, pnl_col="FinalProfit"):
+    """Trade Log → per-trade P&L array in log order."""
+    if len(trade_log_df) == 0 or pnl_col not in trade_log_df.columns:
+        return np.zeros(0)
+    return pd.to_numeric(trade_log_df[pnl_col], errors="coerce").fillna(0.0).to_numpy(dtype=np.float64)
+
+
+def daily_pnl(trade_log_df, pnl_col="FinalProfit", date_col="Date"):
+    """Trade Log → per-day P&L array in date order."""
+    if len(trade_log_df) == 0 or pnl_col not in trade_log_df.columns:
+        return np.zeros(0)
+    pnl = pd.to_numeric(trade_log_df[pnl_col], errors="coerce").fillna(0.0)
+    return pnl.groupby(trade_log_df[date_col].astype(str)).sum().sort_index().to_numpy(dtype=np.float64)
+
+
+# ==============================
+# PATH STATISTICS
+# ==============================
+
+def path_stats(pnl_paths, ruin_level):
+    """
+    Per-path final P&L, max drawdown and ruin flag.
+
+    Args:
+        pnl_paths: (paths, steps) P&L per step
+        ruin_level: equity loss (positive ₹) that counts as ruin
+
+    Returns:
+        final, max_dd, ruined arrays (length paths)
+    """
+    equity = np.cumsum(pnl_paths, axis=1)
+    # peak starts at the initial capital (equity 0)
+    peak = np.maximum(equity, 0.0)
+    np.maximum.accumulate(peak, axis=1, out=peak)
+    max_dd = np.subtract(peak, equity, out=peak).max(axis=1)
+    ruined = equity.min(axis=1) <= -ruin_level
+    return equity[:, -1], max_dd, ruined
+
+
+def realised_stats(pnl, ruin_level):
+    """Path statistics of the actual (historical) sequence."""
+    final, max_dd, ruined = path_stats(pnl[None, :], ruin_level)
+    return final[0], max_dd[0], bool(ruined[0])
+
+
+# ==============================
+# SIMULATORS
+# ==============================
+
+def _check_paths(n_paths):
+    if n_paths < 1:
+        raise ValueError(f"❌ n_paths must be at least 1, got {n_paths}")
+    return n_paths
+
+
+def _chunks(n_paths, chunk):
+    for lo in range(0, n_paths, chunk):
+        yield min(chunk, n_paths - lo)
+
+
+def block_bootstrap(daily, n_paths=None, block_days=None, ruin_level=np.inf, seed=None, chunk=None):
+    """
+    Moving-block bootstrap over daily P&L.
+
+    Each path is built from random blocks of block_days consecutive days
+    (wrapping around the end) until it has as many days as the backtest.
+
+    Returns:
+        dict final, max_dd, ruined, mean_day arrays (length n_paths)
+    """
+    n_paths = _check_paths(N_PATHS if n_paths is None else n_paths)
+    block_days = BLOCK_DAYS if block_days is None else block_days
+    chunk = CHUNK_PATHS if chunk is None else chunk
+    rng = np.random.default_rng(SEED if seed is None else seed)
+
+    n = len(daily)
+    block = max(1, min(block_days, n))
+    n_blocks = -(-n // block)
+    offsets = np.arange(block)
+
+    out = {k: [] for k in ("final", "max_dd", "ruined", "mean_day")}
+    for size in _chunks(n_paths, chunk):
+        starts = rng.integers(0, n, size=(size, n_blocks))
+        idx = ((starts[:, :, None] + offsets) % n).reshape(size, -1)[:, :n]
+        paths = daily[idx]
+        final, max_dd, ruined = path_stats(paths, ruin_level)
+        out["final"].append(final)
+        out["max_dd"].append(max_dd)
+        out["ruined"].append(ruined)
+        out["mean_day"].append(final / n)
+    return {k: np.concatenate(v) for k, v in out.items()}
+
+
+def permute_trades(pnl, n_paths=None, ruin_level=np.inf, seed=None, chunk=None):
+    """
+    Random trade-order permutations (final P&L is fixed; drawdown is not).
+
+    Returns:
+        dict final, max_dd, ruined arrays (length n_paths)
+    """
+    n_paths = _check_paths(N_PATHS if n_paths is None else n_paths)
+    chunk = CHUNK_PATHS if chunk is None else chunk
+    rng = np.random.default_rng((SEED if seed is None else seed) + 1)
+
+    out = {k: [] for k in ("final", "max_dd", "ruined")}
+    for size in _chunks(n_paths, chunk):
+        paths = rng.permuted(np.broadcast_to(pnl, (size, len(pnl))), axis=1)
+        final, max_dd, ruined = path_stats(paths, ruin_level)
+        out["final"].append(final)
+        out["max_dd"].append(max_dd)
+        out["ruined"].append(ruined)
+    return {k: np.concatenate(v) for k, v in out.items()}
+
+
+# ==============================
+# ANALYSIS
+# ==============================
+
+def _ci(values, confidence):
+    tail = (1.0 - confidence) / 2.0 * 100.0
+    return np.percentile(values, tail), np.percentile(values, 100.0 - tail)
+
+
+def analyze(trade_log_df, c_per_day, l_pct, n_paths=None, block_days=None,
+            confidence=None, ruin_budgets=None, seed=None):
+    """
+    Bootstrap + permutation risk analysis of a Phase-4 Trade Log.
+
+    Args:
+        trade_log_df: Trade Log frame (Date, FinalProfit)
+        c_per_day: capital per day (₹)
+        l_pct: daily loss budget as a fraction of c_per_day
+
+    Returns:
+        (risk_df, distribution_df) — both empty when there are no trades
+    """
+    n_paths = _check_paths(N_PATHS if n_paths is None else n_paths)
+    block_days = BLOCK_DAYS if block_days is None else block_days
+    confidence = CONFIDENCE if confidence is None else confidence
+    ruin_budgets = RUIN_BUDGETS if ruin_budgets is None else ruin_budgets
+
+    pnl = trade_pnl(trade_log_df)
+    daily = daily_pnl(trade_log_df)
+    if len(pnl) == 0 or len(daily) == 0:
+        return pd.DataFrame(columns=RISK_COLUMNS), pd.DataFrame()
+
+    loss_budget = float(c_per_day) * float(l_pct)
+    ruin_level = ruin_budgets * loss_budget
+
+    boot = block_bootstrap(daily, n_paths, block_days, ruin_level, seed)
+    perm = permute_trades(pnl, n_paths, ruin_level, seed)
+    hist_final, hist_dd, hist_ruined = realised_stats(daily, ruin_level)
+    _, hist_trade_dd, _ = realised_stats(pnl, ruin_level)
+
+    ci_label = f"{confidence*100:.0f}%"
+    rows = [
+        ["Inputs", "Trades", len(pnl), None, None],
+        ["Inputs", "Trading Days", len(daily), None, None],
+        ["Inputs", "Paths", n_paths, None, None],
+        ["Inputs", "Block Days", block_days, None, None],
+        ["Inputs", "CI Level", ci_label, None, None],
+        ["Inputs", "Daily Loss Budget (C_PER_DAY×L_PCT)", round(loss_budget, 2), None, None],
+        ["Inputs", "Ruin Level (equity loss)", round(ruin_level, 2), None, None],
+        ["Historical", "Net P&L", round(hist_final, 2), None, None],
+        ["Historical", "Max Drawdown (daily)", round(hist_dd, 2), None, None],
+        ["Historical", "Max Drawdown (trade order)", round(hist_trade_dd, 2), None, None],
+        ["Historical", "Days Breaching Daily Loss Budget", int((daily < -loss_budget).sum()), None, None],
+        ["Historical", "Ruined", "YES" if hist_ruined else "NO", None, None],
+    ]
+
+    for metric, values in (("Net P&L", boot["final"]),
+                           ("Mean Daily P&L", boot["mean_day"]),
+                           ("Max Drawdown", boot["max_dd"])):
+        lo, hi = _ci(values, confidence)
+        rows.append(["Block Bootstrap", metric, round(float(np.median(values)), 2), round(lo, 2), round(hi, 2)])
+    rows.append(["Block Bootstrap", "P(Net P&L < 0)", round(float((boot["final"] < 0).mean()), 4), None, None])
+    rows.append(["Block Bootstrap", "Risk of Ruin", round(float(boot["ruined"].mean()), 4), None, None])
+
+    lo, hi = _ci(perm["max_dd"], confidence)
+    rows.append(["Trade Permutation", "Max Drawdown", round(float(np.median(perm["max_dd"])), 2), round(lo, 2), round(hi, 2)])
+    rows.append(["Trade Permutation", "P(Max DD > Historical)",
+                 round(float((perm["max_dd"] > hist_trade_dd).mean()), 4), None, None])
+    rows.append(["Trade Permutation", "Risk of Ruin", round(float(perm["ruined"].mean()), 4), None, None])
+
+    risk_df = pd.DataFrame(rows, columns=RISK_COLUMNS)
+
+    distribution_df = pd.DataFrame({
+        "Percentile": PERCENTILES,
+        "Bootstrap Net P&L": np.round(np.percentile(boot["final"], PERCENTILES), 2),
+        "Bootstrap Max DD": np.round(np.percentile(boot["max_dd"], PERCENTILES), 2),
+        "Permutation Max DD": np.round(np.percentile(perm["max_dd"], PERCENTILES), 2),
+    })
+    return risk_df, distribution_df
+
+
+def write_sheets(writer, risk_df, distribution_df):
+    """Add the risk sheets to an open pd.ExcelWriter (skipped when empty)."""
+    if len(risk_df) == 0:
+        return
+    risk_df.to_excel(writer, sheet_name=RISK_SHEET, index=False)
+    distribution_df.to_excel(writer, sheet_name=DISTRIBUTION_SHEET, index=False)
+
+
+def report_sheets(risk_df, distribution_df):
+    """report_writer sheet specs for the risk sheets (none when empty)."""
+    import report_writer
+    if len(risk_df) == 0:
+        return []
+    return [report_writer.table_sheet(RISK_SHEET, risk_df, report_writer.RISK_FILL),
+            report_writer.table_sheet(DISTRIBUTION_SHEET, distribution_df, report_writer.RISK_FILL)]
+
+
+def records(risk_df, distribution_df):
+    """JSON-friendly form of the risk sheets (NaN → None)."""
+    return {
+        "risk": risk_df.astype(object).where(risk_df.notna(), None).to_dict(orient="records"),
+        "distribution": distribution_df.to_dict(orient="records"),
+    }
+
+
+# ==============================
+# WORKBOOK HELPERS
+# ==============================
+
+def latest_workbook(directory=PHASE4_DIR):
+    files = glob.glob(os.path.join(directory, "phase4_backtest_*.xlsx"))
+    return max(files, key=os.path.getmtime) if files else None
+
+
+def read_sheets(path):
+    """Stored risk sheets of a workbook, or None if it predates the engine."""
+    sheets = pd.ExcelFile(path).sheet_names
+    if RISK_SHEET not in sheets:
+        return None
+    risk_df = pd.read_excel(path, sheet_name=RISK_SHEET)
+    distribution_df = (pd.read_excel(path, sheet_name=DISTRIBUTION_SHEET)
+                       if DISTRIBUTION_SHEET in sheets else pd.DataFrame())
+    return risk_df, distribution_df
+
+
+def analyze_workbook(path, c_per_day, l_pct, **kwargs):
+    """Run the analysis on a saved workbook's Trade Log."""
+    trade_log_df = pd.read_excel(path, sheet_name="Trade Log")
+    return analyze(trade_log_df, c_per_day, l_pct, **kwargs)
+
+
+# ==============================
+# MAIN
+# ==============================
+
+def main():
+    import time
+    import config_manager
+    import openpyxl
+
+    path = sys.argv[1] if len(sys.argv) > 1 else latest_workbook()
+    if not path or not os.path.exists(path):
+        print("❌ No Phase-4 workbook found")
+        return
+
+    p4 = config_manager.get_phase_config("phase4")
+    c_per_day = p4.get("C_PER_DAY", 1000000)
+    l_pct = p4.get("L_PCT", 0.02)
+
+    print(f"🎲 Risk analysis: {path} ({N_PATHS:,} paths, block {BLOCK_DAYS}d)")
+    t0 = time.time()
+    risk_df, distribution_df = analyze_workbook(path, c_per_day, l_pct)
+    print(f"⏱️ Simulated in {time.time() - t0:.2f}s")
+    if len(risk_df) == 0:
+        print("⚠️ Trade Log is empty — nothing to analyze")
+        return
+
+    wb = openpyxl.load_workbook(path)
+    for name in (RISK_SHEET, DISTRIBUTION_SHEET):
+        if name in wb.sheetnames:
+            del wb[name]
+    wb.save(path)
+    with pd.ExcelWriter(path, engine="openpyxl", mode="a") as writer:
+        write_sheets(writer, risk_df, distribution_df)
+
+    print(risk_df.to_string(index=False))
+    print(f"📄 Sheets '{RISK_SHEET}' / '{DISTRIBUTION_SHEET}' written to: {path}")
+
+
+if __name__ == "__main__":
+    main()
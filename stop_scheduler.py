@@ -0,0 +1,122 @@
+"""
+TRAILING-STOP UPDATE SCHEDULER
+------------------------------
+• Coalesces stop changes per order (only the highest pending stop is kept)
+• Minimum move filter: absolute tick and/or % of the last sent stop
+• Per-order rate limit (min seconds between modifies)
+• One batch per engine cycle via due()
+• Counts how many broker modify calls were saved: proposals coalesced into
+  a pending stop or skipped (not above the last sent stop, or the order
+  closed first); failed modifies are counted separately, never as saved
+"""
+
+import time
+import threading
+
+# ==============================
+# CONFIG
+# ==============================
+
+MIN_TICK = 0.05          # NSE tick size
+MIN_PCT = 0.0005         # 0.05% of the last sent stop
+MIN_INTERVAL_SECONDS = 3.0
+
+
+class StopUpdateScheduler:
+    """Pending stop moves per order, released in rate-limited batches."""
+
+    def __init__(self, min_tick=MIN_TICK, min_pct=MIN_PCT, min_interval=MIN_INTERVAL_SECONDS):
+        self.min_tick = min_tick
+        self.min_pct = min_pct
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+
+        self._pending = {}      # order_id → highest proposed stop
+        self._last_stop = {}    # order_id → last stop sent to the broker
+        self._last_sent = {}    # order_id → time.monotonic() of last send
+
+        self.stats = {"proposed": 0, "sent": 0, "coalesced": 0, "skipped": 0, "failed": 0}
+
+    def track(self, order_id, current_stop):
+        """Start tracking an order at the stop the broker already has."""
+        with self._lock:
+            self._last_stop[order_id] = current_stop
+            self._last_sent.setdefault(order_id, 0.0)
+
+    def forget(self, order_id):
+        with self._lock:
+            if self._pending.pop(order_id, None) is not None:
+                self.stats["skipped"] += 1
+            self._last_stop.pop(order_id, None)
+            self._last_sent.pop(order_id, None)
+
+    def pending_stop(self, order_id):
+        return self._pending.get(order_id)
+
+    def propose(self, order_id, new_stop):
+        """Record a candidate stop; later, higher proposals replace it."""
+        with self._lock:
+            self.stats["proposed"] += 1
+            if new_stop <= self._last_stop.get(order_id, float("-inf")):
+                self.stats["skipped"] += 1
+                return
+            pending = self._pending.get(order_id)
+            if pending is not None:
+                # One pending slot → at most one modify for both proposals
+                self.stats["coalesced"] += 1
+            if pending is None or new_stop > pending:
+                self._pending[order_id] = new_stop
+
+    def _big_enough(self, order_id, stop):
+        last = self._last_stop.get(order_id)
+        if last is None:
+            return True
+        move = stop - last
+        return move >= self.min_tick and move >= last * self.min_pct
+
+    def due(self, now=None):
+        """
+        Pop the batch of (order_id, stop) to send this cycle.
+
+        Moves below the minimum stay pending (they may grow past it); orders
+        inside their rate-limit window wait for a later cycle.
+        """
+        now = time.monotonic() if now is None else now
+        batch = []
+        with self._lock:
+            for order_id, stop in list(self._pending.items()):
+                if now - self._last_sent.get(order_id, 0.0) < self.min_interval:
+                    continue
+                if not self._big_enough(order_id, stop):
+                    continue
+                batch.append((order_id, stop))
+                del self._pending[order_id]
+                self._last_sent[order_id] = now
+        return batch
+
+    def confirm(self, order_id, stop):
+        """Broker accepted the modify."""
+        with self._lock:
+            self.stats["sent"] += 1
+            if order_id in self._last_stop:
+                self._last_stop[order_id] = stop
+
+    def retry(self, order_id, stop):
+        """Modify failed → put the stop back for the next cycle."""
+        with self._lock:
+            self.stats["failed"] += 1
+            if order_id in self._last_stop and stop > self._pending.get(order_id, float("-inf")):
+                self._pending[order_id] = stop
+
+    def report(self):
+        s = dict(self.stats)
+        s["saved"] = s["coalesced"] + s["skipped"]
+        s["pending"] = len(self._pending)
+        return s
+
+    def format(self):
+        r = self.report()
+        return (
+            f"🧮 Stop updates: proposed={r['proposed']} sent={r['sent']} failed={r['failed']} "
+            f"saved={r['saved']} (coalesced={r['coalesced']} skipped={r['skipped']}) pending={r['pending']}"
+        )
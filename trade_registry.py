@@ -0,0 +1,237 @@
+"""
+LIVE TRADE REGISTRY
+-------------------
+• Single owner of live execution state (replaces bare module globals)
+• O(1) lookups by order_id, symbol and instrument token
+• Atomic transitions under one lock: claim → open → stop updates → close
+• Embedded SQLite journal (WAL) → open trades and signal dedupe keys
+  survive a crash / restart
+"""
+
+import os
+import sqlite3
+import threading
+from datetime import datetime, date
+
+# ==============================
+# CONFIG
+# ==============================
+
+DB_FILE = "live_state/trades.db"
+
+STATUS_OPEN = "OPEN"
+STATUS_CLOSED = "CLOSED"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS trades (
+    order_id      TEXT PRIMARY KEY,
+    symbol        TEXT NOT NULL,
+    token         INTEGER,
+    qty           INTEGER NOT NULL,
+    entry         REAL NOT NULL,
+    initial_stop  REAL NOT NULL,
+    current_stop  REAL NOT NULL,
+    target        REAL NOT NULL,
+    highest_price REAL NOT NULL,
+    open_time     TEXT NOT NULL,
+    status        TEXT NOT NULL,
+    close_time    TEXT,
+    close_reason  TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_trades_status ON trades(status);
+CREATE TABLE IF NOT EXISTS seen_signals (
+    key        TEXT PRIMARY KEY,
+    trade_date TEXT NOT NULL
+);
+"""
+
+
+# ==============================
+# TRADE STATE MODEL
+# ==============================
+
+class TradeState:
+    def __init__(self, order_id, symbol, token, qty, entry, stop, target):
+        self.order_id = order_id
+        self.symbol = symbol
+        self.token = token
+        self.qty = qty
+
+        self.entry = entry
+        self.initial_stop = stop
+        self.current_stop = stop
+        self.target = target
+
+        self.highest_price = entry
+        self.open_time = datetime.now()
+        self.closed = False
+
+
+def signal_key(symbol, mode, day):
+    """Dedupe key for a Phase-3 signal (one per symbol / mode / day)."""
+    return f"{symbol}|{mode}|{day.isoformat()}"
+
+
+class TradeRegistry:
+    """Thread-safe, indexed, journaled set of live trades."""
+
+    def __init__(self, db_path=DB_FILE):
+        self.db_path = db_path
+        self._lock = threading.RLock()
+
+        self._by_order = {}     # order_id → TradeState
+        self._by_symbol = {}    # symbol → order_id
+        self._by_token = {}     # token → order_id
+        self._reserved = set()  # symbols with an order in flight
+        self._seen = set()      # signal dedupe keys
+
+        if db_path != ":memory:":
+            os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+
+        self._restore()
+
+    # ------------------------------
+    # RESTORE
+    # ------------------------------
+
+    def _restore(self):
+        today = date.today().isoformat()
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT order_id, symbol, token, qty, entry, initial_stop, current_stop, "
+                "target, highest_price, open_time FROM trades WHERE status = ?",
+                (STATUS_OPEN,),
+            ).fetchall()
+            for (order_id, symbol, token, qty, entry, initial_stop,
+                 current_stop, target, highest, open_time) in rows:
+                trade = TradeState(order_id, symbol, token, qty, entry, initial_stop, target)
+                trade.current_stop = current_stop
+                trade.highest_price = highest
+                trade.open_time = datetime.fromisoformat(open_time)
+                self._index(trade)
+
+            # Dedupe keys are per day → older ones are dead weight
+            self._db.execute("DELETE FROM seen_signals WHERE trade_date < ?", (today,))
+            self._seen = {k for (k,) in self._db.execute("SELECT key FROM seen_signals")}
+
+        if rows or self._seen:
+            print(f"♻️ Trade registry restored: {len(rows)} open trades, {len(self._seen)} seen signals")
+
+    def _index(self, trade):
+        self._by_order[trade.order_id] = trade
+        self._by_symbol[trade.symbol] = trade.order_id
+        if trade.token is not None:
+            self._by_token[trade.token] = trade.order_id
+
+    # ------------------------------
+    # TRANSITIONS
+    # ------------------------------
+
+    def claim(self, symbol, mode, day):
+        """
+        Atomically dedupe a signal and reserve its symbol.
+
+        Returns:
+            None if claimed, else the rejection reason ("DUPLICATE" / "ACTIVE")
+        """
+        key = signal_key(symbol, mode, day)
+        with self._lock:
+            if key in self._seen:
+                return "DUPLICATE"
+            self._seen.add(key)
+            self._db.execute(
+                "INSERT OR IGNORE INTO seen_signals (key, trade_date) VALUES (?, ?)",
+                (key, day.isoformat()),
+            )
+            if symbol in self._by_symbol or symbol in self._reserved:
+                return "ACTIVE"
+            self._reserved.add(symbol)
+            return None
+
+    def release(self, symbol):
+        """Drop a reservation whose order was never placed."""
+        with self._lock:
+            self._reserved.discard(symbol)
+
+    def open(self, trade):
+        """Register a placed order (consumes the symbol reservation)."""
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO trades (order_id, symbol, token, qty, entry, initial_stop, "
+                "current_stop, target, highest_price, open_time, status) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (trade.order_id, trade.symbol, trade.token, trade.qty, trade.entry, trade.initial_stop,
+                 trade.current_stop, trade.target, trade.highest_price,
+                 trade.open_time.isoformat(), STATUS_OPEN),
+            )
+            self._reserved.discard(trade.symbol)
+            self._index(trade)
+
+    def update_stop(self, order_id, new_stop):
+        """Persist a confirmed stop move (and the high that produced it)."""
+        with self._lock:
+            trade = self._by_order.get(order_id)
+            if trade is None:
+                return False
+            trade.current_stop = new_stop
+            self._db.execute(
+                "UPDATE trades SET current_stop = ?, highest_price = ? WHERE order_id = ?",
+                (new_stop, trade.highest_price, order_id),
+            )
+            return True
+
+    def close(self, order_id, reason="EXITED"):
+        """Mark a trade closed and drop it from every index. Returns the trade or None."""
+        with self._lock:
+            trade = self._by_order.pop(order_id, None)
+            if trade is None:
+                return None
+            trade.closed = True
+            if self._by_symbol.get(trade.symbol) == order_id:
+                del self._by_symbol[trade.symbol]
+            if trade.token is not None and self._by_token.get(trade.token) == order_id:
+                del self._by_token[trade.token]
+            self._db.execute(
+                "UPDATE trades SET status = ?, close_time = ?, close_reason = ? WHERE order_id = ?",
+                (STATUS_CLOSED, datetime.now().isoformat(), reason, order_id),
+            )
+            return trade
+
+    # ------------------------------
+    # LOOKUPS
+    # ------------------------------
+
+    def get(self, order_id):
+        return self._by_order.get(order_id)
+
+    def for_symbol(self, symbol):
+        order_id = self._by_symbol.get(symbol)
+        return None if order_id is None else self._by_order.get(order_id)
+
+    def for_token(self, token):
+        order_id = self._by_token.get(token)
+        return None if order_id is None else self._by_order.get(order_id)
+
+    def is_active(self, symbol):
+        return symbol in self._by_symbol or symbol in self._reserved
+
+    def open_trades(self):
+        """Snapshot list of open trades (safe to iterate while others mutate)."""
+        with self._lock:
+            return list(self._by_order.values())
+
+    def tokens(self):
+        with self._lock:
+            return list(self._by_token.keys())
+
+    def __len__(self):
+        return len(self._by_order)
+
+    def checkpoint(self):
+        """Fold the WAL back into the main database file (call on clean shutdown)."""
+        with self._lock:
+            self._db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
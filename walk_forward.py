@@ -0,0 +1,301 @@
+"""
+WALK-FORWARD OPTIMIZATION
+-------------------------
+• Rolling in-sample / out-of-sample windows over the Phase-2 trading days
+• Optimizes selected config keys in-sample:
+    phase3.* — ATR_MULTIPLIER, RISK_REWARD_RATIO, mode thresholds
+               (entries from the threshold sensitivity engine)
+    phase4.* — any param_sweep key (L_PCT, C_PCT, FORCE_EXIT_TIME, tiers, ...)
+• Indicators, Phase-3 entries and 5-minute bars are loaded ONCE in the
+  parent and shared with a process pool; windows run in parallel
+• Out-of-sample days of every window stitched into one equity curve
+• Report: phase-4results/walk_forward_<ts>.xlsx
+    Windows      — chosen parameters + IS / OOS metrics per window
+    Equity Curve — combined out-of-sample daily P&L, equity, drawdown
+    Summary      — combined OOS result and parameter stability
+
+Phase-1/2 screens are taken as-is from phase-2results (their inputs are not
+cached per day, so their keys are not optimized here).
+
+Usage:
+    python walk_forward.py [grid.json]
+    grid.json = {"phase3.ATR_MULTIPLIER": [1.0, 1.25], "phase4.L_PCT": [0.01, 0.02]}
+"""
+
+import os
+import sys
+import json
+import time as _time
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+import param_sweep
+import phase3_sensitivity
+
+# ==============================
+# CONFIG
+# ==============================
+
+IS_DAYS = 40                # in-sample trading days per window
+OOS_DAYS = 10               # out-of-sample trading days per window
+STEP_DAYS = None            # window step (None → OOS_DAYS, non-overlapping OOS)
+OBJECTIVE = "net_pnl"       # "net_pnl" or "pnl_to_dd" (net P&L / max drawdown)
+WORKERS = param_sweep.WORKERS
+OUTPUT_DIR = "phase-4results"
+
+DEFAULT_GRID = {
+    "phase3.ATR_MULTIPLIER": [1.0, 1.25, 1.5],
+    "phase3.RISK_REWARD_RATIO": [1.5, 2.0, 2.5],
+    "phase4.L_PCT": [0.01, 0.02, 0.03],
+    "phase4.C_PCT": [0.30, 0.50],
+}
+
+
+# ==============================
+# DATA (LOADED ONCE)
+# ==============================
+
+def split_grid(grid):
+    """{"phase3.X": [...], "phase4.Y": [...]} → (phase-3 grid, phase-4 grid)."""
+    grid3, grid4 = {}, {}
+    for key, values in grid.items():
+        phase, _, name = key.partition(".")
+        if phase == "phase3" and name in phase3_sensitivity.BASE_THRESHOLDS:
+            grid3[name] = values
+        elif phase == "phase4" and name in param_sweep.BASE_PARAMS:
+            grid4[name] = values
+        else:
+            raise ValueError(f"❌ Unsupported walk-forward key: {key}")
+    return grid3, grid4
+
+
+def load_walk_forward_data(grid):
+    """
+    Indicators → Phase-3 entries for every phase-3 combo → one packed bar
+    set for all of them.
+    """
+    grid3, grid4 = split_grid(grid)
+    if not grid3:
+        grid3 = {"ATR_MULTIPLIER": [phase3_sensitivity.BASE_THRESHOLDS["ATR_MULTIPLIER"]]}
+
+    prep = phase3_sensitivity.prepare(phase3_sensitivity.load_indicators())
+    summary3, entries3 = phase3_sensitivity.run(grid3, data=prep)
+    sweep = param_sweep.load_sweep_data(entries=entries3)
+
+    combos = entries3["combo"].to_numpy()
+    p4 = param_sweep.expand_grid(grid4)
+    p4_groups = {}
+    for i, params in enumerate(p4):
+        p4_groups.setdefault(tuple(params[k] for k in param_sweep.SIM_KEYS), []).append(i)
+
+    return {
+        "sweep": sweep,
+        "day_dates": pd.to_datetime(sweep["days"]).values if len(sweep["days"]) else np.zeros(0, dtype="datetime64[ns]"),
+        "dates": np.sort(pd.to_datetime(pd.Series(prep["df"]["Date"]).unique()).values) if prep["n"] else np.zeros(0, dtype="datetime64[ns]"),
+        "trade_idx": {int(c): np.flatnonzero(combos == c) for c in summary3["combo"]},
+        "p3": summary3.set_index("combo")[list(grid3)].to_dict(orient="index"),
+        "p3_keys": list(grid3),
+        "p4": p4,
+        "p4_keys": list(grid4),
+        "p4_groups": list(p4_groups.values()),
+    }
+
+
+def build_windows(dates, is_days=IS_DAYS, oos_days=OOS_DAYS, step=STEP_DAYS):
+    """Rolling windows as date bounds (IS always full, last OOS may be short)."""
+    step = step or oos_days
+    windows = []
+    i = 0
+    while i + is_days < len(dates):
+        oos_end = min(i + is_days + oos_days, len(dates)) - 1
+        windows.append({
+            "window": len(windows) + 1,
+            "is_start": dates[i], "is_end": dates[i + is_days - 1],
+            "oos_start": dates[i + is_days], "oos_end": dates[oos_end],
+        })
+        i += step
+    return windows
+
+
+# ==============================
+# WINDOW EVALUATION
+# ==============================
+
+def evaluate_range(wf, combo, p4_indexes, lo, hi):
+    """
+    Daily net P&L (over all sweep days) per phase-4 config for one phase-3
+    combo, using only trades dated in [lo, hi].
+
+    Returns:
+        {p4 index: (daily, trades, wins)}
+    """
+    sweep = wf["sweep"]
+    sub = param_sweep.subset(sweep, wf["trade_idx"][combo])
+    dated = wf["day_dates"][np.maximum(sub["day"], 0)] if len(sub["day"]) else np.zeros(0, dtype="datetime64[ns]")
+    trades = np.flatnonzero((sub["day"] >= 0) & (dated >= lo) & (dated <= hi))
+
+    wanted = set(p4_indexes)
+    out = {}
+    for group in wf["p4_groups"]:
+        group = [i for i in group if i in wanted]
+        if not group:
+            continue
+        exit_price = param_sweep.simulate(sub, wf["p4"][group[0]], trades)
+        for i in group:
+            params = wf["p4"][i]
+            qty = param_sweep.allocate(sub, params)
+            gross, costs = param_sweep.trade_pnl(sub, params, qty, trades, exit_price)
+            final = gross - costs
+            traded = qty[trades] > 0
+            daily = np.bincount(sub["day"][trades][traded], weights=final[traded], minlength=sweep["n_days"])
+            out[i] = (daily, int(traded.sum()), int((final[traded] > 0).sum()))
+    return out
+
+
+def range_stats(wf, daily, lo, hi):
+    in_range = (wf["day_dates"] >= lo) & (wf["day_dates"] <= hi)
+    pnl = daily[in_range]
+    return float(pnl.sum()), param_sweep.max_drawdown(pnl)
+
+
+def score(net, dd):
+    if OBJECTIVE == "pnl_to_dd":
+        return net / max(dd, 1.0)
+    return net
+
+
+def run_window(wf, window):
+    """Optimize on the window's IS days, then trade the winner on its OOS days."""
+    best = None
+    for combo in wf["trade_idx"]:
+        for i, (daily, trades, wins) in evaluate_range(wf, combo, range(len(wf["p4"])),
+                                                       window["is_start"], window["is_end"]).items():
+            net, dd = range_stats(wf, daily, window["is_start"], window["is_end"])
+            s = score(net, dd)
+            if best is None or s > best[0]:
+                best = (s, combo, i, net, dd, trades)
+
+    row = {k: (pd.Timestamp(v).date() if k != "window" else v) for k, v in window.items()}
+    if best is None:
+        return row, []
+    _, combo, i, is_net, is_dd, is_trades = best
+
+    daily, trades, wins = evaluate_range(wf, combo, [i], window["oos_start"], window["oos_end"])[i]
+    oos_net, oos_dd = range_stats(wf, daily, window["oos_start"], window["oos_end"])
+
+    row.update({f"phase3.{k}": v for k, v in wf["p3"][combo].items()})
+    row.update({f"phase4.{k}": wf["p4"][i][k] for k in wf["p4_keys"]})
+    row.update({
+        "is_net_pnl": round(is_net, 2), "is_max_drawdown": round(is_dd, 2), "is_trades": is_trades,
+        "oos_net_pnl": round(oos_net, 2), "oos_max_drawdown": round(oos_dd, 2), "oos_trades": trades,
+        "oos_win_rate": round(wins / trades * 100.0, 2) if trades else 0.0,
+    })
+
+    # OOS daily series on the full trading calendar (days without trades → 0)
+    by_day = dict(zip(wf["day_dates"], daily))
+    oos_dates = wf["dates"][(wf["dates"] >= window["oos_start"]) & (wf["dates"] <= window["oos_end"])]
+    series = [(pd.Timestamp(d).date(), window["window"], float(by_day.get(d, 0.0))) for d in oos_dates]
+    return row, series
+
+
+# ==============================
+# PROCESS POOL
+# ==============================
+
+_WF = None
+
+
+def _init_worker(wf):
+    global _WF
+    _WF = wf
+
+
+def _run_window_worker(window):
+    return run_window(_WF, window)
+
+
+def run_walk_forward(grid=None, is_days=None, oos_days=None, step=None, workers=None, wf=None):
+    """
+    Window sizes / workers default to the module CONFIG.
+
+    Returns:
+        (windows DataFrame, equity curve DataFrame)
+    """
+    is_days = is_days or IS_DAYS
+    oos_days = oos_days or OOS_DAYS
+    step = step or STEP_DAYS
+    workers = workers or WORKERS
+    started = _time.perf_counter()
+    wf = wf or load_walk_forward_data(grid or DEFAULT_GRID)
+    windows = build_windows(wf["dates"], is_days, oos_days, step)
+    n_configs = len(wf["trade_idx"]) * len(wf["p4"])
+    print(f"🪟 Walk-forward: {len(windows)} windows × {n_configs} configs "
+          f"(IS={is_days}d, OOS={oos_days}d) on {min(workers, max(1, len(windows)))} workers")
+
+    if workers <= 1 or len(windows) <= 1:
+        results = [run_window(wf, w) for w in windows]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(windows)),
+                                 initializer=_init_worker, initargs=(wf,)) as pool:
+            results = list(pool.map(_run_window_worker, windows))
+
+    windows_df = pd.DataFrame([row for row, _ in results])
+    seen = set()
+    series = []
+    for _, s in results:
+        for d, w, pnl in s:
+            if d not in seen:           # overlapping OOS (step < OOS_DAYS): first window wins
+                seen.add(d)
+                series.append((d, w, pnl))
+    equity = pd.DataFrame(series, columns=["Date", "Window", "DailyP&L"])
+    equity["Equity"] = equity["DailyP&L"].cumsum()
+    equity["Drawdown"] = equity["Equity"].clip(lower=0).cummax() - equity["Equity"]
+    print(f"⏱️ Walk-forward finished in {_time.perf_counter() - started:.1f}s")
+    return windows_df, equity
+
+
+def summarize(windows_df, equity, param_cols):
+    daily = equity["DailyP&L"].to_numpy() if len(equity) else np.zeros(0)
+    rows = [
+        ["Windows", len(windows_df)],
+        ["OOS Trading Days", len(daily)],
+        ["OOS Net P&L", round(float(daily.sum()), 2)],
+        ["OOS Max Drawdown", round(param_sweep.max_drawdown(daily), 2)],
+        ["OOS Profitable Days", int((daily > 0).sum())],
+        ["Objective", OBJECTIVE],
+    ]
+    if len(windows_df) and param_cols:
+        chosen = windows_df[param_cols].astype(str).agg(" | ".join, axis=1)
+        rows.append(["Distinct Parameter Sets Chosen", int(chosen.nunique())])
+        rows.append(["Most Frequent Parameter Set", f"{chosen.mode().iloc[0]} ({int((chosen == chosen.mode().iloc[0]).sum())}×)"])
+        for col in param_cols:
+            rows.append([f"Changes in {col}", int((windows_df[col] != windows_df[col].shift()).sum() - 1)])
+    return pd.DataFrame(rows, columns=["Metric", "Value"])
+
+
+def main():
+    grid = None
+    if len(sys.argv) > 1:
+        with open(sys.argv[1]) as f:
+            grid = json.load(f)
+    grid = grid or DEFAULT_GRID
+
+    windows_df, equity = run_walk_forward(grid)
+    param_cols = [c for c in windows_df.columns if c.startswith(("phase3.", "phase4."))]
+    summary = summarize(windows_df, equity, param_cols)
+
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    out = os.path.join(OUTPUT_DIR, f"walk_forward_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx")
+    with pd.ExcelWriter(out, engine="openpyxl") as writer:
+        windows_df.to_excel(writer, sheet_name="Windows", index=False)
+        equity.to_excel(writer, sheet_name="Equity Curve", index=False)
+        summary.to_excel(writer, sheet_name="Summary", index=False)
+
+    print(summary.to_string(index=False))
+    print(f"\n✅ Walk-forward report: {out}")
+
+
+if __name__ == "__main__":
+    main()